@@ -3,18 +3,20 @@ from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score
 
+from paths import find_data_csv
+from profiling import span
+
 # ==========================================
 # 1. Load Data
 # ==========================================
-# Best Practice: Use relative path. 
-# As long as the .csv is in the same folder as this script, this works everywhere.
-file_path = 'melb_data.csv' 
-
+# paths.find_data_csv: current folder first, then the project root and data/,
+# so the script works from any folder (and from src/orchestrate.py).
 try:
+    file_path = find_data_csv()
     data = pd.read_csv(file_path)
     print(f"✅ Dataset Loaded Successfully. Shape: {data.shape}")
 except FileNotFoundError:
-    print("❌ Error: 'melb_data.csv' not found. Make sure it's in the same folder as this script.")
+    print("❌ Error: 'melb_data.csv' not found. Put it in the project root or data/.")
     exit()
 
 # ==========================================
@@ -46,12 +48,14 @@ print(X.head())
 train_X, val_X, train_y, val_y = train_test_split(X, y, random_state=1)
 
 model = LinearRegression()
-model.fit(train_X, train_y)
+with span("fit", rows=len(train_X)):
+    model.fit(train_X, train_y)
 
 # ==========================================
 # 5. Evaluate
 # ==========================================
-val_predictions = model.predict(val_X)
+with span("predict", rows=len(val_X)):
+    val_predictions = model.predict(val_X)
 
 mae = mean_absolute_error(val_y, val_predictions)
 r2 = r2_score(val_y, val_predictions)
@@ -1,14 +1,17 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
-# 变化点 1: 引入 Random Forest
-from sklearn.ensemble import RandomForestRegressor 
 from sklearn.metrics import mean_absolute_error, r2_score
 
+# 变化点 1: 引入 Random Forest (model.make_regressor，默认就是 RandomForestRegressor)
+from model import make_regressor
+from paths import find_data_csv
+from profiling import span
+
 # ==========================================
 # 1. Load Data
 # ==========================================
-file_path = 'melb_data.csv' 
 try:
+    file_path = find_data_csv()
     data = pd.read_csv(file_path)
 except FileNotFoundError:
     print("❌ Error: melb_data.csv not found.")
@@ -39,13 +42,15 @@ print("⏳ Training Random Forest model... (this may take a few seconds)")
 # RandomForestRegressor: 
 # - random_state=1: 保证每次运行结果一样
 # - n_estimators=100: 用 100 棵决策树来投票
-model = RandomForestRegressor(random_state=1, n_estimators=100)
-model.fit(train_X, train_y)
+model = make_regressor()  # 默认 Random Forest；MODEL_BACKEND=hgb 切换到 HistGradientBoosting
+with span("fit", rows=len(train_X)):
+    model.fit(train_X, train_y)
 
 # ==========================================
 # 5. Evaluate
 # ==========================================
-val_predictions = model.predict(val_X)
+with span("predict", rows=len(val_X)):
+    val_predictions = model.predict(val_X)
 
 mae = mean_absolute_error(val_y, val_predictions)
 r2 = r2_score(val_y, val_predictions)
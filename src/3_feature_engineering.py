@@ -1,32 +1,18 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 
-# ==========================================
-# 1. Load Data
-# ==========================================
-data = pd.read_csv('melb_data.csv')
+from features import load_features
+from model import make_regressor
+from profiling import span
 
 # ==========================================
-# 2. Feature Engineering (特征工程 - 核心步骤)
+# 1. Load Data + 2. Feature Engineering (特征工程 - 核心步骤)
 # ==========================================
+# 时间特征 (Year)、房屋状态 (House_Age)、土地价值 (Landsize/BuildingArea 中位数填补)
+# 都在 features.engineer() 里统一完成，结果按 CSV 哈希缓存，避免每个脚本重复解析
 print("⚙️ Processing Features...")
-
-# A. 时间特征 (Time)
-# 房价随年份波动很大，提取年份很重要
-data['Date'] = pd.to_datetime(data['Date'], dayfirst=True)
-data['Year'] = data['Date'].dt.year
-
-# B. 房屋状态 (Condition)
-# 算出房子几岁了。注意：YearBuilt 有空值，用中位数填补
-data['YearBuilt'] = data['YearBuilt'].fillna(data['YearBuilt'].median())
-data['House_Age'] = data['Year'] - data['YearBuilt']
-
-# C. 土地价值 (Land Value) - 最关键的特征！
-# Landsize 和 BuildingArea 也有很多空值，用中位数填补
-data['Landsize'] = data['Landsize'].fillna(data['Landsize'].median())
-data['BuildingArea'] = data['BuildingArea'].fillna(data['BuildingArea'].median())
+data = load_features()
 
 # ==========================================
 # 3. Select Enhanced Features
@@ -55,13 +41,15 @@ X = X.fillna(X.median())
 train_X, val_X, train_y, val_y = train_test_split(X, y, random_state=1)
 
 print("⏳ Training Advanced Model (with 12+ features)...")
-model = RandomForestRegressor(random_state=1, n_estimators=100)
-model.fit(train_X, train_y)
+model = make_regressor()  # 默认 Random Forest；MODEL_BACKEND=hgb 切换到 HistGradientBoosting
+with span("fit", rows=len(train_X)):
+    model.fit(train_X, train_y)
 
 # ==========================================
 # 5. Evaluate
 # ==========================================
-val_predictions = model.predict(val_X)
+with span("predict", rows=len(val_X)):
+    val_predictions = model.predict(val_X)
 mae = mean_absolute_error(val_y, val_predictions)
 r2 = r2_score(val_y, val_predictions)
 
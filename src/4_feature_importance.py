@@ -1,87 +1,50 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold
 
-# ==========================================
-# 1. 准备数据
-# ==========================================
-# 读取数据
-data = pd.read_csv('melb_data.csv')
-
-# --- 特征工程 (保持一致) ---
-data['Date'] = pd.to_datetime(data['Date'], dayfirst=True)
-data['Year'] = data['Date'].dt.year
-data['YearBuilt'] = data['YearBuilt'].fillna(data['YearBuilt'].median())
-data['House_Age'] = data['Year'] - data['YearBuilt']
-data['Landsize'] = data['Landsize'].fillna(data['Landsize'].median())
-data['BuildingArea'] = data['BuildingArea'].fillna(data['BuildingArea'].median())
-
-feature_cols = [
-    'Rooms', 'Type', 'Distance', 'Bedroom2', 'Bathroom', 'Car',
-    'Landsize', 'BuildingArea', 'Year', 'House_Age',
-    'Lattitude', 'Longtitude'
-]
+from features import load_features
+from importance import LOCATION_GROUP, permutation_importance, save_outputs
+from model import FEATURES_FULL, build_pipeline, select_inputs
+from validation import cross_validate
 
 # ==========================================
-# 🛠️ 修复点在这里 (FIXED HERE)
+# 1. 准备数据
 # ==========================================
-# 1. 先把分类变量 (Type) 变成数字 (One-Hot)
-X_temp = pd.get_dummies(data[feature_cols])
-
-# 2. 填充空值时，告诉它只计算数字列的中位数 (numeric_only=True)
-# 这样它就会自动跳过 'Type' 这种文字列，不会报错了
-X = X_temp.fillna(X_temp.median(numeric_only=True))
+# impute=False: 中位数填补在 Pipeline 里做 (见 features.HousingFeatures)
+data = load_features(impute=False)
 
+feature_cols = FEATURES_FULL
+X = select_inputs(data, feature_cols)
 y = data['Price']
 
 # ==========================================
-# 2. 训练模型
+# 2. 复用已缓存的 CV 模型 (不重新训练)
 # ==========================================
-print("⏳ 正在重新训练模型并计算特征重要性...")
-train_X, val_X, train_y, val_y = train_test_split(X, y, random_state=1)
-model = RandomForestRegressor(random_state=1, n_estimators=100)
-model.fit(train_X, train_y)
+# 和 6_rigorous_validation.py 同样的 Pipeline + 同样的 5-Fold 切分，
+# 所以跑过第 6 步之后，这里直接从 output/cache/cv/ 读取 fold 模型
+pipeline = build_pipeline(feature_cols)
+cv = KFold(n_splits=5, shuffle=True, random_state=1)
+result = cross_validate(pipeline, X, y, cv=cv, n_jobs=-1)
+print(f"⏳ CV folds: {len(result.r2) - result.n_cached} fitted, {result.n_cached} loaded from cache")
 
 # ==========================================
-# 3. 核心：提取特征重要性
+# 3. 核心：Permutation Importance (在验证集上打乱特征，看 R² 掉多少)
 # ==========================================
-importances = model.feature_importances_
-feature_names = train_X.columns
-
-# 整理表格
-feature_df = pd.DataFrame({
-    'Feature': feature_names,
-    'Importance': importances
-}).sort_values(by='Importance', ascending=False)
+# 为什么不用 feature_importances_？它偏向连续、取值多的列 (比如经纬度)。
+# Type 的 One-Hot 列一起打乱；经纬度另外作为一个整体 (Lat/Long) 再打乱一次。
+# 结果按 fold 模型缓存，第二次运行直接读取。
+print("⏳ 正在计算 Permutation Importance...")
+feature_df = permutation_importance(result, X, y, groups=LOCATION_GROUP, n_repeats=5, n_jobs=-1)
 
 # 打印前 10 名
 print("\n" + "="*40)
-print("🏆 TOP 10 核心定价因素 (Feature Importance)")
+print("🏆 TOP 10 核心定价因素 (Permutation Importance)")
 print("="*40)
-print(feature_df.head(10))
-
-# ==========================================
-# 4. 可视化
-# ==========================================
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Importance', y='Feature', data=feature_df, palette='viridis')
-
-plt.title('What Drives Melbourne House Prices? (Random Forest)')
-plt.xlabel('Importance Score')
-plt.ylabel('Features')
-plt.tight_layout()
+print(feature_df[['Feature', 'R2_Drop', 'R2_Drop_Std', 'MAE_Increase']].head(10).to_string(index=False))
 
 # ==========================================
-# 💾 保存图片 (Save Figure)
+# 4. 可视化 + 💾 保存 (表格 + 图片)
 # ==========================================
-# dpi=300 表示高清格式，bbox_inches='tight' 保证边缘不被切掉
-filename = 'feature_importance.png'
-plt.savefig(filename, dpi=300, bbox_inches='tight')
-
-print(f"\n✅ 图片已成功保存为: {filename}")
-print("你可以去左侧文件列表里点开它看看！")
+# 图片保存到 output/images/feature_importance.png (dashboard 读取这个文件)
+table_path, image_path = save_outputs(feature_df)
 
-# 如果你还想弹窗看，这行可以留着，不想看就注释掉
-# plt.show()
\ No newline at end of file
+print(f"\n✅ 表格已保存为: {table_path}")
+print(f"✅ 图片已成功保存为: {image_path}")
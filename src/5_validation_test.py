@@ -1,10 +1,13 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 
+from model import make_regressor
+from paths import find_data_csv
+from profiling import span
+
 # 1. Load Data
-data = pd.read_csv('melb_data.csv')
+data = pd.read_csv(find_data_csv())
 
 # ==========================================
 # 🧪 实验设计：故意不给“高级特征”
@@ -25,11 +28,13 @@ y = data['Price']
 
 # 2. Train Model
 train_X, val_X, train_y, val_y = train_test_split(X, y, random_state=1)
-model = RandomForestRegressor(random_state=1, n_estimators=100)
-model.fit(train_X, train_y)
+model = make_regressor()  # 默认 Random Forest；MODEL_BACKEND=hgb 切换到 HistGradientBoosting
+with span("fit", rows=len(train_X)):
+    model.fit(train_X, train_y)
 
 # 3. Evaluate
-val_predictions = model.predict(val_X)
+with span("predict", rows=len(val_X)):
+    val_predictions = model.predict(val_X)
 r2 = r2_score(val_y, val_predictions)
 
 print("\n" + "="*40)
@@ -1,52 +1,27 @@
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import KFold, cross_val_score
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.model_selection import KFold
+
+from features import load_features
+from model import FEATURES_FULL, build_pipeline, select_inputs
+from shared_train import supports_shared
+from validation import cross_validate
 
 # =========================
 # 1. 准备数据 (Standard Setup)
 # =========================
-df = pd.read_csv('melb_data.csv')
-
-# 特征工程复现
-df['Date'] = pd.to_datetime(df['Date'], dayfirst=True)
-df['Year'] = df['Date'].dt.year
-df['YearBuilt'] = pd.to_numeric(df['YearBuilt'], errors='coerce').fillna(df['YearBuilt'].median())
-df['House_Age'] = df['Year'] - df['YearBuilt']
-df['Landsize'] = df['Landsize'].fillna(df['Landsize'].median())
-df['BuildingArea'] = df['BuildingArea'].fillna(df['BuildingArea'].median())
+# impute=False: 只解析 Date/类型，不在全量数据上算中位数 (否则会泄露到各个 fold)
+df = load_features(impute=False)
 
 # 你的所有特征
-features = [
-    'Rooms', 'Type', 'Distance', 'Bedroom2', 'Bathroom', 'Car',
-    'Landsize', 'BuildingArea', 'Year', 'House_Age',
-    'Lattitude', 'Longtitude'
-]
-X = df[features]
+features = FEATURES_FULL
+X = select_inputs(df, features)
 y = df['Price']
 
 # =========================
 # 2. 构建 Pipeline (必须用 Pipeline 防止数据泄露)
 # =========================
 # 只有在 Cross Validation 内部做填充(Impute)，才是真正严谨的
-numeric_cols = [c for c in X.columns if c != 'Type']
-categorical_cols = ['Type']
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', SimpleImputer(strategy='median'), numeric_cols),
-        ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols)
-    ])
-
-# 模型管道
-pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('model', RandomForestRegressor(n_estimators=100, random_state=1))
-])
+# HousingFeatures (Year / House_Age / 中位数填补) + One-Hot + Random Forest，见 model.build_pipeline
+pipeline = build_pipeline(features)
 
 # =========================
 # 3. 核心：5-Fold Cross Validation
@@ -57,11 +32,12 @@ cv = KFold(n_splits=5, shuffle=True, random_state=1)
 
 print("⏳ Running 5-Fold Cross Validation (这可能需要一分钟)...")
 
-# scoring='r2' 计算 R方
-scores = cross_val_score(pipeline, X, y, cv=cv, scoring='r2')
-
-# 同时计算 MAE (负数是因为 sklearn 的逻辑是 "得分越高越好"，MAE是越低越好，所以是负的)
-mae_scores = -cross_val_score(pipeline, X, y, cv=cv, scoring='neg_mean_absolute_error')
+# 每个 fold 只训练一次，R² 和 MAE 都从同一次拟合里算出来；
+# folds 并行跑，拟合结果按 (数据哈希, Pipeline 参数, fold) 缓存到 output/cache/cv/
+result = cross_validate(pipeline, X, y, cv=cv, n_jobs=-1, shared=supports_shared(pipeline))
+scores = result.r2
+mae_scores = result.mae
+print(f"   ({len(scores) - result.n_cached} folds fitted, {result.n_cached} loaded from cache)")
 
 # =========================
 # 4. 最终审判 (Final Verdict)
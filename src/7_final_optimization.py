@@ -1,26 +1,20 @@
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import joblib  # 用于保存模型
-from sklearn.model_selection import KFold, cross_val_score, cross_val_predict
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.model_selection import KFold
 
+from artifact import save_artifact
+from features import file_hash, load_features
+from model import FEATURES_SLIM, build_pipeline, select_inputs
+from paths import MODEL_DIR, OUTPUT_IMG_DIR, find_data_csv
+from profiling import span
+from shared_train import supports_shared
+from validation import cross_validate
 
-# 1. 准备数据
-df = pd.read_csv('melb_data.csv')
 
-# 特征工程 (保持不变)
-df['Date'] = pd.to_datetime(df['Date'], dayfirst=True)
-df['Year'] = df['Date'].dt.year
-df['YearBuilt'] = pd.to_numeric(df['YearBuilt'], errors='coerce').fillna(df['YearBuilt'].median())
-df['House_Age'] = df['Year'] - df['YearBuilt']
-df['Landsize'] = df['Landsize'].fillna(df['Landsize'].median())
-df['BuildingArea'] = df['BuildingArea'].fillna(df['BuildingArea'].median())
+# 1. 准备数据
+# impute=False: 中位数填补交给 Pipeline，避免在 CV 之前泄露
+df = load_features(impute=False)
 
 # ==========================================
 # ✂️ 瘦身时刻 (Feature Selection)
@@ -28,42 +22,28 @@ df['BuildingArea'] = df['BuildingArea'].fillna(df['BuildingArea'].median())
 # 之前的全量特征：
 # features_full = ['Rooms', 'Type', 'Distance', 'Bedroom2', 'Bathroom', 'Car', 'Landsize', 'BuildingArea', 'Year', 'House_Age', 'Lattitude', 'Longtitude']
 
-# ✅ 精简后的“特种部队” (只留 Top 8)：
-features_slim = [
-    'Lattitude', 'Longtitude',  # 核心地段
-    'Rooms',                    # 核心大小
-    'Distance',                 # 核心位置
-    'Landsize', 'BuildingArea', # 核心资产价值
-    'Type',                     # 核心房型 (Pipeline 会自动转 One-Hot，生成 Type_u 等)
-    'Bathroom',                 # 核心配置 (富人区通常厕所多)
-    'House_Age'                 # 核心折旧
-]
+# ✅ 精简后的“特种部队” (只留 Top 8，定义见 model.FEATURES_SLIM)：
+# 核心地段 Lattitude/Longtitude、核心大小 Rooms、核心位置 Distance、
+# 核心资产价值 Landsize/BuildingArea、核心房型 Type (Pipeline 会自动转 One-Hot)、
+# 核心配置 Bathroom、核心折旧 House_Age
+features_slim = FEATURES_SLIM
 
 # ❌ 删掉了：Bedroom2, Car, Year (注意：Type 会自动处理，不用手动删 Type_h)
 
-X = df[features_slim]
+# House_Age 在 Pipeline 内部由 Date/YearBuilt 计算，所以这里传入的是原始列
+X = select_inputs(df, features_slim)
 y = df['Price']
 
-# 2. Pipeline (保持不变)
-numeric_cols = [c for c in X.columns if c != 'Type']
-categorical_cols = ['Type']
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', SimpleImputer(strategy='median'), numeric_cols),
-        ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_cols)
-    ])
-
-pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('model', RandomForestRegressor(n_estimators=100, random_state=1))
-])
+# 2. Pipeline (填补 + One-Hot + Random Forest，中位数只在训练数据上学习)
+pipeline = build_pipeline(features_slim)
 
 # 3. 验证瘦身结果
 cv = KFold(n_splits=5, shuffle=True, random_state=1)
 print(f"⏳ Testing Slim Model with {len(features_slim)} features...")
 
-scores = cross_val_score(pipeline, X, y, cv=cv, scoring='r2')
+# 一次 CV 同时拿到 R² 和 out-of-fold 预测 (之前要跑 cross_val_score + cross_val_predict 两遍)
+result = cross_validate(pipeline, X, y, cv=cv, n_jobs=-1, shared=supports_shared(pipeline))
+scores = result.r2
 
 print("\n" + "="*40)
 print("🚀 FINAL SLIM MODEL RESULTS")
@@ -81,8 +61,8 @@ print("="*40)
 # ==========================================
 print("🎨 Generating Prediction vs Actual plot...")
 
-# 关键修复点：这里计算了 y_pred，你的报错就是因为缺了这一行！
-y_pred = cross_val_predict(pipeline, X, y, cv=cv)
+# 关键修复点：这里需要 y_pred —— 直接用上面 CV 的 out-of-fold 预测，不用再训练一遍
+y_pred = result.oof_pred
 
 plt.figure(figsize=(8, 8))
 plt.scatter(y, y_pred, alpha=0.3, color='blue')
@@ -91,9 +71,12 @@ plt.plot([y.min(), y.max()], [y.min(), y.max()], 'r--', lw=2)
 plt.xlabel('Actual Price (真实价格)')
 plt.ylabel('Predicted Price (预测价格)')
 plt.title('Truth vs. Prediction')
-# 保存图片
-plt.savefig('prediction_scatter.png')
-print("✅ Plot saved as 'prediction_scatter.png'")
+# 保存图片 (output/images/，和 README 里引用的是同一张)
+OUTPUT_IMG_DIR.mkdir(parents=True, exist_ok=True)
+scatter_path = OUTPUT_IMG_DIR / 'prediction_scatter.png'
+with span("render"):
+    plt.savefig(scatter_path)
+print(f"✅ Plot saved as '{scatter_path}'")
 # plt.show() # 如果不想弹窗，就保持注释状态
 
 # ==========================================
@@ -103,12 +86,22 @@ if scores.mean() >= 0.795:
     print("\n📦 Performance is good. Retraining on 100% data...")
     
     # 用全部数据重新训练
-    pipeline.fit(X, y)
+    with span("fit", rows=len(X)):
+        pipeline.fit(X, y)
     
-    # 保存文件
-    model_filename = 'melbourne_housing_model.pkl'
+    # 保存文件 (output/models/，predict.py 默认从这里加载)
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    model_filename = MODEL_DIR / 'melbourne_housing_model.pkl'
     joblib.dump(pipeline, model_filename)
     
     print(f"✅ Model saved successfully as: {model_filename}")
+
+    # 同时写一份版本化的模型目录 (manifest + 可 mmap 的树数组)，多个打分进程共享同一份内存
+    artifact_dir = save_artifact(
+        pipeline,
+        metrics={"cv_r2_mean": scores.mean(), "cv_r2_std": scores.std(), "cv_mae_mean": result.mae.mean()},
+        data_hash=file_hash(find_data_csv()),
+    )
+    print(f"✅ Model artifact saved as: {artifact_dir}")
 else:
     print("❌ Performance not good enough. Model not saved.")
\ No newline at end of file
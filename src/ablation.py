@@ -0,0 +1,157 @@
+"""
+Declarative ablation runner: compare named feature subsets on identical CV splits.
+
+Every subset is a list of model features. The union of all subsets is
+preprocessed once per fold (imputation/encoding fitted on that fold's training
+rows), and each variant takes its columns from that shared matrix. The
+features a variant sees are the same as if its subset were preprocessed
+separately, because medians and one-hot columns are per feature; only their
+column order differs (spec order here, numeric block then one-hot in
+build_pipeline), which changes the forest's feature-sampling draws. Scores
+therefore agree with separate pipelines statistically, not bit for bit.
+All (variant, fold) fits then run concurrently.
+
+Usage:
+    python src/ablation.py
+    python src/ablation.py --only baseline slim --folds 3
+    python src/ablation.py --spec my_ablations.json      # {"name": ["Rooms", "Type", ...], ...}
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold
+
+from features import load_features
+from importance import encoded_groups
+from model import BACKENDS, CATEGORICAL_FEATURES, DEFAULT_BACKEND
+from model import FEATURES_FULL, FEATURES_GEO, FEATURES_SLIM
+from model import build_preprocessor, make_regressor, select_inputs
+from paths import REPORT_DIR
+
+# The hand-written experiments of scripts 1/2, 5, 7 and 6, plus the nearby-sales features
+ABLATIONS = {
+    "baseline": ["Rooms", "Type", "Distance"],
+    "no_location": ["Rooms", "Type", "Distance", "Bedroom2", "Bathroom", "Car"],
+    "slim": FEATURES_SLIM,
+    "full": FEATURES_FULL,
+    "geo": FEATURES_GEO,
+}
+
+
+def union_features(spec):
+    return list(dict.fromkeys(f for features in spec.values() for f in features))
+
+
+def _dense(matrix):
+    return matrix.toarray() if hasattr(matrix, "toarray") else matrix
+
+
+def prepare_folds(X, y, features, n_splits, backend, seed=1):
+    """Preprocess the union of all features once per fold."""
+    folds = []
+    for train_idx, val_idx in KFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X):
+        pre = build_preprocessor(features, backend)
+        # fit_transform with y, as Pipeline.fit does (target-aware transformers see y)
+        X_train = pre.fit_transform(X.iloc[train_idx], y.iloc[train_idx])
+        folds.append({
+            "X_train": _dense(X_train),
+            "y_train": y.iloc[train_idx].to_numpy(),
+            "X_val": _dense(pre.transform(X.iloc[val_idx])),
+            "y_val": y.iloc[val_idx].to_numpy(),
+        })
+    return folds, encoded_groups(pre)
+
+
+def fit_variant(fold, columns, backend, categorical_mask, n_estimators):
+    params = {"categorical_features": categorical_mask} if backend == "hgb" else {}
+    model = make_regressor(backend, n_estimators=n_estimators, **params)
+    start = time.perf_counter()
+    model.fit(fold["X_train"][:, columns], fold["y_train"])
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    pred = model.predict(fold["X_val"][:, columns])
+    predict_seconds = time.perf_counter() - start
+    return (r2_score(fold["y_val"], pred), mean_absolute_error(fold["y_val"], pred),
+            fit_seconds, predict_seconds)
+
+
+def run_ablation(spec, n_splits=5, backend=None, n_estimators=100, n_jobs=-1):
+    backend = backend or DEFAULT_BACKEND
+    features = union_features(spec)
+    df = load_features(impute=False)
+    X, y = select_inputs(df, features), df["Price"]
+
+    start = time.perf_counter()
+    folds, groups = prepare_folds(X, y, features, n_splits, backend)
+    prep_seconds = time.perf_counter() - start
+
+    tasks = []
+    for name, subset in spec.items():
+        columns = [j for f in subset for j in groups[f]]
+        mask = [f in CATEGORICAL_FEATURES for f in subset for _ in groups[f]]
+        tasks += [(name, delayed(fit_variant)(fold, columns, backend, mask, n_estimators)) for fold in folds]
+
+    # Threads: tree building releases the GIL and every task reads the same fold arrays
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(task for _, task in tasks)
+
+    rows = {}
+    for (name, _), res in zip(tasks, results):
+        rows.setdefault(name, []).append(res)
+    table = pd.DataFrame([
+        {
+            "variant": name,
+            "n_features": len(spec[name]),
+            "r2": np.mean([r[0] for r in res]),
+            "r2_std": np.std([r[0] for r in res]),
+            "mae": np.mean([r[1] for r in res]),
+            "fit_s": np.sum([r[2] for r in res]),
+            "predict_s": np.sum([r[3] for r in res]),
+        }
+        for name, res in rows.items()
+    ])
+    return table, prep_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run feature-subset ablations on shared CV folds.")
+    parser.add_argument("--spec", help="JSON file mapping variant name -> feature list (default: built-in)")
+    parser.add_argument("--only", nargs="+", help="Run only these variants")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=-1)
+    args = parser.parse_args(argv)
+
+    spec = ABLATIONS
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    if args.only:
+        spec = {name: spec[name] for name in args.only}
+
+    start = time.perf_counter()
+    table, prep_seconds = run_ablation(spec, args.folds, args.backend, args.trees, args.jobs)
+    wall = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print(f"🧪 ABLATION RESULTS ({args.folds}-fold CV, {args.backend})")
+    print("=" * 40)
+    print(table.to_string(index=False, formatters={
+        "r2": "{:.4f}".format, "r2_std": "{:.4f}".format, "mae": "${:,.0f}".format,
+        "fit_s": "{:.1f}".format, "predict_s": "{:.2f}".format,
+    }))
+    print(f"\nShared preprocessing: {prep_seconds:.1f}s | wall time: {wall:.1f}s")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = REPORT_DIR / "ablation.csv"
+    table.to_csv(out_path, index=False)
+    print(f"✅ Saved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Versioned model artifacts: a directory with a JSON manifest and the forest's
+node arrays as plain .npy files.
+
+    output/models/artifacts/
+    ├── LATEST                        # name of the current version
+    └── 20261017T120000-1a2b3c4d/
+        ├── manifest.json             # features, category levels, medians, derived columns, CV scores, data hash, files
+        ├── preprocessor.joblib       # fitted ColumnTransformer (small)
+        ├── nodes.npy, value.npy, roots.npy, bin_edges.npy, bin_offsets.npy
+        └── cover.npy                 # node covers, read only by explain.py (load_covers)
+
+The forest is stored in the flat layout of forest_engine.FlatForest and
+loaded with np.load(mmap_mode='r'), so the node arrays are never copied:
+every scoring worker maps the same pages from the page cache and only the
+small preprocessor is unpickled per process. (A pickled sklearn forest
+cannot be shared this way: each Tree copies its arrays into private memory
+when it is unpickled.)
+
+With compress=True the arrays go into one compressed forest.npz instead
+(smaller on disk, but loaded into private memory). Non-forest pipelines are
+stored as a single pipeline.joblib.
+
+predict.py and serve.py accept an artifact directory wherever they accept
+a .pkl path.
+
+Usage:
+    python src/artifact.py save                      # from output/models/melbourne_housing_model.pkl
+    python src/artifact.py save --compress
+    python src/artifact.py show
+    python src/artifact.py bench --workers 4         # load time + per-worker memory vs the pickle
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+
+from features import file_hash
+from forest_engine import CompiledPipeline, FlatForest, node_covers, pack_nodes, sample_inputs, verify
+from geo_features import GEO_FEATURES
+from paths import MODEL_DIR
+from predict import DEFAULT_MODEL
+
+try:
+    import psutil
+except ImportError:  # optional: bench then reports RSS only
+    psutil = None
+
+ARTIFACT_DIR = MODEL_DIR / "artifacts"
+FORMAT_VERSION = 2      # 2: packed nodes.npy instead of feature/split_bin/children
+MANIFEST = "manifest.json"
+LATEST = "LATEST"
+FOREST_ARRAYS = ["nodes", "value", "roots", "bin_edges", "bin_offsets"]
+COVER_ARRAY = "cover"
+
+
+# =========================
+# Manifest
+# =========================
+def _json_value(v):
+    if isinstance(v, float) and np.isnan(v):
+        return None
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def describe(pipeline):
+    """Manifest fields read off the fitted Pipeline."""
+    pre, model = pipeline.named_steps["preprocessor"], pipeline.named_steps["model"]
+    features, levels, medians, derived = [], {}, {}, []
+    for name, transformer, columns in pre.transformers_:
+        if name == "num":
+            features += list(transformer.columns)
+            # House_Age is recomputed as Year - YearBuilt wherever it is missing: its
+            # "median" is a placeholder that is never used, so it is listed as derived
+            derived = ["House_Age"]
+            if hasattr(transformer, "medians_"):
+                _, layout = transformer._block(pd.DataFrame())
+                medians = {c: float(m) for c, m in zip(layout, transformer.medians_) if c not in derived}
+        elif name == "geo":
+            features += list(transformer.columns or GEO_FEATURES)
+        elif name == "cat":
+            features += list(columns)
+            levels = {c: [_json_value(v) for v in cats] for c, cats in zip(columns, transformer.categories_)}
+    return {
+        "backend": "forest" if isinstance(model, RandomForestRegressor) else "hgb",
+        "estimator": type(model).__name__,
+        "params": {k: _json_value(v) for k, v in model.get_params().items()},
+        "features": features,
+        "input_columns": list(pipeline.feature_names_in_),
+        "category_levels": levels,
+        "medians": medians,
+        "derived": derived,
+    }
+
+
+def read_manifest(path):
+    return json.loads((Path(path) / MANIFEST).read_text())
+
+
+def resolve(path=ARTIFACT_DIR):
+    """Version directory for `path`: itself, or the LATEST version of an artifact root."""
+    path = Path(path)
+    if (path / LATEST).exists():
+        return path / (path / LATEST).read_text().strip()
+    return path
+
+
+# =========================
+# Save / load
+# =========================
+def _forest_arrays(forest):
+    flat = FlatForest.from_forest(forest)
+    lengths = [len(e) for e in flat.bin_edges]
+    arrays = {name: getattr(flat, name) for name in ["nodes", "value", "roots"]}
+    arrays["bin_edges"] = np.concatenate(flat.bin_edges)
+    arrays["bin_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    arrays[COVER_ARRAY] = node_covers(forest)
+    return arrays, {"n_trees": flat.n_trees, "n_nodes": len(flat.value), "max_depth": int(flat.max_depth)}
+
+
+def save_artifact(pipeline, root=ARTIFACT_DIR, compress=False, metrics=None, data_hash=None, check_rows=2000):
+    """
+    Write `pipeline` as a new version under `root` and point LATEST at it.
+    Forest artifacts are reloaded and checked against the pipeline before
+    they are published. Returns the version directory.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp_dir = root / f".tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+
+    created = datetime.now()
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created": created.isoformat(timespec="seconds"),
+        "compressed": bool(compress),
+        "data_hash": data_hash,
+        "metrics": metrics or {},
+        "versions": {"python": sys.version.split()[0], "numpy": np.__version__, "sklearn": sklearn.__version__},
+        **describe(pipeline),
+    }
+    model = pipeline.named_steps["model"]
+    if isinstance(model, RandomForestRegressor):
+        manifest["engine"] = "flat_forest"
+        arrays, manifest["forest"] = _forest_arrays(model)
+        joblib.dump(pipeline.named_steps["preprocessor"], tmp_dir / "preprocessor.joblib", compress=3 if compress else 0)
+        if compress:
+            np.savez_compressed(tmp_dir / "forest.npz", **arrays)
+        else:
+            for name, array in arrays.items():
+                np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(array))
+        manifest["arrays"] = {name: {"dtype": str(a.dtype), "shape": list(a.shape)} for name, a in arrays.items()}
+    else:
+        # Boosted models have no flat layout: one pickle, loaded into private memory
+        manifest["engine"] = "pipeline"
+        joblib.dump(pipeline, tmp_dir / "pipeline.joblib", compress=3 if compress else 0)
+
+    manifest["files"] = {
+        p.name: {"bytes": p.stat().st_size, "blake2b": file_hash(p)} for p in sorted(tmp_dir.iterdir())
+    }
+    digest = hashlib.blake2b(json.dumps(manifest["files"], sort_keys=True).encode(), digest_size=4).hexdigest()
+    manifest["version"] = f"{created:%Y%m%dT%H%M%S}-{digest}"
+    (tmp_dir / MANIFEST).write_text(json.dumps(manifest, indent=2, default=str))
+
+    try:
+        if manifest["engine"] == "flat_forest" and check_rows:
+            # Never publish an artifact that disagrees with the model it was written from
+            verify(pipeline, load_artifact(tmp_dir), sample_inputs(pipeline, check_rows))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    version_dir = root / manifest["version"]
+    os.replace(tmp_dir, version_dir)
+    tmp_latest = root / f"{LATEST}.tmp{os.getpid()}"
+    tmp_latest.write_text(manifest["version"])
+    os.replace(tmp_latest, root / LATEST)
+    return version_dir
+
+
+def load_artifact(path=ARTIFACT_DIR, mmap=True):
+    """
+    Model stored at `path` (a version directory, or an artifact root whose
+    LATEST is used). Forest artifacts come back as a CompiledPipeline whose
+    node arrays are read-only memory maps (unless compressed or mmap=False).
+    """
+    path = resolve(path)
+    manifest = read_manifest(path)
+    if manifest["format_version"] > FORMAT_VERSION:
+        raise ValueError(f"{path} has artifact format {manifest['format_version']}; "
+                         f"this code reads up to {FORMAT_VERSION}")
+    if manifest["engine"] == "pipeline":
+        return joblib.load(path / "pipeline.joblib")
+
+    if "nodes" in manifest["arrays"]:
+        arrays = _load_arrays(path, manifest, FOREST_ARRAYS, mmap)
+    else:
+        # Format 1 stored the node columns separately: pack them (a private copy)
+        arrays = _load_arrays(path, manifest, FOREST_ARRAYS[1:] + ["children", "feature", "split_bin"], mmap)
+        arrays["nodes"] = pack_nodes(*(arrays.pop(name) for name in ["children", "feature", "split_bin"]))
+    forest = FlatForest(
+        arrays["nodes"], arrays["value"], arrays["roots"],
+        np.split(arrays["bin_edges"], arrays["bin_offsets"][1:-1]),
+        max_depth=manifest["forest"]["max_depth"],
+    )
+    return CompiledPipeline(joblib.load(path / "preprocessor.joblib"), forest)
+
+
+def load_covers(path=ARTIFACT_DIR, mmap=True):
+    """Node covers of a forest artifact (for explain.py), or None if it has none."""
+    path = resolve(path)
+    manifest = read_manifest(path)
+    if manifest["engine"] != "flat_forest" or COVER_ARRAY not in manifest["arrays"]:
+        return None
+    return _load_arrays(path, manifest, [COVER_ARRAY], mmap)[COVER_ARRAY]
+
+
+def _load_arrays(path, manifest, names, mmap):
+    if manifest["compressed"]:
+        with np.load(path / "forest.npz") as npz:
+            return {name: npz[name] for name in names}
+    return {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in names}
+
+
+# =========================
+# Load / memory benchmark
+# =========================
+def _bench_worker(path, X, barrier, results):
+    start = time.perf_counter()
+    model = load_artifact(path) if Path(path).is_dir() else joblib.load(path)
+    load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    model.predict(X)
+    predict_s = time.perf_counter() - start
+    # Measure while every worker is alive, so shared pages are split between them
+    barrier.wait()
+    record = {"load_s": load_s, "predict_s": predict_s}
+    if psutil is not None:
+        mem = psutil.Process().memory_full_info()
+        record.update(rss_mb=mem.rss / 1e6, uss_mb=mem.uss / 1e6, pss_mb=getattr(mem, "pss", np.nan) / 1e6)
+    results.put(record)
+    barrier.wait()
+
+
+def bench_workers(path, X, n_workers):
+    """Per-worker load time, predict time and memory for n_workers processes loading `path`."""
+    ctx = mp.get_context("spawn")
+    barrier, results = ctx.Barrier(n_workers), ctx.Queue()
+    procs = [ctx.Process(target=_bench_worker, args=(str(path), X, barrier, results)) for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    records = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return pd.DataFrame(records)
+
+
+def bench(model_path=DEFAULT_MODEL, n_workers=4, n_rows=1000):
+    pipeline = joblib.load(model_path)
+    X = sample_inputs(pipeline, n_rows)
+    sources = {"pickle": Path(model_path)}
+    # Scratch artifacts on the same disk as the real ones
+    with tempfile.TemporaryDirectory(prefix=".bench", dir=MODEL_DIR) as tmp:
+        tmp = Path(tmp)
+        sources["artifact (mmap)"] = save_artifact(pipeline, tmp / "plain")
+        sources["artifact (compressed)"] = save_artifact(pipeline, tmp / "packed", compress=True)
+        del pipeline
+
+        rows = []
+        for name, path in sources.items():
+            size = sum(p.stat().st_size for p in Path(path).iterdir()) if Path(path).is_dir() else path.stat().st_size
+            stats = bench_workers(path, X, n_workers)
+            rows.append({"format": name, "disk_mb": size / 1e6, **stats.mean().to_dict(),
+                         "total_pss_mb": stats["pss_mb"].sum() if "pss_mb" in stats else np.nan})
+
+    print("\n" + "=" * 40)
+    print(f"📦 MODEL LOADING ({n_workers} workers, {n_rows:,}-row predict each; per-worker means)")
+    print("=" * 40)
+    print(pd.DataFrame(rows).set_index("format").to_string(float_format=lambda v: f"{v:.2f}"))
+
+
+def show(path=ARTIFACT_DIR):
+    path = resolve(path)
+    manifest = read_manifest(path)
+    print("\n" + "=" * 40)
+    print(f"📦 MODEL ARTIFACT {manifest['version']}")
+    print("=" * 40)
+    print(f"Path        : {path}")
+    print(f"Created     : {manifest['created']} (format {manifest['format_version']}, "
+          f"{'compressed' if manifest['compressed'] else 'mmap'})")
+    print(f"Model       : {manifest['estimator']} ({manifest['engine']})")
+    print(f"Features    : {', '.join(manifest['features'])}")
+    print(f"Data hash   : {manifest['data_hash']}")
+    for key, value in manifest["metrics"].items():
+        print(f"{key:<12}: {value:.4f}")
+    print(f"Files       : {sum(f['bytes'] for f in manifest['files'].values()) / 1e6:.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write, inspect and benchmark versioned model artifacts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_save = sub.add_parser("save", help="Write a new artifact version from a pickled Pipeline")
+    p_save.add_argument("--model", type=Path, default=DEFAULT_MODEL)
+    p_save.add_argument("--root", type=Path, default=ARTIFACT_DIR)
+    p_save.add_argument("--compress", action="store_true", help="Compressed arrays (smaller, no mmap)")
+    p_show = sub.add_parser("show", help="Print the manifest of an artifact (default: latest)")
+    p_show.add_argument("path", type=Path, nargs="?", default=ARTIFACT_DIR)
+    p_bench = sub.add_parser("bench", help="Compare load time / per-worker memory against the pickle")
+    p_bench.add_argument("--model", type=Path, default=DEFAULT_MODEL)
+    p_bench.add_argument("--workers", type=int, default=4)
+    p_bench.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if args.command == "save":
+        version_dir = save_artifact(joblib.load(args.model), args.root, compress=args.compress)
+        print(f"✅ Saved {version_dir}")
+        show(version_dir)
+    elif args.command == "show":
+        show(args.path)
+    else:
+        bench(args.model, args.workers, args.rows)
+
+
+if __name__ == "__main__":
+    main()
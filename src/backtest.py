@@ -0,0 +1,251 @@
+"""
+Rolling-origin backtest over sale months.
+
+Shuffled KFold lets the model see sales from the months it is scored on, so
+it measures interpolation. Here every window has an origin month m: the model
+is trained on sales before m and scored on month m + horizon - 1, for every
+origin after the first --min-train-months months of history.
+
+Forest windows are built incrementally. Each origin m gets one block of
+--block-trees trees fitted on all sales before m. The forest for origin m is
+that block plus the blocks of the preceding origins, ceil(--trees /
+--block-trees) blocks in all. This is a sliding window of trees, so stale
+trees retire. Blocks are not split, so when --trees is not a multiple of
+--block-trees every full window is rounded up to the next multiple (the
+"trees" column of the report shows the count actually used). A
+forest's trees do not depend on each other, so the blocks are fitted in
+parallel, and each block is cached on disk keyed by its training rows. When
+a new month of sales arrives, only its block is fitted; every earlier block
+is reused. Each block carries its own fitted preprocessor, and a window
+predicts with the tree-weighted mean of its blocks.
+
+--refit fits every window from scratch instead, through
+validation.cross_validate. This works on either backend (hgb has no tree
+blocks), and is also the reference the incremental engine is checked
+against.
+
+Output: per-period MAE / R² in output/reports/backtest.csv and a drift plot
+in output/images/backtest_drift.png.
+
+Usage:
+    python src/backtest.py
+    python src/backtest.py --features full --block-trees 20 --horizon 2
+    python src/backtest.py --refit --backend hgb
+"""
+import argparse
+import os
+import time
+
+import joblib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from features import load_features
+from model import BACKENDS, DEFAULT_BACKEND, FEATURE_SETS, build_pipeline, select_inputs
+from paths import CACHE_DIR, OUTPUT_IMG_DIR, REPORT_DIR
+from profiling import span, timed
+from validation import cross_validate, data_hash
+
+BACKTEST_CACHE_DIR = CACHE_DIR / "backtest"
+RESULTS_PATH = REPORT_DIR / "backtest.csv"
+PLOT_PATH = OUTPUT_IMG_DIR / "backtest_drift.png"
+
+
+# =========================
+# Splits
+# =========================
+def rolling_origin_windows(dates, min_train_months=6, horizon=1, min_test_rows=30):
+    """
+    One window per origin month: (origin, test month, train_idx, test_idx).
+    Train is every sale before the origin and test is the sales of month
+    origin + horizon - 1. Test months with fewer than min_test_rows sales
+    are skipped.
+    """
+    months = pd.PeriodIndex(pd.to_datetime(dates), freq="M")
+    present = months.unique().sort_values()
+    windows = []
+    for origin in present[min_train_months:]:
+        test_month = origin + (horizon - 1)
+        test_idx = np.flatnonzero(months == test_month)
+        if len(test_idx) < min_test_rows:
+            continue
+        windows.append((origin, test_month, np.flatnonzero(months < origin), test_idx))
+    return windows
+
+
+class RollingOriginSplit:
+    """Windows from rolling_origin_windows() as a CV splitter (split() yields train/test indices)."""
+
+    def __init__(self, windows):
+        self.windows = windows
+
+    def split(self, X=None, y=None, groups=None):
+        for _, _, train_idx, test_idx in self.windows:
+            yield train_idx, test_idx
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return len(self.windows)
+
+
+# =========================
+# Incremental forest engine
+# =========================
+def _fit_block(pipeline, X, y, train_idx, eval_idx, n_trees, seed, path):
+    """
+    Fit (or load) one block of trees on train_idx and predict eval_idx.
+    Only the predictions travel back to the parent; the model stays on disk.
+    """
+    if path.exists():
+        model, cached = joblib.load(path), True
+    else:
+        model = clone(pipeline).set_params(model__n_estimators=n_trees, model__random_state=seed)
+        with span("fit", rows=len(train_idx), trees=n_trees):
+            model.fit(X.iloc[train_idx], y.iloc[train_idx])
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+        cached = False
+    with span("predict", rows=len(eval_idx)):
+        return model.predict(X.iloc[eval_idx]), cached
+
+
+@timed("backtest_incremental")
+def incremental_backtest(pipeline, X, y, windows, n_trees=100, block_trees=50, n_jobs=-1,
+                         random_state=1, cache_dir=BACKTEST_CACHE_DIR):
+    """
+    Per-window test predictions of the incrementally grown forests, as a list
+    aligned with `windows`, plus the tree count of each window and the
+    number of blocks loaded from the cache.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    trees = [block_trees] * len(windows)
+    n_blocks = -(-n_trees // block_trees)  # per window, rounded up: blocks are not split
+    params = pipeline.get_params(deep=True)
+
+    tasks = []
+    for k, (_, _, train_idx, _) in enumerate(windows):
+        # Block k is used by windows k .. k + n_blocks - 1 only
+        eval_idx = np.concatenate([test_idx for _, _, _, test_idx in windows[k:k + n_blocks]])
+        key = joblib.hash((data_hash(X.iloc[train_idx], y.iloc[train_idx]), params, trees[k], random_state + k))
+        tasks.append((train_idx, eval_idx, trees[k], random_state + k, cache_dir / f"block_{key}.joblib"))
+
+    results = Parallel(n_jobs=n_jobs)(delayed(_fit_block)(pipeline, X, y, *task) for task in tasks)
+
+    # Window j = tree-weighted mean of its n_blocks newest blocks
+    sizes = [len(test_idx) for _, _, _, test_idx in windows]
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    predictions, window_trees = [], []
+    for j in range(len(windows)):
+        weighted, total = np.zeros(sizes[j]), 0
+        for k in range(max(0, j - n_blocks + 1), j + 1):
+            start = offsets[j] - offsets[k]
+            weighted += trees[k] * results[k][0][start:start + sizes[j]]
+            total += trees[k]
+        predictions.append(weighted / total)
+        window_trees.append(total)
+    return predictions, window_trees, sum(cached for _, cached in results)
+
+
+def refit_backtest(pipeline, X, y, windows, n_jobs=-1):
+    """Per-window test predictions with every window fitted from scratch (cached CV folds)."""
+    result = cross_validate(pipeline, X, y, cv=RollingOriginSplit(windows), n_jobs=n_jobs)
+    return [result.oof_pred[test_idx] for _, _, _, test_idx in windows], result.n_cached
+
+
+# =========================
+# Report
+# =========================
+def period_table(windows, predictions, y, trees=None):
+    y = np.asarray(y)
+    rows = []
+    for j, ((origin, test_month, train_idx, test_idx), pred) in enumerate(zip(windows, predictions)):
+        rows.append({
+            "origin": str(origin), "test_month": str(test_month),
+            "n_train": len(train_idx), "n_test": len(test_idx),
+            "trees": int(trees[j]) if trees is not None else np.nan,
+            "mae": mean_absolute_error(y[test_idx], pred),
+            "r2": r2_score(y[test_idx], pred),
+        })
+    return pd.DataFrame(rows)
+
+
+@timed("render")
+def plot_drift(table, path=PLOT_PATH):
+    fig, ax_mae = plt.subplots(figsize=(10, 5))
+    ax_mae.plot(table["test_month"], table["mae"], marker="o", color="tab:red", label="MAE")
+    ax_mae.set_ylabel("MAE ($)")
+    ax_mae.tick_params(axis="x", rotation=45)
+    ax_r2 = ax_mae.twinx()
+    ax_r2.plot(table["test_month"], table["r2"], marker="s", color="tab:blue", label="R²")
+    ax_r2.set_ylabel("R²")
+    ax_mae.set_title("Rolling-origin backtest: error by sale month")
+    fig.legend(loc="upper left", bbox_to_anchor=(0.1, 0.9))
+    fig.tight_layout()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest by sale month.")
+    parser.add_argument("--features", choices=sorted(FEATURE_SETS), default="slim")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--trees", type=int, default=100, help="Trees per window")
+    parser.add_argument("--block-trees", type=int, default=50,
+                        help="Trees fitted per origin (fewer: cheaper, but older trees in each window)")
+    parser.add_argument("--min-train-months", type=int, default=6)
+    parser.add_argument("--horizon", type=int, default=1, help="Months ahead of the origin to score")
+    parser.add_argument("--min-test-rows", type=int, default=30)
+    parser.add_argument("--refit", action="store_true", help="Fit every window from scratch")
+    parser.add_argument("--jobs", type=int, default=-1)
+    args = parser.parse_args(argv)
+    if args.backend != "forest" and not args.refit:
+        parser.error("Incremental windows grow a forest; use --refit for the hgb backend")
+
+    df = load_features(impute=False)
+    features = FEATURE_SETS[args.features]
+    X, y = select_inputs(df, features), df["Price"]
+    windows = rolling_origin_windows(df["Date"], args.min_train_months, args.horizon, args.min_test_rows)
+    if not windows:
+        raise SystemExit("❌ Not enough months of sales for a single window")
+    pipeline = build_pipeline(features, n_estimators=args.trees, backend=args.backend)
+
+    if not args.refit and args.trees % args.block_trees:
+        rounded = -(-args.trees // args.block_trees) * args.block_trees
+        print(f"ℹ️ --trees {args.trees} is not a multiple of --block-trees {args.block_trees}: "
+              f"full windows use {rounded} trees")
+
+    start = time.perf_counter()
+    if args.refit:
+        predictions, n_cached = refit_backtest(pipeline, X, y, windows, args.jobs)
+        trees = [args.trees] * len(windows) if args.backend == "forest" else None
+    else:
+        predictions, trees, n_cached = incremental_backtest(
+            pipeline, X, y, windows, args.trees, args.block_trees, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    table = period_table(windows, predictions, y, trees)
+    y_all = np.concatenate([np.asarray(y)[test_idx] for _, _, _, test_idx in windows])
+    pred_all = np.concatenate(predictions)
+
+    print("\n" + "=" * 40)
+    print(f"📅 ROLLING-ORIGIN BACKTEST ({'refit' if args.refit else 'incremental'}, "
+          f"{args.features}, {args.backend}, horizon {args.horizon})")
+    print("=" * 40)
+    print(table.to_string(index=False, formatters={"mae": "{:,.0f}".format, "r2": "{:.4f}".format}))
+    print("-" * 40)
+    print(f"Pooled MAE: ${mean_absolute_error(y_all, pred_all):,.0f} | pooled R²: {r2_score(y_all, pred_all):.4f}")
+    print(f"{len(windows)} windows in {elapsed:.1f}s ({n_cached} loaded from cache)")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    table.to_csv(RESULTS_PATH, index=False)
+    plot_drift(table)
+    print(f"✅ Saved {RESULTS_PATH} and {PLOT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Head-to-head benchmark of the model backends (see model.BACKENDS).
+
+For each backend on melb_data.csv: 5-fold CV R²/MAE (through the cached
+validation harness), mean fit time per fold, predict throughput of a model
+fitted on all rows, and the size of the pickled pipeline. Results are printed
+and written to output/reports/backends.csv.
+
+Usage:
+    python src/bench_backends.py
+    python src/bench_backends.py --features full --with-region --rows 200000
+"""
+import argparse
+import io
+import time
+
+import joblib
+import pandas as pd
+from sklearn.model_selection import KFold
+
+from features import load_features
+from model import BACKENDS, FEATURE_SETS, build_pipeline, select_inputs
+from paths import REPORT_DIR
+from validation import cross_validate
+
+
+def pickled_size(obj):
+    buf = io.BytesIO()
+    joblib.dump(obj, buf)
+    return buf.tell()
+
+
+def bench_backend(backend, features, X, y, cv, n_predict, n_jobs):
+    pipeline = build_pipeline(features, backend=backend)
+    result = cross_validate(pipeline, X, y, cv=cv, n_jobs=n_jobs)
+
+    start = time.perf_counter()
+    pipeline.fit(X, y)
+    full_fit = time.perf_counter() - start
+
+    X_pred = X.sample(n_predict, replace=n_predict > len(X), random_state=0)
+    pipeline.predict(X_pred.iloc[:100])  # warm-up
+    start = time.perf_counter()
+    pipeline.predict(X_pred)
+    predict_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "cv_r2": result.r2.mean(),
+        "cv_r2_std": result.r2.std(),
+        "cv_mae": result.mae.mean(),
+        "fold_fit_s": result.fit_seconds.mean(),
+        "full_fit_s": full_fit,
+        "predict_rows_per_s": n_predict / predict_seconds,
+        "model_mb": pickled_size(pipeline) / 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the model backends.")
+    parser.add_argument("--features", choices=sorted(FEATURE_SETS), default="slim")
+    parser.add_argument("--with-region", action="store_true", help="Add Regionname as a categorical feature")
+    parser.add_argument("--backends", nargs="*", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows for the predict-throughput test")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel CV folds")
+    args = parser.parse_args(argv)
+
+    features = list(FEATURE_SETS[args.features]) + (["Regionname"] if args.with_region else [])
+    df = load_features(impute=False)
+    X, y = select_inputs(df, features), df["Price"]
+    cv = KFold(n_splits=5, shuffle=True, random_state=1)
+
+    rows = []
+    for backend in args.backends:
+        print(f"⏳ Benchmarking {backend} on {len(features)} features...")
+        rows.append(bench_backend(backend, features, X, y, cv, args.rows, args.jobs))
+    table = pd.DataFrame(rows).set_index("backend")
+
+    print("\n" + "=" * 40)
+    print("⚔️ BACKEND BENCHMARK")
+    print("=" * 40)
+    with pd.option_context("display.float_format", "{:,.4f}".format, "display.width", 160, "display.max_columns", None):
+        print(table)
+    print("=" * 40)
+    print("fold_fit_s is the original fit time, also when the folds came from the CV cache.")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    out_path = REPORT_DIR / "backends.csv"
+    table.to_csv(out_path)
+    print(f"✅ Saved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
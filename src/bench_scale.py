@@ -0,0 +1,228 @@
+"""
+Scale benchmark: time every hot path on synthetic copies of melb_data.csv
+that are 10x / 100x / 1000x larger.
+
+Synthetic rows are whole rows resampled with replacement, so the joint
+distribution of Suburb/Type/Rooms/Price/... is kept. Each row is then
+perturbed: coordinates jittered by ~200 m, Price/Landsize/BuildingArea
+scaled by small log-normal noise, sale dates shifted by up to ±15 days, and
+addresses made unique. Files are generated in chunks under
+output/cache/bench/ and reused across runs (same seed -> same file).
+
+Steps timed at each scale:
+- read_csv:       parse the CSV
+- engineer:       features.engineer (Date/Year, categoricals)
+- cv:             3-fold cross_validate of the slim pipeline (fresh cache)
+- full_fit:       fit on every row
+- predict:        batch predict of every row
+- dashboard:      dashboard_index.load_frame + BudgetIndex.build (filter/colour tiles)
+- dashboard_query: one slider move (count + tile lookup), averaged over 50 budgets
+
+Results go to output/reports/bench_scale.csv. --save-baseline stores them as
+the baseline, benchmarks/bench_scale_baseline.json (tracked in git, so CI
+compares against it). --compare fails (exit 1) when a step is slower than the
+baseline by more than --tolerance, and refuses (exit 2) a baseline recorded
+with other settings (scales, backend, trees, seed): those timings are not
+comparable.
+
+Usage:
+    python src/bench_scale.py --scales 1 10 100 --backend hgb --save-baseline
+    python src/bench_scale.py --scales 1 10 100 --backend hgb --compare
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import KFold
+
+from dashboard_index import BudgetIndex, load_frame
+from features import engineer
+from model import BACKENDS, DEFAULT_BACKEND, FEATURES_SLIM, build_pipeline, select_inputs
+from paths import CACHE_DIR, REPORT_DIR, ROOT, find_data_csv
+from profiling import span
+from validation import cross_validate
+
+BENCH_DIR = CACHE_DIR / "bench"
+RESULTS_PATH = REPORT_DIR / "bench_scale.csv"
+BASELINE_PATH = ROOT / "benchmarks" / "bench_scale_baseline.json"  # tracked, unlike output/
+STEPS = ["read_csv", "engineer", "cv", "full_fit", "predict", "dashboard", "dashboard_query"]
+
+
+# =========================
+# Synthetic data
+# =========================
+def synthesize(df, n_rows, rng):
+    """n_rows resampled + jittered rows in the layout of melb_data.csv."""
+    out = df.iloc[rng.integers(0, len(df), n_rows)].reset_index(drop=True)
+    out["Lattitude"] = out["Lattitude"] + rng.normal(0, 0.002, n_rows)
+    out["Longtitude"] = out["Longtitude"] + rng.normal(0, 0.0025, n_rows)
+    for col, sigma in [("Price", 0.05), ("Landsize", 0.05), ("BuildingArea", 0.05)]:
+        out[col] = (out[col] * np.exp(rng.normal(0, sigma, n_rows))).round()
+    dates = pd.to_datetime(out["Date"], dayfirst=True) + pd.to_timedelta(rng.integers(-15, 16, n_rows), unit="D")
+    out["Date"] = dates.dt.strftime("%d/%m/%Y")
+    out["Address"] = out["Address"] + " #" + pd.Series(rng.integers(0, 1 << 40, n_rows)).astype(str)
+    return out
+
+
+def synthetic_csv(scale, seed=0):
+    """Path of the scale-x copy of melb_data.csv, generated chunk by chunk if missing."""
+    source = find_data_csv()
+    if scale == 1:
+        return source
+    path = BENCH_DIR / f"melb_x{scale}_seed{seed}.csv"
+    if path.exists():
+        return path
+
+    df = pd.read_csv(source)
+    rng = np.random.default_rng([seed, scale])
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    # One source-sized chunk at a time keeps memory flat even at 1000x
+    for i in range(scale):
+        synthesize(df, len(df), rng).to_csv(tmp_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    tmp_path.replace(path)
+    return path
+
+
+# =========================
+# Benchmark
+# =========================
+def bench_scale(scale, backend, n_estimators, n_jobs, seed=0):
+    csv_path = synthetic_csv(scale, seed)
+    records = []
+    attrs = {"sink": records, "scale": scale}
+
+    with span("read_csv", **attrs):
+        raw = pd.read_csv(csv_path)
+    n_rows = len(raw)
+    with span("engineer", **attrs):
+        df = engineer(raw, impute=False)
+    del raw
+
+    X, y = select_inputs(df, FEATURES_SLIM), df["Price"]
+    pipeline = build_pipeline(FEATURES_SLIM, n_estimators=n_estimators, backend=backend)
+    cache_dir = Path(tempfile.mkdtemp(prefix="bench_cv_"))
+    try:
+        with span("cv", **attrs):
+            cross_validate(pipeline, X, y, cv=KFold(n_splits=3, shuffle=True, random_state=1),
+                           n_jobs=n_jobs, cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    with span("full_fit", **attrs):
+        pipeline.fit(X, y)
+    with span("predict", **attrs):
+        pipeline.predict(X)
+    del df, X, y, pipeline
+
+    with span("dashboard", **attrs):
+        index = BudgetIndex.build(load_frame(csv_path))
+    budgets = np.linspace(index.edges[0], index.edges[-1], 50)
+    with span("dashboard_query", **attrs) as record:
+        for budget in budgets:
+            index.count(budget)
+            index.tiles_for(budget)
+    record["wall_s"] /= len(budgets)
+
+    return [
+        {"scale": scale, "rows": n_rows, "step": r["name"], "seconds": r["wall_s"], "rss_mb": r["rss_mb"]}
+        for r in records
+    ]
+
+
+def scaling_table(results):
+    """Seconds per step and scale, plus the growth exponent between adjacent scales (1.0 = linear)."""
+    wide = results.pivot_table(index="step", columns="scale", values="seconds").reindex(STEPS)
+    rows = results.groupby("scale")["rows"].first()
+    scales = list(wide.columns)
+    for a, b in zip(scales, scales[1:]):
+        wide[f"exp {a}->{b}"] = np.log(wide[b] / wide[a]) / np.log(rows[b] / rows[a])
+    return wide
+
+
+# =========================
+# Baseline
+# =========================
+def environment():
+    return {"python": platform.python_version(), "sklearn": sklearn.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance, slack_s=0.05):
+    """Rows slower than baseline * (1 + tolerance) + slack_s."""
+    base = pd.DataFrame(baseline["results"]).set_index(["scale", "step"])["seconds"]
+    merged = results.set_index(["scale", "step"])[["seconds"]].join(base.rename("baseline"), how="inner")
+    merged["ratio"] = merged["seconds"] / merged["baseline"]
+    merged["regressed"] = merged["seconds"] > merged["baseline"] * (1 + tolerance) + slack_s
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths on scaled-up synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--trees", type=int, default=100, help="Forest size (forest backend)")
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Fail if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in args.scales:
+        print(f"⏳ Scale x{scale}...")
+        results += bench_scale(scale, args.backend, args.trees, args.jobs, args.seed)
+    results = pd.DataFrame(results)
+    settings = {"backend": args.backend, "trees": args.trees, "seed": args.seed}
+    # What a baseline must match to be comparable: the per-row results carry the scale already
+    run_settings = {"scales": sorted(args.scales), **settings}
+
+    print("\n" + "=" * 40)
+    print(f"📈 SCALE BENCHMARK ({args.backend}, seconds)")
+    print("=" * 40)
+    print(scaling_table(results).to_string(float_format=lambda v: f"{v:.4f}"))
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    results.assign(**settings).to_csv(RESULTS_PATH, index=False)
+    print(f"\n✅ Saved {RESULTS_PATH}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(
+            {"settings": run_settings, "environment": environment(), "results": results.to_dict("records")},
+            indent=2,
+        ))
+        print(f"✅ Baseline saved to {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            print(f"❌ No baseline at {args.baseline} (record one with --save-baseline)")
+            sys.exit(2)
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["settings"] != run_settings:
+            print(f"❌ Baseline settings {baseline['settings']} differ from this run {run_settings}; "
+                  f"timings are not comparable")
+            sys.exit(2)
+        if baseline["environment"] != environment():
+            print(f"⚠️ Baseline was recorded on {baseline['environment']}")
+        merged = compare(results, baseline, args.tolerance)
+        print("\n" + merged.to_string(float_format=lambda v: f"{v:.4f}"))
+        regressed = merged[merged["regressed"]]
+        if len(regressed):
+            print(f"\n❌ {len(regressed)} step(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Load generator for serve.py.
+
+Sends listings sampled from melb_data.csv to a running service from several
+client threads and reports client-side latency and throughput, followed by the
+server's own /stats.
+
+Usage:
+    python src/serve.py &
+    python src/bench_serve.py --requests 2000 --concurrency 16 --batch-size 1
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model import FEATURES_SLIM
+from paths import find_data_csv
+
+
+def sample_listings(n, seed=0):
+    """Listings with the features_slim fields, House_Age precomputed."""
+    df = pd.read_csv(find_data_csv())
+    df["House_Age"] = pd.to_datetime(df["Date"], dayfirst=True).dt.year - df["YearBuilt"]
+    rows = df[FEATURES_SLIM].sample(n, replace=True, random_state=seed)
+    # NaN is not valid JSON; missing fields are imputed by the pipeline
+    return [{k: v for k, v in r.items() if pd.notna(v)} for r in rows.to_dict("records")]
+
+
+def post(url, payload):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+
+def run(url, n_requests, concurrency, batch_size):
+    listings = sample_listings(n_requests * batch_size)
+    payloads = [
+        listings[i] if batch_size == 1 else listings[i:i + batch_size]
+        for i in range(0, len(listings), batch_size)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(lambda p: post(url + "/predict", p), payloads))) * 1000.0
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print("⏱️ SERVICE BENCHMARK (client side)")
+    print("=" * 40)
+    print(f"Requests: {n_requests} x {batch_size} listing(s), concurrency {concurrency}")
+    print(f"p50 latency: {np.percentile(latencies, 50):.2f} ms")
+    print(f"p99 latency: {np.percentile(latencies, 99):.2f} ms")
+    print(f"Throughput : {n_requests / elapsed:,.0f} req/s, {n_requests * batch_size / elapsed:,.0f} listings/s")
+    print("=" * 40)
+
+    with urllib.request.urlopen(url + "/stats") as resp:
+        print("Server /stats:", json.dumps(json.loads(resp.read()), indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local prediction service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1, help="Listings per request")
+    args = parser.parse_args(argv)
+    run(args.url.rstrip("/"), args.requests, args.concurrency, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Comparable sales ("comps") for listings.
+
+Every dated sale with coordinates is indexed in a haversine BallTree on
+Lattitude/Longtitude. A query takes the `candidates` nearest sales by
+location (more until no farther sale could rank higher), then re-ranks
+them by a weighted distance:
+
+    d = km
+        + type     * (Type differs)
+        + rooms    * |Rooms difference|
+        + bathroom * |Bathroom difference|
+        + landsize * |log(1 + Landsize) difference|
+
+Each weight is in "km per unit", e.g. one extra room counts like 0.75 km.
+Similarity is exp(-d) * 0.5 ** (age / half_life_days), where age is the
+number of days between the sale and the listing's reference date. The top k
+by similarity are the comps. A term is skipped when the listing does not give
+that field. Sales after the reference date are never returned, and sales
+without a date are not indexed.
+The reference date is the listing's Date column if it has one. Then only
+sales before that date count, so a sale is never its own comp. Otherwise it
+is the latest sale in the index.
+
+The index (tree + compact sales table) is saved under output/cache/, keyed by
+the source file hash, so a query is a tree lookup and a few array operations
+on (listings x candidates) arrays. Batch mode streams a listings file and
+runs whole chunks through one query.
+
+Usage:
+    python src/comps.py query --lat -37.80 --lon 145.00 --type h --rooms 3 --bathroom 2 --landsize 500
+    python src/comps.py batch listings.csv comps.parquet --k 5 --keep Address
+    python src/comps.py batch data/melb_data.csv comps.csv --store     # index the ingest store instead
+    python src/comps.py batch listings.csv comps.csv --store path/to/store
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from geo_features import EARTH_RADIUS_KM
+from paths import CACHE_DIR
+from predict import PredictionWriter, iter_chunks
+
+COMPS_VERSION = 2       # bump when the index layout changes
+SALE_COLUMNS = ["Address", "Suburb", "Date", "Type", "Rooms", "Bathroom", "Landsize", "Price",
+                "Lattitude", "Longtitude"]
+QUERY_COLUMNS = ["Lattitude", "Longtitude", "Type", "Rooms", "Bathroom", "Landsize", "Date"]
+DEFAULT_WEIGHTS = {"type": 2.0, "rooms": 0.75, "bathroom": 0.5, "landsize": 1.0}
+HALF_LIFE_DAYS = 180
+CANDIDATES = 200        # nearest sales re-ranked per listing at first
+CANDIDATE_GROWTH = 4    # ... and the factor it grows by until the top k is provably exact
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _days(df):
+    """Sale dates as days since the epoch (NaN where missing); accepts strings or datetimes."""
+    if "Date" not in df.columns:
+        return np.full(len(df), np.nan)
+    dates = df["Date"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, dayfirst=True, errors="coerce")
+    return (dates - pd.Timestamp(0)).dt.days.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+# =========================
+# Index
+# =========================
+class CompsIndex:
+    def __init__(self, sales, tree, days, rooms, bathroom, log_land, type_codes, types):
+        self.sales = sales            # DataFrame[n_sales, SALE_COLUMNS], the rows returned as comps
+        self.tree = tree              # haversine BallTree over (lat, lon) in radians
+        self.days = days              # float64[n_sales], sale date in days since the epoch
+        self.rooms = rooms            # float64[n_sales]
+        self.bathroom = bathroom      # float64[n_sales]
+        self.log_land = log_land      # float64[n_sales], log(1 + Landsize)
+        self.type_codes = type_codes  # int8[n_sales], index into types
+        self.types = types            # sorted Type values
+
+    def __len__(self):
+        return len(self.sales)
+
+    @classmethod
+    def build(cls, df):
+        df = df.reindex(columns=SALE_COLUMNS)
+        # Undated sales are left out: their age is unknown, so they could postdate any listing
+        df = df[np.isfinite(_numeric(df, "Lattitude")) & np.isfinite(_numeric(df, "Longtitude"))
+                & np.isfinite(_numeric(df, "Price")) & np.isfinite(_days(df))].reset_index(drop=True)
+        coords = np.radians(np.column_stack([_numeric(df, "Lattitude"), _numeric(df, "Longtitude")]))
+        types = sorted(df["Type"].dropna().astype(str).unique())
+        sales = df.assign(Date=pd.to_datetime(df["Date"], dayfirst=True, errors="coerce"))
+        return cls(
+            sales,
+            BallTree(coords, metric="haversine"),
+            _days(sales),
+            _numeric(df, "Rooms"),
+            _numeric(df, "Bathroom"),
+            np.log1p(np.clip(_numeric(df, "Landsize"), 0, None)),
+            pd.Categorical(df["Type"].astype("string"), categories=types).codes.astype(np.int8),
+            types,
+        )
+
+    # ---------- queries ----------
+    def _type_codes(self, listings):
+        if "Type" not in listings.columns:
+            return np.full(len(listings), -1, dtype=np.int8)
+        values = listings["Type"].astype("string")
+        return pd.Categorical(values, categories=self.types).codes.astype(np.int8)
+
+    def query(self, listings, k=5, weights=None, half_life_days=HALF_LIFE_DAYS, candidates=CANDIDATES):
+        """
+        Top-k comps of every listing as one long frame: listing (row position
+        in `listings`), rank, similarity, km and the comp's SALE_COLUMNS.
+        Listings without coordinates get no comps.
+
+        The result is the exact top k. Every term besides km is >= 0, so a sale
+        beyond the farthest candidate scores at least that candidate's km. A
+        listing whose k-th best score is above it (or which has fewer than k
+        valid candidates: later sales are not valid) is queried again with
+        CANDIDATE_GROWTH times as many, up to the whole index. Fewer than k
+        rows for a listing means the index holds no more valid comps.
+        """
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        if min(weights.values()) < 0 or half_life_days <= 0:
+            raise ValueError("Comps weights must be >= 0 and the half-life > 0")
+        lat, lon = _numeric(listings, "Lattitude"), _numeric(listings, "Longtitude")
+        located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        k = min(k, len(self))
+        if len(located) == 0 or k == 0:
+            return self._frame(np.empty(0, int), np.empty(0, int), np.empty(0), np.empty(0), np.empty(0, int))
+
+        values = {
+            "coords": np.radians(np.column_stack([lat[located], lon[located]])),
+            "rooms": _numeric(listings, "Rooms")[located],
+            "bathroom": _numeric(listings, "Bathroom")[located],
+            "log_land": np.log1p(np.clip(_numeric(listings, "Landsize"), 0, None))[located],
+            "type": self._type_codes(listings)[located],
+            "ref": _days(listings)[located],
+        }
+        parts, rows, n_cand = [], np.arange(len(located)), min(max(candidates, k), len(self))
+        while len(rows):
+            idx, km, best, farthest = self._top_k({name: v[rows] for name, v in values.items()}, k, n_cand,
+                                                  weights, half_life_days)
+            # An unseen sale scores >= farthest, so a k-th best at or below it is final
+            short = ~(best[:, -1] <= farthest)
+            if n_cand == len(self):
+                short[:] = False
+            parts.append((rows[~short], idx[~short], km[~short], best[~short]))
+            rows, n_cand = rows[short], min(CANDIDATE_GROWTH * n_cand, len(self))
+
+        rows, idx, km, best = (np.concatenate(p) for p in zip(*parts))
+        order = np.argsort(rows, kind="stable")
+        rows, idx, km, best = rows[order], idx[order], km[order], best[order]
+        keep = np.isfinite(best)
+
+        listing = np.repeat(located[rows], k).reshape(-1, k)[keep]
+        rank = np.tile(np.arange(1, k + 1), (len(rows), 1))[keep]
+        return self._frame(listing, rank, np.exp(-best[keep]), km[keep], idx[keep])
+
+    def _top_k(self, values, k, n_cand, weights, half_life_days):
+        """
+        Sale index, km and score (inf: not a valid comp) of the k best of the
+        n_cand nearest, per listing, plus the km of the farthest candidate.
+        """
+        dist, idx = self.tree.query(values["coords"], k=n_cand)  # (listings x candidates), sorted by distance
+        km = dist * EARTH_RADIUS_KM
+        score = km.copy()
+
+        def add(weight, listing_values, sale_values):
+            # |difference| per (listing, candidate); unknown on either side adds nothing
+            diff = np.abs(listing_values[:, None] - sale_values[idx])
+            score[:] += weight * np.nan_to_num(diff, nan=0.0)
+
+        add(weights["rooms"], values["rooms"], self.rooms)
+        add(weights["bathroom"], values["bathroom"], self.bathroom)
+        add(weights["landsize"], values["log_land"], self.log_land)
+        codes = values["type"][:, None]
+        score += weights["type"] * ((codes >= 0) & (codes != self.type_codes[idx]))
+
+        # Reference date: the listing's own date (comps sold before it) or the newest sale
+        dated = np.isfinite(values["ref"])
+        ref = np.where(dated, values["ref"], self.days.max())
+        age = ref[:, None] - self.days[idx]
+        score += np.log(2) * age / half_life_days
+        score[np.where(dated[:, None], age <= 0, age < 0)] = np.inf
+
+        top = np.argpartition(score, k - 1, axis=1)[:, :k] if k < n_cand else np.tile(np.arange(n_cand), (len(idx), 1))
+        order = np.take_along_axis(score, top, axis=1).argsort(axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        return (np.take_along_axis(idx, top, axis=1), np.take_along_axis(km, top, axis=1),
+                np.take_along_axis(score, top, axis=1), km[:, -1])
+
+    def _frame(self, listing, rank, similarity, km, sale_idx):
+        out = pd.DataFrame({"listing": listing, "rank": rank, "similarity": similarity, "km": km})
+        return pd.concat([out, self.sales.iloc[sale_idx].reset_index(drop=True)], axis=1)
+
+
+def comps_estimate(comps):
+    """Similarity-weighted mean comp Price per listing."""
+    weighted = comps.assign(_w=comps["similarity"], _wp=comps["similarity"] * comps["Price"])
+    sums = weighted.groupby("listing")[["_w", "_wp"]].sum()
+    return sums["_wp"] / sums["_w"]
+
+
+# =========================
+# Persistence
+# =========================
+def load_sales(csv_path):
+    return pd.read_csv(csv_path, usecols=lambda c: c in SALE_COLUMNS)
+
+
+def index_path(source_key):
+    return CACHE_DIR / f"comps_index_v{COMPS_VERSION}_{source_key}.joblib"
+
+
+def load_or_build(source_key, load_sales, refresh=False):
+    """Saved index for `source_key`, or build it from load_sales() and save it."""
+    path = index_path(source_key)
+    if path.exists() and not refresh:
+        return joblib.load(path)
+    index = CompsIndex.build(load_sales())
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    joblib.dump(index, tmp_path)
+    os.replace(tmp_path, path)
+    return index
+
+
+def load_index(csv_path=None, store=None):
+    """
+    Index of melb_data.csv (default), another sales CSV, or an ingest store
+    (store=True: the default data/store/, or the store's directory).
+    """
+    if store is not None:
+        # ingest pulls in the model stack, so import on use
+        from ingest import STORE_DIR, SalesStore
+        root = Path(STORE_DIR if store is True else store)
+        sales_store = SalesStore(root)
+        if not sales_store.state["batches"]:
+            raise ValueError(f"No batches in the ingest store {root} (add one with ingest.py add)")
+        key = "store_" + joblib.hash([str(root.resolve()), [b["id"] for b in sales_store.state["batches"]]])
+        return load_or_build(key, sales_store.load)
+
+    from features import file_hash
+    from paths import find_data_csv
+    csv_path = csv_path or find_data_csv()
+    return load_or_build(file_hash(csv_path), lambda: load_sales(csv_path))
+
+
+# =========================
+# Batch mode
+# =========================
+def comps_file(index, input_path, output_path, k=5, weights=None, half_life_days=HALF_LIFE_DAYS,
+               chunksize=50_000, keep=()):
+    """
+    Comps for every listing of a file, one output row per (listing, comp).
+    Returns the listing count and how many of them got fewer than k comps.
+    """
+    keep = list(keep)
+    header = [f"listing_{c}" for c in keep] + ["listing", "rank", "similarity", "km"] + SALE_COLUMNS
+    writer = PredictionWriter(output_path, header)
+    n_rows = n_short = 0
+    try:
+        for chunk in iter_chunks(input_path, QUERY_COLUMNS, chunksize, keep):
+            comps = index.query(chunk, k, weights, half_life_days)
+            n_short += int((np.bincount(comps["listing"], minlength=len(chunk)) < k).sum())
+            kept = chunk[keep].iloc[comps["listing"]].reset_index(drop=True).add_prefix("listing_")
+            comps["listing"] += n_rows
+            writer.write(pd.concat([kept, comps], axis=1))
+            n_rows += len(chunk)
+    finally:
+        writer.close()
+    return n_rows, n_short
+
+
+def main(argv=None):
+    # Pickle the index under its module name, not __main__
+    from comps import comps_estimate, comps_file, load_index
+
+    parser = argparse.ArgumentParser(description="Comparable sales for listings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_query = sub.add_parser("query", help="Comps for one listing")
+    p_query.add_argument("--lat", type=float, required=True)
+    p_query.add_argument("--lon", type=float, required=True)
+    p_query.add_argument("--type", choices=["h", "u", "t"])
+    p_query.add_argument("--rooms", type=float)
+    p_query.add_argument("--bathroom", type=float)
+    p_query.add_argument("--landsize", type=float)
+    p_query.add_argument("--date", help="Listing date (only earlier sales are comps)")
+    p_batch = sub.add_parser("batch", help="Comps for every listing of a file")
+    p_batch.add_argument("input", help="Listings file (.csv or .parquet)")
+    p_batch.add_argument("output", help="Comps file (.csv or .parquet)")
+    p_batch.add_argument("--keep", nargs="*", default=[], help="Listing columns to copy to the output")
+    p_batch.add_argument("--chunksize", type=int, default=50_000)
+    for p in (p_query, p_batch):
+        p.add_argument("--k", type=int, default=5)
+        p.add_argument("--half-life", type=float, default=HALF_LIFE_DAYS, help="Recency half-life in days")
+        for name, default in DEFAULT_WEIGHTS.items():
+            p.add_argument(f"--w-{name}", type=float, default=default, help=f"Weight of {name} (km per unit)")
+        p.add_argument("--store", type=Path, nargs="?", const=True, default=None, metavar="PATH",
+                       help="Index an ingest store (default data/store/) instead of melb_data.csv")
+    args = parser.parse_args(argv)
+    weights = {name: getattr(args, f"w_{name}") for name in DEFAULT_WEIGHTS}
+
+    start = time.perf_counter()
+    try:
+        index = load_index(store=args.store)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    loaded = time.perf_counter() - start
+    if not len(index):
+        print("❌ No sales with coordinates to index")
+        sys.exit(1)
+
+    if args.command == "batch":
+        start = time.perf_counter()
+        n_rows, n_short = comps_file(index, args.input, args.output, args.k, weights, args.half_life,
+                                     args.chunksize, args.keep)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Comps for {n_rows:,} listings -> {args.output} ({elapsed:.1f}s, index loaded in {loaded:.2f}s)")
+        if n_short:
+            print(f"⚠️ {n_short:,} listings got fewer than {args.k} comps (no coordinates, or too few earlier sales)")
+        return
+
+    listing = pd.DataFrame([{
+        "Lattitude": args.lat, "Longtitude": args.lon, "Type": args.type, "Rooms": args.rooms,
+        "Bathroom": args.bathroom, "Landsize": args.landsize, "Date": args.date,
+    }])
+    start = time.perf_counter()
+    comps = index.query(listing, args.k, weights, args.half_life)
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print(f"🏘️ COMPARABLE SALES ({len(index):,} indexed)")
+    print("=" * 40)
+    shown = comps.drop(columns=["listing", "Lattitude", "Longtitude"]).assign(Date=comps["Date"].dt.date)
+    print(shown.to_string(index=False, formatters={
+        "similarity": "{:.3f}".format, "km": "{:.2f}".format, "Price": "${:,.0f}".format}))
+    print("-" * 40)
+    if len(comps) < args.k:
+        print(f"⚠️ Only {len(comps)} of {args.k} comps: the index has no more sales before the reference date")
+    if len(comps):
+        print(f"Comps estimate: ${comps_estimate(comps).iloc[0]:,.0f} (similarity-weighted)")
+    print(f"Index loaded in {1000 * loaded:.0f} ms, query in {1000 * elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
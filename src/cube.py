@@ -0,0 +1,283 @@
+"""
+Market aggregate cube: Price and Unit_Price statistics per
+Suburb x Type x sale month.
+
+Every cell (one Suburb / CouncilArea / Regionname / Type / sale month
+combination present in the data; a suburb always sits in one region, so the
+extra keys add almost no cells) keeps, for both measures:
+
+- count, sum and sum of squares, so mean and standard deviation of any
+  roll-up are exact
+- a log-bucket histogram sketch (bucket i holds values in
+  (GAMMA^(i-1), GAMMA^i]), so quantiles of any roll-up are within
+  SKETCH_ERROR relative error
+
+All of these are additive, so two cubes merge by adding cells and a roll-up
+by Regionname, CouncilArea, Suburb, Type or month is a sum over cells: O(cells),
+never O(rows). The sketches are sparse (cells x buckets) matrices, and both
+merging and rolling up are one sparse product with a cell -> group indicator.
+
+The cube is built in one vectorised pass (one groupby for the cell ids, then
+bincount / one sparse matrix per measure). The dashboard loads it cached by
+the CSV hash; the ingest store (ingest.py) merges every new batch into its own
+cube instead of rebuilding it.
+
+Usage:
+    python src/cube.py                                  # per-region report of melb_data.csv
+    python src/cube.py --by CouncilArea Type --measure Unit_Price
+    python src/cube.py --by sale_month --type h --months 2016-06 2016-12
+    python src/cube.py --store                          # the cube of the ingest store (data/store/)
+    python src/cube.py --store path/to/store            # ... of another store
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from paths import CACHE_DIR, REPORT_DIR
+
+CUBE_VERSION = 1        # bump when the cell layout or the sketch changes
+SKETCH_ERROR = 0.01     # relative error of sketch quantiles
+GAMMA = (1 + SKETCH_ERROR) / (1 - SKETCH_ERROR)
+MAX_VALUE = 1e9         # values are clipped to [1, MAX_VALUE] before bucketing
+N_BUCKETS = int(np.ceil(np.log(MAX_VALUE) / np.log(GAMMA))) + 1
+
+DIMENSIONS = ["Regionname", "CouncilArea", "Suburb", "Type", "sale_month"]
+MEASURES = ["Price", "Unit_Price"]
+RAW_COLUMNS = {"Suburb", "Type", "Date", "Regionname", "CouncilArea", "Price", "Landsize", "sale_month"}
+
+
+# =========================
+# Sketch
+# =========================
+def bucket_of(values):
+    """Sketch bucket of each (positive) value."""
+    clipped = np.clip(values, 1.0, MAX_VALUE)
+    return np.ceil(np.log(clipped) / np.log(GAMMA)).astype(np.int64)
+
+
+def sketch_quantiles(hist, quantiles):
+    """
+    Quantiles (0-1) of each row of a dense (groups x buckets) histogram:
+    float64[n_groups, len(quantiles)], NaN for empty rows. A bucket's value
+    is the midpoint that keeps the relative error within SKETCH_ERROR.
+    """
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1:]
+    out = np.full((len(hist), len(quantiles)), np.nan)
+    rows = np.flatnonzero(total[:, 0] > 0)
+    for j, q in enumerate(quantiles):
+        # Rank of the q-quantile among the n values (lower median for even n, like DDSketch)
+        rank = np.floor(q * (total[rows, 0] - 1))
+        bucket = (cum[rows] <= rank[:, None]).sum(axis=1)
+        out[rows, j] = 2 * GAMMA ** bucket / (GAMMA + 1)
+    return out
+
+
+# =========================
+# Cube
+# =========================
+def _indicator(ids, n_groups):
+    """Sparse (groups x len(ids)) 0/1 matrix: row g sums the cells of group g."""
+    return sparse.csr_matrix(
+        (np.ones(len(ids)), (ids, np.arange(len(ids)))), shape=(n_groups, len(ids))
+    )
+
+
+def _group_ids(keys, by):
+    """Group id of each row of `keys` by the `by` columns, plus the group keys (in id order)."""
+    if not by:
+        return np.zeros(len(keys), dtype=np.int64), pd.DataFrame(index=range(1 if len(keys) else 0))
+    ids = keys.groupby(list(by), sort=True, dropna=False).ngroup().to_numpy()
+    _, first = np.unique(ids, return_index=True)
+    return ids, keys.iloc[first][list(by)].reset_index(drop=True)
+
+
+class MarketCube:
+    def __init__(self, keys, stats, sketches):
+        self.keys = keys            # DataFrame[cells, DIMENSIONS], sorted
+        self.stats = stats          # {measure: float64[cells, 3]} count, sum, sum of squares
+        self.sketches = sketches    # {measure: csr[cells, N_BUCKETS]} value counts per bucket
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ---------- build ----------
+    @staticmethod
+    def prepare(df):
+        """Dimension + measure columns from a melb_data.csv-style (or ingest store) frame."""
+        out = pd.DataFrame(index=df.index)
+        for col in ["Regionname", "CouncilArea", "Suburb", "Type"]:
+            out[col] = df[col].astype("object").fillna("Unknown") if col in df.columns else "Unknown"
+        if "sale_month" in df.columns:
+            out["sale_month"] = df["sale_month"].astype("object")
+        else:
+            dates = pd.to_datetime(df["Date"], dayfirst=True, errors="coerce")
+            out["sale_month"] = dates.dt.strftime("%Y-%m")
+        price = pd.to_numeric(df["Price"], errors="coerce")
+        land = pd.to_numeric(df["Landsize"], errors="coerce") if "Landsize" in df.columns else price * np.nan
+        out["Price"] = price
+        # Same definition as the dashboard: Price per sqm of land, NA for land sizes <= 0
+        out["Unit_Price"] = (price / land).where(land > 0)
+        return out.dropna(subset=["sale_month", "Price"])
+
+    @classmethod
+    def build(cls, df):
+        """Cube of a frame in one pass: a groupby for the cell ids, then bincounts per measure."""
+        df = cls.prepare(df if len(df.columns) else pd.DataFrame(columns=["Date", "Price"]))
+        ids, keys = _group_ids(df[DIMENSIONS], DIMENSIONS)
+        n_cells = len(keys)
+        stats, sketches = {}, {}
+        for measure in MEASURES:
+            values = df[measure].to_numpy(dtype=np.float64)
+            valid = np.isfinite(values) & (values > 0)
+            cell, v = ids[valid], values[valid]
+            stats[measure] = np.column_stack([
+                np.bincount(cell, minlength=n_cells),
+                np.bincount(cell, weights=v, minlength=n_cells),
+                np.bincount(cell, weights=v * v, minlength=n_cells),
+            ]).astype(np.float64)
+            # Duplicate (cell, bucket) pairs are summed by the CSR conversion
+            sketches[measure] = sparse.csr_matrix(
+                (np.ones(len(cell)), (cell, bucket_of(v))), shape=(n_cells, N_BUCKETS)
+            )
+        return cls(keys, stats, sketches)
+
+    def merge(self, other):
+        """Cube of the union of both cubes' sales (cells with the same keys are added)."""
+        keys = pd.concat([self.keys, other.keys], ignore_index=True)
+        ids, merged_keys = _group_ids(keys, DIMENSIONS)
+        combine = _indicator(ids, len(merged_keys))
+        stats = {m: combine @ np.vstack([self.stats[m], other.stats[m]]) for m in MEASURES}
+        sketches = {m: (combine @ sparse.vstack([self.sketches[m], other.sketches[m]])).tocsr()
+                    for m in MEASURES}
+        return MarketCube(merged_keys, stats, sketches)
+
+    def update(self, df):
+        """Merge the sales of a new batch."""
+        return self.merge(MarketCube.build(df))
+
+    # ---------- queries ----------
+    def dimension_values(self, dim):
+        return sorted(self.keys[dim].unique())
+
+    def _mask(self, where, months):
+        mask = np.ones(len(self.keys), dtype=bool)
+        for dim, value in where.items():
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            mask &= self.keys[dim].isin(values).to_numpy()
+        if months is not None:
+            start, end = months
+            month = self.keys["sale_month"]
+            if start is not None:
+                mask &= (month >= start).to_numpy()
+            if end is not None:
+                mask &= (month <= end).to_numpy()
+        return mask
+
+    def query(self, by=(), measure="Price", quantiles=(0.5,), months=None, **where):
+        """
+        Statistics of `measure` rolled up to the `by` dimensions, over the cells
+        matching `where` (dimension=value or list of values) and the inclusive
+        `months` range ("YYYY-MM", "YYYY-MM"). One row per group: count, mean,
+        std (ddof=1, like pandas) and one p<q> column per sketch quantile.
+        """
+        unknown = set(by) | set(where)
+        unknown -= set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {sorted(unknown)} (choose from {DIMENSIONS})")
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure: {measure} (choose from {MEASURES})")
+
+        mask = self._mask(where, months)
+        ids, groups = _group_ids(self.keys[mask], by)
+        combine = _indicator(ids, len(groups))
+        count, total, sumsq = (combine @ self.stats[measure][mask]).T
+        hist = (combine @ self.sketches[measure][mask]).toarray()
+
+        out = groups.copy()
+        out["count"] = count.astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["mean"] = total / count
+            out["std"] = np.sqrt(np.maximum(sumsq - total * total / count, 0) / (count - 1))
+        for q, values in zip(quantiles, sketch_quantiles(hist, quantiles).T):
+            out[f"p{100 * q:g}"] = values
+        return out[out["count"] > 0].reset_index(drop=True)
+
+
+# =========================
+# Cache
+# =========================
+def load_sales(csv_path):
+    return pd.read_csv(csv_path, usecols=lambda c: c in RAW_COLUMNS)
+
+
+def load_or_build(csv_path, source_key, refresh=False):
+    """Cube of `csv_path`, saved under output/cache/ keyed by `source_key` (the CSV hash)."""
+    path = CACHE_DIR / f"market_cube_v{CUBE_VERSION}_{source_key}.joblib"
+    if path.exists() and not refresh:
+        return joblib.load(path)
+    cube = MarketCube.build(load_sales(csv_path))
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    joblib.dump(cube, tmp_path)
+    os.replace(tmp_path, path)
+    return cube
+
+
+def main(argv=None):
+    # Pickle the class under its module name, not __main__
+    from cube import MEASURES, load_or_build
+    from features import file_hash
+    # ingest imports this module, so import on use
+    from ingest import STORE_DIR, SalesStore
+    from paths import find_data_csv
+
+    parser = argparse.ArgumentParser(description="Roll up the market cube and save a report.")
+    parser.add_argument("--by", nargs="*", default=["Regionname"], choices=DIMENSIONS)
+    parser.add_argument("--measure", choices=MEASURES, default="Price")
+    parser.add_argument("--type", nargs="*", default=None, help="Restrict to these property types (h, u, t)")
+    parser.add_argument("--months", nargs=2, default=None, metavar=("FROM", "TO"), help="YYYY-MM range")
+    parser.add_argument("--store", type=Path, nargs="?", const=STORE_DIR, default=None, metavar="PATH",
+                        help="Query the cube of an ingest store (default data/store/) instead")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.store is not None:
+        store = SalesStore(args.store)
+        if not store.state["batches"]:
+            raise SystemExit(f"❌ No batches in the ingest store {args.store} (add one with ingest.py add)")
+        cube, source = store.cube(), f"ingest store {args.store}"
+    else:
+        csv_path = find_data_csv()
+        cube, source = load_or_build(csv_path, file_hash(csv_path)), csv_path.name
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = cube.query(args.by, args.measure, quantiles=(0.25, 0.5, 0.75), months=args.months, Type=args.type)
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print(f"🧊 MARKET CUBE: {args.measure} by {' x '.join(args.by) or 'all'} ({source})")
+    print("=" * 40)
+    # Months read in order; any other roll-up largest first
+    shown = table if "sale_month" in args.by else table.sort_values("count", ascending=False)
+    print(shown.to_string(index=False, float_format=lambda v: f"{v:,.0f}"))
+    print("-" * 40)
+    print(f"{len(cube):,} cells, loaded in {loaded:.2f}s, rolled up in {1000 * elapsed:.1f} ms")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORT_DIR / f"market_{args.measure.lower()}_by_{'_'.join(args.by) or 'all'}.csv"
+    table.to_csv(path, index=False)
+    print(f"✅ Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import pydeck as pdk
 from PIL import Image
 from pathlib import Path
 
+import comps
+import cube
+from dashboard_index import PRICE_STEP, BudgetIndex, load_frame_cached
+from features import file_hash
+from profiling import span
+
 # =========================
 # Paths (robust)
 # =========================
@@ -30,11 +37,12 @@ Properties in the South/East (Toorak, South Yarra) command a premium that defies
 # =========================
 # Load data
 # =========================
-@st.cache_data
+@st.cache_resource
 def load_data():
     """
-    Try common locations for melb_data.csv and load it robustly.
-    Also normalises column names and ensures numeric types.
+    Try common locations for melb_data.csv and load the compact dashboard
+    frame (see dashboard_index.load_frame). cache_resource hands every
+    session the same memory-mapped frame instead of a pickled copy.
     """
     candidates = [
         ROOT / "melb_data.csv",
@@ -51,60 +59,44 @@ def load_data():
         )
         st.stop()
 
-    df = pd.read_csv(csv_path)
-
-    # ---- Column name compatibility (Latitude/Longitude common typos) ----
-    # Your dataset uses "Lattitude" / "Longtitude" (typos) in many Melbourne housing datasets.
-    col_map = {}
-    if "Lattitude" in df.columns and "Latitude" not in df.columns:
-        col_map["Lattitude"] = "Latitude"
-    if "Longtitude" in df.columns and "Longitude" not in df.columns:
-        col_map["Longtitude"] = "Longitude"
-    if col_map:
-        df = df.rename(columns=col_map)
-
-    # Required columns
-    required = ["Latitude", "Longitude", "Price"]
-    missing = [c for c in required if c not in df.columns]
-    if missing:
-        st.error(f"Missing required columns: {missing}\nAvailable columns: {list(df.columns)}")
+    try:
+        source_key = file_hash(csv_path)
+        df = load_frame_cached(csv_path, source_key)
+    except ValueError as e:
+        st.error(str(e))
         st.stop()
 
-    # Force numeric for coordinates/price (robust against strings)
-    df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
-    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
-    df["Price"] = pd.to_numeric(df["Price"], errors="coerce")
+    return df, source_key, csv_path
 
-    # ---- Unit_Price creation (optional but recommended) ----
-    # If not present, compute from land size. Clean it thoroughly to avoid NAType issues downstream.
-    if "Unit_Price" not in df.columns:
-        land_candidates = ["Landsize", "LandSize", "Land_Size", "landsize"]
-        land_col = next((c for c in land_candidates if c in df.columns), None)
 
-        if land_col is not None:
-            df[land_col] = pd.to_numeric(df[land_col], errors="coerce")
-            df["Unit_Price"] = df["Price"] / df[land_col]
-            # Remove invalid land sizes (<=0) -> Unit_Price becomes NA
-            df.loc[df[land_col] <= 0, "Unit_Price"] = pd.NA
-        else:
-            # Fallback if no land size: use Price (still allows visual encoding)
-            df["Unit_Price"] = df["Price"]
+@st.cache_resource
+def load_index(_df, source_key):
+    """Budget index + map tiles, built once per dataset version (see dashboard_index.py)."""
+    return BudgetIndex.load_or_build(_df, source_key)
 
-    # Ensure Unit_Price numeric
-    df["Unit_Price"] = pd.to_numeric(df["Unit_Price"], errors="coerce")
 
-    # Basic cleaning
-    df = df.dropna(subset=["Latitude", "Longitude", "Price"])
-    df = df[df["Price"] < 3_000_000]
+@st.cache_resource
+def load_cube(csv_path, source_key):
+    """Suburb x Type x month aggregate cube, built once per dataset version (see cube.py)."""
+    return cube.load_or_build(csv_path, source_key)
 
-    # Optional: keep only plausible Melbourne bounding box (extra safety)
-    # If this filters too much, comment it out.
-    df = df[df["Latitude"].between(-38.5, -37.3) & df["Longitude"].between(144.3, 145.6)]
 
-    return df
+@st.cache_resource
+def load_comps(csv_path, source_key):
+    """Haversine index of every sale for the comps panel, built once per dataset version (see comps.py)."""
+    return comps.load_or_build(source_key, lambda: comps.load_sales(csv_path))
 
 
-df = load_data()
+# Per-rerun timings (also appended to output/reports/trace.jsonl with PROFILE_TRACE=1), shown in the debug panel below
+timings = []
+with span("load_data", sink=timings):
+    df, source_key, csv_path = load_data()
+with span("load_index", sink=timings):
+    index = load_index(df, source_key)
+with span("load_cube", sink=timings):
+    market = load_cube(csv_path, source_key)
+with span("load_comps", sink=timings):
+    comps_index = load_comps(csv_path, source_key)
 
 # =========================
 # Debug (collapsed)
@@ -113,23 +105,26 @@ with st.expander("Debug (columns & coordinate stats)", expanded=False):
     st.write("Columns:", list(df.columns))
     st.write(df[["Latitude", "Longitude"]].describe())
 
+# Filled in at the end of the script, once every step of this rerun is timed
+timings_panel = st.expander("Debug (last rerun timings)", expanded=False)
+
 # =========================
 # Sidebar filters
 # =========================
 st.sidebar.header("🔍 Filter Data")
+# Snapped to the index's budget bands so every position is a pre-computed tile set
 price_filter = st.sidebar.slider(
     "Max Price (Budget)",
-    int(df["Price"].min()),
-    int(df["Price"].max()),
-    1_500_000
+    int(index.edges[0]),
+    int(index.edges[-1]),
+    1_500_000,
+    step=PRICE_STEP
 )
 
-# Filter + optional sampling (for performance)
-filtered_df = df[df["Price"] <= price_filter].copy()
-
-# Optional: sample to keep map smooth
-if len(filtered_df) > 3000:
-    filtered_df = filtered_df.sample(3000, random_state=42)
+# Binary search + tile lookup instead of a full scan and resample
+with span("filter", sink=timings, budget=price_filter):
+    n_filtered = index.count(price_filter)
+    tiles = index.tiles_for(price_filter)
 
 # =========================
 # Layout
@@ -140,39 +135,17 @@ col1, col2 = st.columns([2, 1])
 # Left: PyDeck colour map
 # =========================
 with col1:
-    st.subheader(f"📍 Price Heatmap ({len(filtered_df)} Properties)")
-
-    # Ensure required fields exist & are numeric
-    filtered_df["Unit_Price"] = pd.to_numeric(filtered_df["Unit_Price"], errors="coerce")
-    filtered_df = filtered_df.dropna(subset=["Latitude", "Longitude", "Unit_Price"]).copy()
+    st.subheader(f"📍 Price Heatmap ({n_filtered} Properties)")
 
-    if len(filtered_df) == 0:
+    if len(tiles) == 0:
         st.warning("No valid records after cleaning Unit_Price/coordinates.")
         st.stop()
 
-    # Winsorise + normalise (avoid outliers breaking colour scale)
-    low = filtered_df["Unit_Price"].quantile(0.05)
-    high = filtered_df["Unit_Price"].quantile(0.95)
-    v = filtered_df["Unit_Price"].clip(lower=low, upper=high)
-
-    denom = (v.max() - v.min())
-    if denom == 0:
-        filtered_df["_v"] = 0.5
-    else:
-        filtered_df["_v"] = (v - v.min()) / (denom)
-
-    # Final NA protection
-    filtered_df["_v"] = filtered_df["_v"].fillna(0.5)
-
-    # Colour: low -> blue, high -> red
-    filtered_df["_r"] = (255 * filtered_df["_v"]).round().astype("int32")
-    filtered_df["_g"] = (80 * (1 - filtered_df["_v"])).round().astype("int32")
-    filtered_df["_b"] = (255 * (1 - filtered_df["_v"])).round().astype("int32")
-
     # PyDeck layer
     layer = pdk.Layer(
         "ScatterplotLayer",
-        data=filtered_df,
+        id="tiles",
+        data=tiles,
         get_position="[Longitude, Latitude]",
         get_fill_color="[_r, _g, _b, 140]",
         get_radius="200 + 800 * _v",
@@ -181,30 +154,35 @@ with col1:
     )
 
     view_state = pdk.ViewState(
-        latitude=float(filtered_df["Latitude"].mean()),
-        longitude=float(filtered_df["Longitude"].mean()),
+        latitude=float(np.average(tiles["Latitude"], weights=tiles["count"])),
+        longitude=float(np.average(tiles["Longitude"], weights=tiles["count"])),
         zoom=10,
         pitch=0
     )
 
     tooltip = {
-        "html": "<b>Suburb:</b> {Suburb}<br/>"
-                "<b>Price:</b> ${Price}<br/>"
-                "<b>Unit Price:</b> {Unit_Price}",
+        "html": "<b>Properties:</b> {count}<br/>"
+                "<b>Median Unit Price:</b> {q50}<br/>"
+                "<b>Unit Price (5-95%):</b> {q05} - {q95}",
         "style": {"backgroundColor": "white", "color": "black"}
     }
 
     # NOTE: no map_style to avoid Mapbox token dependency
-    st.pydeck_chart(
-        pdk.Deck(
-            initial_view_state=view_state,
-            layers=[layer],
-            tooltip=tooltip
-        ),
-        use_container_width=True
-    )
+    with span("render_map", sink=timings, tiles=len(tiles)):
+        map_event = st.pydeck_chart(
+            pdk.Deck(
+                initial_view_state=view_state,
+                layers=[layer],
+                tooltip=tooltip
+            ),
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="single-object",
+            key="map",
+        )
 
-    st.caption("Warmer/larger points indicate higher Land Value Density (Price/sqm).")
+    st.caption("Each point is a ~1 km tile; warmer/larger points indicate higher median Land Value Density (Price/sqm). "
+               "Click a tile to see comparable sales.")
 
 # =========================
 # Right: Feature importance image + commentary
@@ -219,8 +197,9 @@ with col2:
     img_path = next((p for p in img_candidates if p.exists()), None)
 
     if img_path:
-        image = Image.open(img_path)
-        st.image(image, caption="Feature Importance (Random Forest)", use_container_width=True)
+        with span("render_image", sink=timings):
+            image = Image.open(img_path)
+            st.image(image, caption="Permutation Importance (Random Forest, 5-fold CV)", use_container_width=True)
     else:
         st.warning(
             "Feature Importance image not found. Tried:\n- " +
@@ -241,11 +220,103 @@ with col2:
 st.markdown("---")
 kpi1, kpi2, kpi3 = st.columns(3)
 
-kpi1.metric("Average Price (Filtered)", f"${filtered_df['Price'].mean():,.0f}")
+with span("kpis", sink=timings):
+    kpi1.metric("Average Price (Filtered)", f"${index.mean_price(price_filter):,.0f}")
+    kpi2.metric("Most Expensive Suburb", index.most_expensive_suburb(price_filter))
+    kpi3.metric("Data Sample Size", f"{n_filtered} Records")
 
-if "Suburb" in filtered_df.columns and len(filtered_df) > 0:
-    kpi2.metric("Most Expensive Suburb", filtered_df.loc[filtered_df["Price"].idxmax()]["Suburb"])
+# =========================
+# Market by area (aggregate cube)
+# =========================
+st.markdown("---")
+st.subheader("🏘️ Market by Area")
+area_col, type_col, month_col = st.columns(3)
+group_by = area_col.selectbox("Group by", ["Regionname", "CouncilArea", "Suburb", "Type"])
+types = type_col.multiselect("Property type", market.dimension_values("Type"))
+months = market.dimension_values("sale_month")
+month_range = month_col.select_slider("Sale months", options=months, value=(months[0], months[-1]))
+
+# Roll-ups of the pre-aggregated cells, not scans of the sales
+with span("market_query", sink=timings, by=group_by):
+    where = {"months": month_range, "Type": types or None}
+    prices = market.query([group_by], "Price", **where)
+    units = market.query([group_by], "Unit_Price", **where)
+    trend = market.query(["sale_month"], "Price", **where)
+
+area_table = prices.merge(units[[group_by, "p50"]], on=group_by, how="left", suffixes=("", "_unit"))
+st.dataframe(
+    area_table.sort_values("count", ascending=False),
+    hide_index=True,
+    column_config={
+        "count": "Sales",
+        "mean": st.column_config.NumberColumn("Average Price", format="dollar"),
+        "std": st.column_config.NumberColumn("Price Std Dev", format="dollar"),
+        "p50": st.column_config.NumberColumn("Median Price", format="dollar"),
+        "p50_unit": st.column_config.NumberColumn("Median Price/sqm", format="dollar"),
+    },
+)
+st.line_chart(trend.set_index("sale_month")["p50"], x_label="Sale month", y_label="Median Price")
+st.caption("All sales in the dataset (the budget filter does not apply). Medians come from mergeable sketches, within 1%.")
+
+# =========================
+# Comparable sales of the clicked tile
+# =========================
+st.markdown("---")
+st.subheader("🏠 Comparable Sales")
+selected = map_event["selection"]["objects"].get("tiles", []) if map_event else []
+
+if not selected:
+    st.info("Click a map tile to see the most similar recent sales around it.")
 else:
-    kpi2.metric("Most Expensive Suburb", "N/A")
+    tile = selected[0]
+    type_in, rooms_in, bath_in, land_in, k_in = st.columns(5)
+    listing = pd.DataFrame([{
+        "Lattitude": tile["Latitude"],
+        "Longtitude": tile["Longitude"],
+        "Type": type_in.selectbox("Type", comps_index.types),
+        "Rooms": rooms_in.number_input("Rooms", 1, 10, 3),
+        "Bathroom": bath_in.number_input("Bathrooms", 1, 8, 1),
+        "Landsize": land_in.number_input("Landsize (sqm)", 0, 5000, 500, step=50),
+    }])
+    k = k_in.slider("Comps", 3, 20, 5)
+
+    # Tree lookup + re-rank of the nearest candidates, not a scan of the sales
+    with span("comps", sink=timings, k=k):
+        tile_comps = comps_index.query(listing, k)
+
+    if tile_comps.empty:
+        st.warning("No sales near this tile.")
+    else:
+        st.metric("Comps estimate (similarity-weighted)", f"${comps.comps_estimate(tile_comps).iloc[0]:,.0f}")
+        st.dataframe(
+            tile_comps.drop(columns=["listing", "Lattitude", "Longtitude"]),
+            hide_index=True,
+            column_config={
+                "rank": "Rank",
+                "similarity": st.column_config.NumberColumn("Similarity", format="%.3f"),
+                "km": st.column_config.NumberColumn("Distance (km)", format="%.2f"),
+                "Date": st.column_config.DateColumn("Sold"),
+                "Price": st.column_config.NumberColumn("Price", format="dollar"),
+            },
+        )
+        st.caption(f"Tile centre ({tile['Latitude']:.4f}, {tile['Longitude']:.4f}). "
+                   f"Similarity decays with distance, feature differences and a {comps.HALF_LIFE_DAYS}-day recency half-life.")
 
-kpi3.metric("Data Sample Size", f"{len(filtered_df)} Records")
+# =========================
+# Debug: timings of this rerun
+# =========================
+with timings_panel:
+    st.dataframe(
+        pd.DataFrame(
+            {
+                "step": r["name"],
+                "wall_ms": round(1000 * r["wall_s"], 2),
+                "cpu_ms": round(1000 * r["cpu_s"], 2),
+                "rss_mb": r["rss_mb"],
+                "rss_delta_mb": r["rss_delta_mb"],
+            }
+            for r in timings
+        ),
+        hide_index=True,
+    )
+    st.caption(f"Total: {1000 * sum(r['wall_s'] for r in timings):.1f} ms. Full trace: PROFILE_TRACE=1 writes output/reports/trace.jsonl")
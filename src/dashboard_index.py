@@ -0,0 +1,254 @@
+"""
+Compact data frame, pre-computed budget index and map tiles for the
+Streamlit dashboard.
+
+The cleaned frame keeps only the five columns the dashboard shows, downcast
+to int32/float32/category, and is stored as an uncompressed Feather file that
+every session memory-maps instead of re-parsing and copying the CSV.
+
+The dashboard's budget slider asks "everything with Price <= budget". Instead
+of scanning and resampling the frame on every slider move, this module builds
+once:
+
+- a price-sorted copy of the rows with a running sum of Price, so the KPIs
+  (count, average price, most expensive suburb) are a binary search away
+- a grid of map tiles (GRID_DEG x GRID_DEG cells, geohash-style) with count,
+  mean and 5/50/95% quantiles of Unit_Price per cell, pre-aggregated for every
+  budget band of PRICE_STEP, plus the colour columns the map layer uses
+
+A budget filter is then a searchsorted on the band edges plus a tile lookup.
+The frame and the index are saved under output/cache/, keyed by the source
+file hash.
+
+Usage:
+    python src/dashboard_index.py      # pre-build the frame + index for melb_data.csv
+"""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from paths import CACHE_DIR
+
+PRICE_STEP = 50_000   # slider step and budget band width
+GRID_DEG = 0.01       # tile size in degrees (~1 km)
+FRAME_VERSION = 1     # bump when load_frame() changes
+INDEX_VERSION = 2
+
+
+# =========================
+# Compact dashboard frame
+# =========================
+# Only these reach the dashboard; the coordinate typos are renamed on load
+FRAME_COLUMNS = ["Suburb", "Price", "Latitude", "Longitude", "Unit_Price"]
+RAW_COLUMNS = {"Suburb", "Price", "Lattitude", "Longtitude", "Latitude", "Longitude",
+               "Unit_Price", "Landsize", "LandSize", "Land_Size", "landsize"}
+FRAME_DTYPES = {"Price": "int32", "Latitude": "float32", "Longitude": "float32", "Unit_Price": "float32"}
+
+
+def load_frame(csv_path):
+    """
+    Load and clean the dataset the way the dashboard shows it: fixed
+    coordinate column names, Price < 3M and the Melbourne bounding box.
+
+    Only the columns the dashboard uses are parsed, and the result is
+    downcast to int32/float32/category. Raises ValueError if a required
+    column is missing.
+    """
+    df = pd.read_csv(csv_path, usecols=lambda c: c in RAW_COLUMNS, dtype={"Suburb": "category"})
+
+    # "Lattitude" / "Longtitude" are typos in the source dataset
+    col_map = {}
+    if "Lattitude" in df.columns and "Latitude" not in df.columns:
+        col_map["Lattitude"] = "Latitude"
+    if "Longtitude" in df.columns and "Longitude" not in df.columns:
+        col_map["Longtitude"] = "Longitude"
+    if col_map:
+        df = df.rename(columns=col_map)
+
+    required = ["Latitude", "Longitude", "Price"]
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}\nAvailable columns: {list(df.columns)}")
+
+    for col in required:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # Unit_Price = Price per sqm of land; invalid land sizes (<=0) give NA
+    if "Unit_Price" not in df.columns:
+        land_candidates = ["Landsize", "LandSize", "Land_Size", "landsize"]
+        land_col = next((c for c in land_candidates if c in df.columns), None)
+        if land_col is not None:
+            land = pd.to_numeric(df[land_col], errors="coerce")
+            df["Unit_Price"] = (df["Price"] / land).where(land > 0)
+        else:
+            # Fallback if no land size: use Price (still allows visual encoding)
+            df["Unit_Price"] = df["Price"]
+    df["Unit_Price"] = pd.to_numeric(df["Unit_Price"], errors="coerce")
+
+    df = df.dropna(subset=["Latitude", "Longitude", "Price"])
+    df = df[df["Price"] < 3_000_000]
+    df = df[df["Latitude"].between(-38.5, -37.3) & df["Longitude"].between(144.3, 145.6)]
+
+    if "Suburb" not in df.columns:
+        df["Suburb"] = pd.Categorical(["N/A"] * len(df))
+    df = df[FRAME_COLUMNS].astype(FRAME_DTYPES).reset_index(drop=True)
+    df["Suburb"] = df["Suburb"].cat.remove_unused_categories()
+    return df
+
+
+def frame_cache_path(source_key):
+    return CACHE_DIR / f"dashboard_frame_v{FRAME_VERSION}_{source_key}.feather"
+
+
+def load_frame_cached(csv_path, source_key, refresh=False):
+    """
+    Cleaned dashboard frame, memory-mapped from an uncompressed Feather file.
+
+    NaNs are stored as NaN (not Arrow nulls) so the numeric columns convert
+    to pandas without a copy; the returned arrays are read-only views of
+    the mapped file.
+    """
+    cache_path = frame_cache_path(source_key)
+    if refresh or not cache_path.exists():
+        df = load_frame(csv_path)
+        table = pa.table({
+            col: (pa.DictionaryArray.from_pandas(df[col]) if col == "Suburb"
+                  else pa.array(df[col].to_numpy(), from_pandas=False))
+            for col in FRAME_COLUMNS
+        })
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+
+    table = feather.read_table(cache_path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+# =========================
+# Budget index
+# =========================
+def colour_columns(values, low, high):
+    """Winsorise to [low, high], normalise to 0-1 and map low -> blue, high -> red."""
+    v = np.clip(values, low, high)
+    denom = high - low
+    norm = np.full(len(v), 0.5) if denom == 0 else (v - low) / denom
+    norm = np.nan_to_num(norm, nan=0.5)
+    return {
+        "_v": norm,
+        "_r": np.round(255 * norm).astype("int32"),
+        "_g": np.round(80 * (1 - norm)).astype("int32"),
+        "_b": np.round(255 * (1 - norm)).astype("int32"),
+    }
+
+
+class BudgetIndex:
+    def __init__(self, prices, cum_price, suburbs, edges, bands, tiles):
+        self.prices = prices        # float64[n], sorted ascending
+        self.cum_price = cum_price  # float64[n], running sum of prices
+        self.suburbs = suburbs      # object[n], aligned with prices
+        self.edges = edges          # float64[n_bands], upper budget of each band
+        self.bands = bands          # DataFrame per band: edge, q05, q95 of Unit_Price
+        self.tiles = tiles          # DataFrame per (band, cell), sorted by band
+
+    # ---------- build ----------
+    @classmethod
+    def build(cls, df, price_step=PRICE_STEP, grid_deg=GRID_DEG):
+        df = df.sort_values("Price", kind="mergesort")
+        prices = df["Price"].to_numpy(dtype=np.float64)
+        suburbs = df["Suburb"].astype(str).to_numpy()
+
+        lo = np.floor(prices[0] / price_step) * price_step
+        hi = np.ceil(prices[-1] / price_step) * price_step
+        edges = np.arange(lo, hi + price_step, price_step)
+        # Rows in band b are the prefix prices <= edges[b]
+        prefix = np.searchsorted(prices, edges, side="right")
+
+        unit = df["Unit_Price"].to_numpy(dtype=np.float64)
+        valid = np.isfinite(unit)
+        cell_lat = np.floor(df["Latitude"].to_numpy() / grid_deg).astype(np.int64)
+        cell_lon = np.floor(df["Longitude"].to_numpy() / grid_deg).astype(np.int64)
+
+        band_rows, tile_frames = [], []
+        for b, n in enumerate(prefix):
+            keep = valid[:n]
+            sub = pd.DataFrame({
+                "cell_lat": cell_lat[:n][keep],
+                "cell_lon": cell_lon[:n][keep],
+                "Unit_Price": unit[:n][keep],
+            })
+            if sub.empty:
+                band_rows.append((edges[b], np.nan, np.nan))
+                continue
+            q05, q95 = sub["Unit_Price"].quantile([0.05, 0.95])
+            band_rows.append((edges[b], q05, q95))
+
+            g = sub.groupby(["cell_lat", "cell_lon"])["Unit_Price"]
+            tiles = g.agg(count="count", mean="mean").join(
+                g.quantile([0.05, 0.5, 0.95]).unstack().set_axis(["q05", "q50", "q95"], axis=1)
+            ).reset_index()
+            tiles["band"] = b
+            tiles["Latitude"] = (tiles["cell_lat"] + 0.5) * grid_deg
+            tiles["Longitude"] = (tiles["cell_lon"] + 0.5) * grid_deg
+            for col, values in colour_columns(tiles["q50"].to_numpy(), q05, q95).items():
+                tiles[col] = values
+            tile_frames.append(tiles)
+
+        bands = pd.DataFrame(band_rows, columns=["edge", "q05", "q95"])
+        tiles = pd.concat(tile_frames, ignore_index=True).sort_values("band", kind="mergesort")
+        return cls(prices, np.cumsum(prices), suburbs, edges, bands, tiles.reset_index(drop=True))
+
+    @classmethod
+    def load_or_build(cls, df, source_key):
+        """Load the saved index for `source_key` (e.g. the CSV hash) or build and save it."""
+        path = CACHE_DIR / f"dashboard_index_v{INDEX_VERSION}_{source_key}.joblib"
+        if path.exists():
+            return joblib.load(path)
+        index = cls.build(df)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        joblib.dump(index, tmp_path)
+        os.replace(tmp_path, path)
+        return index
+
+    # ---------- queries ----------
+    def count(self, budget):
+        return int(np.searchsorted(self.prices, budget, side="right"))
+
+    def mean_price(self, budget):
+        n = self.count(budget)
+        return self.cum_price[n - 1] / n if n else float("nan")
+
+    def most_expensive_suburb(self, budget):
+        n = self.count(budget)
+        return self.suburbs[n - 1] if n else "N/A"
+
+    def band(self, budget):
+        """Largest band whose edge is <= budget (budgets are snapped down to PRICE_STEP)."""
+        return max(int(np.searchsorted(self.edges, budget, side="right")) - 1, 0)
+
+    def tiles_for(self, budget):
+        b = self.band(budget)
+        band_col = self.tiles["band"].to_numpy()
+        start, stop = np.searchsorted(band_col, [b, b + 1])
+        return self.tiles.iloc[start:stop]
+
+
+if __name__ == "__main__":
+    import time
+
+    import dashboard_index  # pickle the class under its module name, not __main__
+    from features import file_hash
+    from paths import find_data_csv
+
+    csv_path = find_data_csv()
+    start = time.perf_counter()
+    source_key = file_hash(csv_path)
+    df = load_frame_cached(csv_path, source_key)
+    index = dashboard_index.BudgetIndex.load_or_build(df, source_key)
+    print(f"✅ Budget index ready: {len(index.prices):,} rows, {len(index.edges)} bands, "
+          f"{len(index.tiles):,} tiles ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,302 @@
+"""
+Per-listing price attributions for the saved forest (path-dependent TreeSHAP).
+
+Each listing gets a dollar contribution per input feature, and
+Base_Price + contributions = Predicted_Price exactly (local accuracy).
+Base_Price is the forest's average prediction over its training samples.
+The values are the Shapley values TreeSHAP defines from the trees and their
+training-sample covers, so there is no background data set and no extra
+predict calls. The three one-hot Type_* columns are scored as one player,
+so the output uses the FEATURES_SLIM names.
+
+Every leaf of the flattened forest (forest_engine.FlatForest) is
+precomputed once as a box (bin range per encoded column), plus, per
+feature, z = the share of training samples that passed that feature's splits
+on the way down. For a listing, o_i = 1 if it lies inside the box along
+feature i. The leaf then adds to feature i
+
+    v * (o_i - z_i) * integral_0^1 prod_{j != i} ((1 - s) z_j + o_j s) ds
+
+The integrand is a polynomial of degree n_features - 1, so Gauss-Legendre
+quadrature with ceil(n_features / 2) nodes is exact. For one tree and a
+block of listings this is a few NumPy operations over
+(features x listings x leaves) arrays, with no Python loop over leaves or
+paths. Trees are split across threads.
+
+Usage:
+    python src/explain.py listings.csv attributions.csv --keep Address
+    python src/explain.py --sample 5                # explain random sales from melb_data.csv
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from forest_engine import CompiledPipeline, node_covers, sample_inputs
+from importance import encoded_groups
+from predict import DEFAULT_MODEL, PREDICTION_COL, PredictionWriter, iter_chunks, load_model, model_inputs
+from profiling import timed
+
+BASE_COL = "Base_Price"
+CONTRIB_PREFIX = "Contrib_"
+ROW_BLOCK = 8  # listings per work block; keeps one tree's (features x rows x leaves) arrays in cache
+
+
+def contrib_columns(names):
+    return [f"{CONTRIB_PREFIX}{name}" for name in names]
+
+
+# =========================
+# Explainer
+# =========================
+class TreeExplainer:
+    """
+    TreeSHAP attributions for a CompiledPipeline, one player per raw feature
+    (all one-hot columns of a categorical move together). `cover` is the
+    training-sample weight per node (forest_engine.node_covers).
+    """
+
+    def __init__(self, compiled, cover, n_jobs=1):
+        forest = compiled.forest
+        self.compiled = compiled
+        self.groups = encoded_groups(compiled.preprocessor)   # feature -> encoded columns
+        self.names = list(self.groups)
+        self.n_jobs = n_jobs
+
+        # Gauss-Legendre nodes/weights on [0, 1], exact for the degree n_features - 1 integrand
+        nodes, weights = np.polynomial.legendre.leggauss((len(self.names) + 1) // 2)
+        self.s, self.w = (nodes + 1) / 2, weights / 2
+        self._build_leaves(forest, cover)
+
+    @classmethod
+    def from_model(cls, model, n_jobs=1, model_path=None):
+        """
+        Explainer for a forest Pipeline or a CompiledPipeline. Node covers come
+        from the sklearn trees, or from the cover array of the artifact at
+        `model_path` (scoring models never load them).
+        """
+        if isinstance(model, CompiledPipeline):
+            # Flat pickles exported before covers left the scoring layout still carry them
+            cover = getattr(model.forest, "cover", None)
+            if cover is None and model_path is not None and Path(model_path).is_dir():
+                from artifact import load_covers
+                cover = load_covers(model_path)
+            if cover is None:
+                raise ValueError("No node covers for this compiled forest; explain the .pkl Pipeline "
+                                 "or an artifact saved with cover.npy (artifact.py save)")
+            return cls(model, cover, n_jobs=n_jobs)
+        if not isinstance(model.named_steps["model"], RandomForestRegressor):
+            raise ValueError("Attributions need a Random Forest model (TreeSHAP over its flattened trees)")
+        return cls(CompiledPipeline.from_pipeline(model), node_covers(model.named_steps["model"]), n_jobs=n_jobs)
+
+    def _build_leaves(self, forest, cover):
+        """
+        Walk all trees level by level (every node of a level at once) and
+        collect, per leaf: its tree, value, bin box and per-feature z.
+        """
+        n_cols, n_groups = len(forest.bin_edges), len(self.names)
+        group_of = np.empty(n_cols, dtype=np.int64)
+        for g, name in enumerate(self.names):
+            group_of[self.groups[name]] = g
+
+        children = forest.children
+        internal = children[:, 0] != np.arange(len(children))
+        node = np.asarray(forest.roots, dtype=np.int64)
+        tree = np.arange(forest.n_trees)
+        lo = np.full((len(node), n_cols), -1, dtype=np.int32)
+        hi = np.full((len(node), n_cols), max(len(e) for e in forest.bin_edges), dtype=np.int32)
+        z = np.ones((len(node), n_groups))
+
+        found = []
+        while node.size:
+            leaf = ~internal[node]
+            found.append((node[leaf], tree[leaf], lo[leaf], hi[leaf], z[leaf]))
+            node, tree, lo, hi, z = node[~leaf], tree[~leaf], lo[~leaf], hi[~leaf], z[~leaf]
+
+            # Rows go right when bin(x) > split_bin: left narrows hi, right raises lo
+            r = np.arange(len(node))
+            col, split = forest.feature[node], forest.split_bin[node].astype(np.int32)
+            left, right = children[node, 0], children[node, 1]
+            g = group_of[col]
+            lo_left, hi_left, z_left = lo, hi.copy(), z.copy()
+            hi_left[r, col] = np.minimum(hi[r, col], split)
+            z_left[r, g] *= cover[left] / cover[node]
+            lo_right, z_right = lo.copy(), z
+            lo_right[r, col] = np.maximum(lo[r, col], split)
+            z_right[r, g] *= cover[right] / cover[node]
+
+            node = np.concatenate([left, right]).astype(np.int64)
+            tree = np.concatenate([tree, tree])
+            lo, hi, z = np.concatenate([lo_left, lo_right]), np.concatenate([hi_left, hi]), np.concatenate([z_left, z_right])
+
+        node, tree, lo, hi, z = (np.concatenate(parts) for parts in zip(*found))
+        order = np.argsort(tree, kind="stable")
+        self.tree_start = np.searchsorted(tree[order], np.arange(forest.n_trees + 1))
+        self.leaf_value = forest.value[node[order]]
+        self.leaf_lo = np.ascontiguousarray(lo[order].T)   # int32[n_cols, n_leaves]
+        self.leaf_hi = np.ascontiguousarray(hi[order].T)
+        self.leaf_z = np.ascontiguousarray(z[order].T)     # float64[n_features, n_leaves]
+        # E[f] = sum over leaves of value * P(reaching it), averaged over trees
+        self.base_value = float(self.leaf_value @ self.leaf_z.prod(axis=0)) / forest.n_trees
+
+    def _tree_terms(self, t):
+        """Row-independent factors of tree t's leaves, per quadrature node q."""
+        a, b = self.tree_start[t], self.tree_start[t + 1]
+        s, w = self.s[:, None, None], self.w[:, None]
+        z, v = self.leaf_z[:, a:b], self.leaf_value[a:b]
+        off = (1 - s) * z            # (1 - s) z_j      (o_j = 0)
+        on = off + s                 # (1 - s) z_j + s  (o_j = 1)
+        log_off = np.log(off)
+        return {
+            "slice": slice(a, b),
+            # log of the product over j: log_base + sum_j o_j * log_step
+            "log_base": log_off.sum(axis=1) + np.log(w),
+            "log_step": np.log(on) - log_off,
+            # o_i = 1: (1 - z_i) / factor_i; the o_i = 0 term, -z_i / factor_i = -1 / (1 - s),
+            # is folded in as +1 / (1 - s) here and subtracted once per row below
+            "weight_on": ((1 - z) / on + 1 / (1 - s)) * v,
+            "weight_off": v / (1 - s[:, :, 0]),
+        }
+
+    def _explain_trees(self, xb, trees, phi):
+        n_rows = len(xb)
+        for t in trees:
+            terms = self._tree_terms(t)
+            sl = terms["slice"]
+            lo, hi = self.leaf_lo[:, sl], self.leaf_hi[:, sl]
+            for start in range(0, n_rows, ROW_BLOCK):
+                rows = slice(start, start + ROW_BLOCK)
+                x = xb[rows]
+                # o[i, row, leaf]: inside the leaf's box along every column of feature i
+                o = np.empty((len(self.names), len(x), lo.shape[1]))
+                for i, name in enumerate(self.names):
+                    inside = None
+                    for col in self.groups[name]:
+                        c = x[:, col, None]
+                        step = (c > lo[col]) & (c <= hi[col])
+                        inside = step if inside is None else inside & step
+                    o[i] = inside
+                prod = np.exp(terms["log_base"][:, None, :] + np.einsum("irl,qil->qrl", o, terms["log_step"]))
+                acc = np.einsum("qrl,qil->irl", prod, terms["weight_on"])
+                phi[:, rows] += np.einsum("irl,irl->ir", o, acc) - np.einsum("qrl,ql->r", prod, terms["weight_off"])
+
+    def shap_values(self, Xt):
+        """Attributions of preprocessed rows: float64[n_rows, n_features] (sum + base_value = prediction)."""
+        forest = self.compiled.forest
+        xb = np.ascontiguousarray(forest.binned(Xt))
+        n_trees = forest.n_trees
+        if self.n_jobs <= 1:
+            phi = np.zeros((len(self.names), len(xb)))
+            self._explain_trees(xb, range(n_trees), phi)
+        else:
+            # One accumulator per thread; NumPy releases the GIL in the array work
+            parts = [np.zeros((len(self.names), len(xb))) for _ in range(self.n_jobs)]
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                list(pool.map(lambda i: self._explain_trees(xb, range(i, n_trees, self.n_jobs), parts[i]),
+                              range(self.n_jobs)))
+            phi = sum(parts)
+        return phi.T / n_trees
+
+    def explain(self, X, check=True):
+        """Predicted_Price, Base_Price and one Contrib_<feature> column per feature for raw listings."""
+        Xt = self.compiled.transform(X)
+        phi = self.shap_values(Xt)
+        pred = self.compiled.forest.predict(Xt, n_jobs=self.n_jobs)
+        if check:
+            local_accuracy(self.base_value, phi, pred)
+        out = pd.DataFrame(phi, columns=contrib_columns(self.names), index=X.index)
+        out.insert(0, BASE_COL, self.base_value)
+        out.insert(0, PREDICTION_COL, pred)
+        return out
+
+
+def local_accuracy(base_value, phi, pred, rtol=1e-6):
+    """Max relative gap between base + attributions and the prediction; raises if above rtol."""
+    rel = np.max(np.abs(base_value + phi.sum(axis=1) - pred) / np.maximum(np.abs(pred), 1.0), initial=0.0)
+    if rel > rtol:
+        raise AssertionError(f"Attributions do not add up to the prediction: max relative error {rel:.3g}")
+    return rel
+
+
+# =========================
+# Driver
+# =========================
+@timed("explain_file")
+def explain_file(input_path, output_path, model_path=DEFAULT_MODEL, chunksize=5_000, keep=(), n_jobs=1):
+    """Stream `input_path` through the explainer into `output_path`; returns the row count."""
+    explainer = TreeExplainer.from_model(load_model(model_path), n_jobs=n_jobs, model_path=model_path)
+    columns = model_inputs(explainer.compiled)
+    writer = PredictionWriter(output_path, list(keep) + [PREDICTION_COL, BASE_COL] + contrib_columns(explainer.names))
+    n_rows = 0
+    try:
+        for chunk in iter_chunks(input_path, columns, chunksize, keep):
+            result = explainer.explain(chunk.reindex(columns=columns))
+            writer.write(pd.concat([chunk[list(keep)], result], axis=1))
+            n_rows += len(result)
+    finally:
+        writer.close()
+    return n_rows
+
+
+def print_listing(row, names, top=5):
+    """Prediction plus its largest contributions, e.g. 'Rooms  +$381,263'."""
+    contribs = row[contrib_columns(names)].set_axis(names)
+    print(f"Predicted ${row[PREDICTION_COL]:,.0f} = base ${row[BASE_COL]:,.0f}")
+    for name, value in contribs.reindex(contribs.abs().sort_values(ascending=False).index[:top]).items():
+        sign = "+" if value >= 0 else "-"
+        print(f"   {name:<14} {sign}${abs(value):,.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-listing price attributions (TreeSHAP) for the saved forest.")
+    parser.add_argument("input", nargs="?", help="Listings file (.csv or .parquet)")
+    parser.add_argument("output", nargs="?", help="Attributions file (.csv or .parquet)")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL),
+                        help="Path to melbourne_housing_model.pkl or a model artifact directory")
+    parser.add_argument("--chunksize", type=int, default=5_000, help="Listings per chunk")
+    parser.add_argument("--keep", nargs="*", default=[], help="Input columns to copy to the output (e.g. Address)")
+    parser.add_argument("--jobs", type=int, default=1, help="Threads to split the trees across")
+    parser.add_argument("--sample", type=int, default=0, help="Explain this many random sales from melb_data.csv")
+    parser.add_argument("--top", type=int, default=5, help="Contributions shown per sampled listing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if not args.sample and not (args.input and args.output):
+        parser.error("give an input and an output file, or --sample N")
+    if not Path(args.model).exists():
+        print(f"❌ Model not found: {args.model} (run 7_final_optimization.py first)")
+        sys.exit(1)
+
+    if args.input:
+        start = time.perf_counter()
+        n_rows = explain_file(args.input, args.output, args.model, args.chunksize, args.keep, args.jobs)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Explained {n_rows:,} listings -> {args.output} ({elapsed:.1f}s, {n_rows / elapsed:,.0f} listings/s)")
+        return
+
+    start = time.perf_counter()
+    explainer = TreeExplainer.from_model(load_model(args.model), n_jobs=args.jobs, model_path=args.model)
+    setup = time.perf_counter() - start
+    X = sample_inputs(explainer.compiled, args.sample, seed=args.seed)
+    start = time.perf_counter()
+    result = explainer.explain(X)
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print(f"🔎 PRICE ATTRIBUTIONS ({len(explainer.leaf_value):,} leaves, {len(explainer.names)} features)")
+    print("=" * 40)
+    for i, (_, row) in enumerate(result.iterrows()):
+        listing = X.iloc[i]
+        print(f"\n#{i + 1}: {listing['Rooms']:.0f}-room {listing['Type']}, {listing['Distance']:.1f} km from CBD")
+        print_listing(row, explainer.names, args.top)
+    print("-" * 40)
+    print(f"Setup {setup:.2f}s | {len(X)} listings in {elapsed:.2f}s ({1000 * elapsed / len(X):.0f} ms/listing)")
+    print("Local accuracy: base + contributions = prediction for every listing")
+
+
+if __name__ == "__main__":
+    main()
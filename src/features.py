@@ -0,0 +1,204 @@
+"""
+Shared feature engineering for the modelling scripts.
+
+The raw CSV is parsed and cleaned once (Date -> Year, median fills,
+House_Age) and the result is stored as an uncompressed Feather file keyed by
+a hash of the source file. Later runs memory-map that file instead of
+re-parsing the text.
+
+HousingFeatures does the same Year/House_Age/median-fill work as a fitted
+sklearn transformer, so cross-validation learns the medians per fold and the
+saved pipeline carries its own preprocessing.
+"""
+import hashlib
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from paths import CACHE_DIR, find_data_csv
+from profiling import span
+
+# Bump when engineer() changes so stale caches are not reused.
+CACHE_VERSION = 1
+
+CATEGORICAL_COLS = ["Type", "Suburb", "Regionname"]
+
+
+# =========================
+# Hashing
+# =========================
+def file_hash(path, chunk_size=1 << 20):
+    """Content hash of a file, read in 1 MB chunks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# =========================
+# Feature engineering
+# =========================
+def engineer(df, impute=True):
+    """
+    Apply the standard cleaning used by every stage script.
+
+    - Date is parsed (day first) and Year extracted
+    - YearBuilt, Landsize and BuildingArea are median-filled
+    - House_Age = Year - YearBuilt
+    - Type/Suburb/Regionname become categoricals
+
+    With impute=False the median fills and House_Age are skipped; use this
+    for frames that go through HousingFeatures inside a Pipeline.
+    """
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"], dayfirst=True)
+    df["Year"] = df["Date"].dt.year
+
+    for col in ["YearBuilt", "Landsize", "BuildingArea"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+        if impute:
+            df[col] = df[col].fillna(df[col].median())
+    if impute:
+        df["House_Age"] = df["Year"] - df["YearBuilt"]
+
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+# =========================
+# Cached loader
+# =========================
+def cache_path_for(csv_path, impute=True):
+    variant = "clean" if impute else "raw"
+    return CACHE_DIR / f"features_v{CACHE_VERSION}_{variant}_{file_hash(csv_path)}.feather"
+
+
+def load_features(csv_path=None, impute=True, refresh=False):
+    """
+    Return the engineered frame for melb_data.csv.
+
+    The first call for a given source file writes the cache; subsequent calls
+    memory-map it. Pass refresh=True to force a rebuild.
+    """
+    csv_path = find_data_csv() if csv_path is None else csv_path
+    cache_path = cache_path_for(csv_path, impute=impute)
+
+    if cache_path.exists() and not refresh:
+        with span("load_features", cached=True, impute=impute):
+            table = feather.read_table(cache_path, memory_map=True)
+            return table.to_pandas()
+
+    with span("load_features", cached=False, impute=impute):
+        with span("read_csv"):
+            raw = pd.read_csv(csv_path)
+        with span("engineer"):
+            df = engineer(raw, impute=impute)
+
+        # Write to a temp file first so a crashed run never leaves a half-written cache
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+    return df
+
+
+# =========================
+# Pipeline transformer
+# =========================
+# Columns derived inside HousingFeatures rather than read as-is
+DERIVED_COLS = ["Year", "House_Age"]
+
+
+def source_columns(columns):
+    """Raw input columns HousingFeatures needs to produce `columns`."""
+    sources = [c for c in columns if c not in DERIVED_COLS]
+    if "Year" in columns or "House_Age" in columns:
+        sources.append("Date")
+    if "House_Age" in columns:
+        sources += ["YearBuilt", "House_Age"]
+    return list(dict.fromkeys(sources))
+
+
+def _years(X):
+    if "Date" not in X.columns:
+        return np.full(len(X), np.nan, dtype=np.float32)
+    dates = X["Date"]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, dayfirst=True, errors="coerce")
+    return dates.dt.year.to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+class HousingFeatures(BaseEstimator, TransformerMixin):
+    """
+    Numeric feature block for the model pipelines.
+
+    Builds one float32 array holding the requested numeric columns plus the
+    Year/YearBuilt/House_Age helpers, fills NaNs with the medians learned in
+    fit() and derives House_Age = Year - YearBuilt where it was not supplied.
+    A supplied House_Age (e.g. from a scoring request) is used as-is.
+
+    With impute=False NaNs are left in place (House_Age is still derived where
+    both Year and YearBuilt are known), for models with native missing-value
+    support.
+    """
+
+    def __init__(self, columns=None, impute=True):
+        self.columns = columns
+        self.impute = impute
+
+    def _block(self, X):
+        base = [c for c in self.columns if c not in DERIVED_COLS]
+        layout = base + ["Year", "YearBuilt", "House_Age"]
+        block = np.empty((len(X), len(layout)), dtype=np.float32)
+        for j, col in enumerate(layout):
+            if col == "Year":
+                block[:, j] = _years(X)
+            elif col in X.columns:
+                block[:, j] = pd.to_numeric(X[col], errors="coerce").to_numpy(
+                    dtype=np.float32, na_value=np.nan
+                )
+            else:
+                block[:, j] = np.nan
+        return block, layout
+
+    def fit(self, X, y=None):
+        block, _ = self._block(X)
+        with warnings.catch_warnings():
+            # All-NaN columns (e.g. House_Age when only Date/YearBuilt are given)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medians = np.nanmedian(block, axis=0)
+        self.medians_ = np.nan_to_num(medians, nan=0.0).astype(np.float32)
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def transform(self, X):
+        return self.transform_block(*self._block(X))
+
+    def transform_block(self, block, layout):
+        """transform() of a _block() array (modified in place)."""
+        n_base = len(layout) - 3
+        i_year, i_built, i_age = n_base, n_base + 1, n_base + 2
+
+        age_missing = np.isnan(block[:, i_age])
+        if self.impute:
+            np.copyto(block, self.medians_, where=np.isnan(block))
+        block[age_missing, i_age] = block[age_missing, i_year] - block[age_missing, i_built]
+
+        return block[:, [layout.index(c) for c in self.columns]]
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray(self.columns, dtype=object)
+
+
+if __name__ == "__main__":
+    # Build (or check) both cached variants; src/orchestrate.py runs this as its first stage
+    for impute in (True, False):
+        df = load_features(impute=impute)
+        print(f"✅ Features ({'clean' if impute else 'raw'}): {len(df):,} rows -> {cache_path_for(find_data_csv(), impute)}")
@@ -0,0 +1,420 @@
+"""
+Flat-array inference engine for the production Random Forest.
+
+export() flattens every fitted tree of the pipeline's RandomForestRegressor
+into one packed node table (left, right, split feature, split bin: one
+16-byte int32 record per node) plus the leaf values, and wraps it with the
+fitted preprocessor.
+The resulting CompiledPipeline is a drop-in replacement for the sklearn
+Pipeline in predict.py / serve.py: it exposes predict() and feature_names_in_,
+and pickles to a fraction of the size. predict_quantiles() returns the mean
+plus percentiles of the per-tree predictions from the same single traversal,
+as predict.ForestIntervals does for the sklearn Pipeline.
+
+Traversal runs one tree at a time over all rows. With numba installed, a
+compiled kernel walks groups of ROW_GROUP rows through the tree in lockstep
+over the node table. The interleaved walks hide the memory latency of each
+node visit. Without numba, the same traversal falls back to NumPy: all rows
+step down one level at a time with array gathers into the same table, and
+rows that have reached a leaf drop out of the active set.
+
+Measured on the 100-tree production model, 100,000 rows, one core:
+- sklearn Pipeline.predict:  2.0-2.7 s
+- numba kernel:              0.8-1.4 s (1.8-2.4x faster)
+- NumPy fallback:            2.5-3.6 s (0.7-0.8x, slower than sklearn)
+- pickle size:               40.9 MB flat vs 120.6 MB sklearn
+numba is an optional extra, not in requirements.txt (`pip install numba`).
+Without it, the engine is only worth it for its smaller, mmap-able layout
+(artifact.py).
+
+Usage:
+    python src/forest_engine.py export              # writes melbourne_housing_model.flat.pkl
+    python src/forest_engine.py bench --rows 100000
+"""
+import argparse
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from paths import MODEL_DIR, find_data_csv
+from predict import DEFAULT_MODEL, load_model, percentiles
+
+try:
+    import numba
+except ImportError:  # optional: NumPy traversal instead of the compiled kernel
+    numba = None
+
+DEFAULT_FLAT_MODEL = MODEL_DIR / "melbourne_housing_model.flat.pkl"
+ROW_GROUP = 16      # rows walked in lockstep by the numba kernel
+LEAF_CHECK = 4      # kernel steps between "all rows on a leaf?" checks
+
+
+# =========================
+# Compiled kernel (numba)
+# =========================
+def _leaves_kernel(Xb, nodes, roots, out):
+    """
+    Leaf id per (tree, row) into out[n_trees, n_rows]. nodes is int32[n_nodes, 4]:
+    (left, right, feature, split bin); leaves point to themselves.
+    """
+    n = Xb.shape[0]
+    node = np.empty(ROW_GROUP, dtype=np.int32)
+    for t in range(roots.shape[0]):
+        for lo in range(0, n, ROW_GROUP):
+            m = min(ROW_GROUP, n - lo)
+            node[:m] = roots[t]
+            while True:
+                for _ in range(LEAF_CHECK):
+                    for r in range(m):
+                        nd = node[r]
+                        node[r] = nodes[nd, np.int32(Xb[lo + r, nodes[nd, 2]] > nodes[nd, 3])]
+                done = True
+                for r in range(m):
+                    if nodes[node[r], 0] != node[r]:
+                        done = False
+                        break
+                if done:
+                    break
+            out[t, lo:lo + m] = node[:m]
+
+
+if numba is not None:
+    _leaves_kernel = numba.njit(nogil=True, cache=True)(_leaves_kernel)
+
+
+# =========================
+# Flattened forest
+# =========================
+def pack_nodes(children, feature, split_bin):
+    """Node table from the separate columns older flat models and artifacts stored."""
+    nodes = np.empty((len(feature), 4), dtype=np.int32)
+    nodes[:, :2] = children
+    nodes[:, 2] = feature
+    # Leaves carried the largest value of the narrower bin dtype
+    nodes[:, 3] = np.where(split_bin == np.iinfo(split_bin.dtype).max, np.iinfo(np.int32).max, split_bin)
+    return nodes
+
+
+class FlatForest:
+    """
+    All trees of a fitted forest in one node table.
+
+    Thresholds are stored as bin indices: for every feature the distinct split
+    thresholds used anywhere in the forest are sorted once, inputs are binned
+    with searchsorted, and `x > threshold` becomes `bin(x) > bin(threshold)`.
+    That comparison is exact and lets traversal gather small integers instead
+    of float64 thresholds.
+
+    Leaves point to themselves on both sides and carry the largest bin value,
+    so a row that has reached its leaf stays there however many steps are taken.
+    """
+
+    def __init__(self, nodes, value, roots, bin_edges, max_depth):
+        self.nodes = nodes            # int32[n_nodes, 4]: left, right (global node ids), feature, split bin
+        self.value = value            # float64[n_nodes]
+        self.roots = roots            # int32[n_trees]
+        self.bin_edges = bin_edges    # per feature: sorted float64 thresholds
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_forest(cls, forest):
+        trees = [est.tree_ for est in forest.estimators_]
+        sizes = np.array([t.node_count for t in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+        n_nodes = int(sizes.sum())
+
+        nodes = np.empty((n_nodes, 4), dtype=np.int32)
+        threshold = np.empty(n_nodes, dtype=np.float64)
+        value = np.empty(n_nodes, dtype=np.float64)
+
+        for tree, off in zip(trees, offsets):
+            sl = slice(off, off + tree.node_count)
+            ids = np.arange(off, off + tree.node_count, dtype=np.int32)
+            leaf = tree.children_left == -1
+
+            nodes[sl, 0] = np.where(leaf, ids, tree.children_left + off)
+            nodes[sl, 1] = np.where(leaf, ids, tree.children_right + off)
+            nodes[sl, 2] = np.where(leaf, 0, tree.feature)
+            threshold[sl] = tree.threshold
+            value[sl] = tree.value[:, 0, 0]
+
+        feature = nodes[:, 2]
+        internal = nodes[:, 0] != np.arange(n_nodes)
+        bin_edges = [
+            np.unique(threshold[internal & (feature == j)])
+            for j in range(forest.n_features_in_)
+        ]
+        nodes[:, 3] = np.iinfo(np.int32).max
+        for j, edges in enumerate(bin_edges):
+            mask = internal & (feature == j)
+            nodes[mask, 3] = np.searchsorted(edges, threshold[mask])
+
+        return cls(nodes, value, offsets, bin_edges, max_depth=max(t.max_depth for t in trees))
+
+    def __setstate__(self, state):
+        # Flat pickles from before the packed table stored the columns separately
+        if "children" in state:
+            state["nodes"] = pack_nodes(state.pop("children"), state.pop("feature"), state.pop("split_bin"))
+        self.__dict__.update(state)
+
+    # Column views of the node table (no copies)
+    @property
+    def children(self):
+        return self.nodes[:, :2]
+
+    @property
+    def feature(self):
+        return self.nodes[:, 2]
+
+    @property
+    def split_bin(self):
+        return self.nodes[:, 3]
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        arrays = [self.nodes, self.value, self.roots, *self.bin_edges]
+        return sum(a.nbytes for a in arrays)
+
+    def binned(self, X):
+        """Bin index per value: count of the feature's thresholds strictly below it."""
+        X = np.asarray(X)
+        # uint16 bins halve the row gathers whenever every feature fits
+        n_bins = max((len(e) for e in self.bin_edges), default=0)
+        Xb = np.empty(X.shape, dtype=np.uint16 if n_bins < np.iinfo(np.uint16).max else np.int32)
+        for j, edges in enumerate(self.bin_edges):
+            # Compare in float64 like sklearn does (float32 input vs float64 threshold)
+            Xb[:, j] = np.searchsorted(edges, X[:, j].astype(np.float64), side='left')
+        return Xb
+
+    def _traverse(self, flat_x, row_base, tree_ids, out, check_every):
+        flat = self.nodes.ravel()  # node i: left, right, feature, split bin at 4*i .. 4*i + 3
+        n = row_base.size
+        buf_p = np.empty(n, dtype=np.int32)
+        buf_t = np.empty(n, dtype=np.int32)
+        buf_f = np.empty(n, dtype=np.int32)
+        buf_x = np.empty(n, dtype=flat_x.dtype)
+        buf_s = np.empty(n, dtype=np.int32)
+        buf_b = np.empty(n, dtype=bool)
+
+        for t in tree_ids:
+            # Active rows for this tree, kept compact as rows reach their leaf
+            cur = np.full(n, self.roots[t], dtype=np.int32)
+            base = row_base
+            slot = np.arange(n)
+            result = out[t]
+
+            for depth in range(1, self.max_depth + 1):
+                m = cur.size
+                pos, tmp, idx, xb, sb, right = buf_p[:m], buf_t[:m], buf_f[:m], buf_x[:m], buf_s[:m], buf_b[:m]
+                np.multiply(cur, 4, out=pos)
+                np.add(pos, 2, out=tmp)
+                np.take(flat, tmp, out=idx)
+                idx += base
+                np.take(flat_x, idx, out=xb)
+                np.add(pos, 3, out=tmp)
+                np.take(flat, tmp, out=sb)
+                np.greater(xb, sb, out=right)
+                pos += right
+                nxt = np.take(flat, pos)
+
+                if depth % check_every == 0:
+                    # Rows whose node did not move are sitting on a leaf
+                    done = nxt == cur
+                    if done.any():
+                        result[slot[done]] = nxt[done]
+                        keep = ~done
+                        nxt, base, slot = nxt[keep], base[keep], slot[keep]
+                cur = nxt
+                if cur.size == 0:
+                    break
+            result[slot] = cur
+
+    def leaves(self, X, n_jobs=1, check_every=8):
+        """
+        Leaf node id per (row, tree): int32[n_rows, n_trees].
+
+        Trees are walked one at a time so each tree's nodes stay in cache while
+        every row steps through it. With n_jobs > 1 the trees are split across
+        threads (the numba kernel and NumPy's gathers both release the GIL).
+        """
+        Xb = np.ascontiguousarray(self.binned(X))
+        n_rows, n_cols = Xb.shape
+        out = np.empty((self.n_trees, n_rows), dtype=np.int32)
+
+        if numba is not None:
+            nodes = self.nodes
+            def walk(ids):
+                _leaves_kernel(Xb, nodes, self.roots[ids.start:ids.stop], out[ids.start:ids.stop])
+            groups = [range(ids[0], ids[-1] + 1) for ids in np.array_split(np.arange(self.n_trees), max(n_jobs, 1))
+                      if len(ids)]
+        else:
+            flat_x = Xb.ravel()
+            row_base = np.arange(n_rows, dtype=np.int32) * n_cols
+            def walk(ids):
+                self._traverse(flat_x, row_base, ids, out, check_every)
+            groups = [range(i, self.n_trees, max(n_jobs, 1)) for i in range(max(n_jobs, 1))]
+
+        if n_jobs <= 1:
+            walk(groups[0])
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                list(pool.map(walk, groups))
+        return out.T
+
+    def predict_trees(self, X, n_jobs=1):
+        """Per-tree predictions: float64[n_rows, n_trees]."""
+        return self.value[self.leaves(X, n_jobs=n_jobs)]
+
+    def predict(self, X, n_jobs=1):
+        return self.predict_trees(X, n_jobs=n_jobs).mean(axis=1)
+
+    def predict_quantiles(self, X, quantiles, n_jobs=1):
+        """
+        Mean prediction and percentiles (0-100) of the per-tree predictions,
+        from one traversal: (float64[n_rows], float64[len(quantiles), n_rows]).
+        """
+        per_tree = self.predict_trees(X, n_jobs=n_jobs)
+        return per_tree.mean(axis=1), percentiles(per_tree, quantiles)
+
+
+def node_covers(forest):
+    """
+    Training-sample weight of every node of a fitted forest, in FlatForest
+    node order: float64[n_nodes]. Only attributions (explain.py) need it, so
+    it is not part of the scoring layout.
+    """
+    return np.concatenate([est.tree_.weighted_n_node_samples for est in forest.estimators_])
+
+
+class CompiledPipeline:
+    """Fitted preprocessor + FlatForest, scoring raw listing frames like the Pipeline."""
+
+    def __init__(self, preprocessor, forest, n_jobs=1):
+        self.preprocessor = preprocessor
+        self.forest = forest
+        self.n_jobs = n_jobs
+        self.feature_names_in_ = preprocessor.feature_names_in_
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        return cls(pipeline.named_steps['preprocessor'], FlatForest.from_forest(pipeline.named_steps['model']))
+
+    def transform(self, X):
+        Xt = self.preprocessor.transform(X)
+        if sparse.issparse(Xt):
+            Xt = Xt.toarray()
+        return np.asarray(Xt, dtype=np.float32)
+
+    def predict(self, X):
+        return self.forest.predict(self.transform(X), n_jobs=self.n_jobs)
+
+    def predict_quantiles(self, X, quantiles):
+        return self.forest.predict_quantiles(self.transform(X), quantiles, n_jobs=self.n_jobs)
+
+
+# =========================
+# Export / verification
+# =========================
+def verify(pipeline, compiled, X, rtol=1e-9):
+    """Max relative difference between the two predictors; raises if above rtol."""
+    expected = pipeline.predict(X)
+    got = compiled.predict(X)
+    rel = np.max(np.abs(got - expected) / np.maximum(np.abs(expected), 1.0))
+    if rel > rtol:
+        raise AssertionError(f"Compiled forest differs from sklearn: max relative error {rel:.3g}")
+    return rel
+
+
+def sample_inputs(pipeline, n_rows, seed=0):
+    df = pd.read_csv(find_data_csv())
+    df = df.sample(n_rows, replace=n_rows > len(df), random_state=seed).reset_index(drop=True)
+    return df.reindex(columns=list(pipeline.feature_names_in_))
+
+
+def export(model_path=DEFAULT_MODEL, out_path=DEFAULT_FLAT_MODEL):
+    pipeline = load_model(model_path)
+    compiled = CompiledPipeline.from_pipeline(pipeline)
+    # Never write a compiled model that disagrees with the original
+    rel = verify(pipeline, compiled, sample_inputs(pipeline, 5000))
+    joblib.dump(compiled, out_path)
+    print(f"✅ Exported {compiled.forest.n_trees} trees / {len(compiled.forest.value):,} nodes -> {out_path}")
+    print(f"   Equivalence check on 5,000 rows: max relative error {rel:.2e}")
+    return compiled
+
+
+def _pickled_size(obj):
+    buf = io.BytesIO()
+    joblib.dump(obj, buf)
+    return buf.tell()
+
+
+def bench(model_path=DEFAULT_MODEL, n_rows=100_000, n_jobs=1, repeats=3):
+    pipeline = load_model(model_path)
+    compiled = CompiledPipeline.from_pipeline(pipeline)
+    # Same thread budget for both engines
+    pipeline.named_steps['model'].n_jobs = n_jobs
+    compiled.n_jobs = n_jobs
+    X = sample_inputs(pipeline, n_rows)
+    rel = verify(pipeline, compiled, X)
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn(X)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    t_sklearn = best_of(pipeline.predict)
+    t_flat = best_of(compiled.predict)
+
+    print("\n" + "=" * 40)
+    print("🌲 FOREST INFERENCE BENCHMARK")
+    print("=" * 40)
+    print(f"Rows scored         : {n_rows:,} (n_jobs={n_jobs})")
+    print(f"sklearn Pipeline    : {t_sklearn:.3f}s ({n_rows / t_sklearn:,.0f} rows/s)")
+    print(f"Flat-array engine   : {t_flat:.3f}s ({n_rows / t_flat:,.0f} rows/s, "
+          f"{'numba kernel' if numba is not None else 'NumPy fallback'})")
+    print(f"Speed-up            : {t_sklearn / t_flat:.2f}x")
+    print(f"Pickle size sklearn : {_pickled_size(pipeline) / 1e6:,.1f} MB")
+    print(f"Pickle size flat    : {_pickled_size(compiled) / 1e6:,.1f} MB")
+    print(f"Flat node arrays    : {compiled.forest.nbytes / 1e6:,.1f} MB")
+    print(f"Max relative error  : {rel:.2e}")
+    print("=" * 40)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / benchmark the flat-array forest engine.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Flatten the saved model and write the compiled pickle")
+    p_export.add_argument("--model", default=str(DEFAULT_MODEL))
+    p_export.add_argument("--out", default=str(DEFAULT_FLAT_MODEL))
+
+    p_bench = sub.add_parser("bench", help="Compare against sklearn predict")
+    p_bench.add_argument("--model", default=str(DEFAULT_MODEL))
+    p_bench.add_argument("--rows", type=int, default=100_000)
+    p_bench.add_argument("--jobs", type=int, default=1, help="Threads for both engines")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export(args.model, args.out)
+    else:
+        bench(args.model, args.rows, args.jobs)
+
+
+if __name__ == "__main__":
+    # Run through the importable module so pickled classes resolve to
+    # forest_engine.CompiledPipeline rather than __main__.CompiledPipeline
+    import forest_engine
+    sys.exit(forest_engine.main())
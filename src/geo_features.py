@@ -0,0 +1,109 @@
+"""
+Neighbourhood features from nearby sales.
+
+NeighbourhoodFeatures is a pipeline transformer that indexes the training
+sales in a haversine BallTree (lat/long in radians) and adds, for every row:
+- Geo_UnitPrice: median Price/Landsize of the k nearest training sales
+- Geo_Density:   number of training sales within radius_km
+
+Training rows get out-of-fold values: the rows of each of n_folds folds are
+looked up in a tree built on the other folds, so a sale never sees its own
+price (and density counts are rescaled to the full training size). New rows
+are looked up in the tree over all training sales. That tree is pickled with
+the pipeline, so scoring a listing is an O(log n) query rather than a scan.
+Queries run in batches of batch_size rows.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.model_selection import KFold
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0
+
+GEO_FEATURES = ["Geo_UnitPrice", "Geo_Density"]
+# Raw columns the transformer reads (Landsize is only used when fitting)
+GEO_SOURCE_COLS = ["Lattitude", "Longtitude", "Landsize"]
+
+
+def _column(X, col):
+    if col not in X.columns:
+        return np.full(len(X), np.nan)
+    return pd.to_numeric(X[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class NeighbourhoodFeatures(BaseEstimator, TransformerMixin):
+    def __init__(self, columns=None, k=10, radius_km=1.0, n_folds=5, batch_size=20000, random_state=1):
+        self.columns = columns
+        self.k = k
+        self.radius_km = radius_km
+        self.n_folds = n_folds
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    # ---------- helpers ----------
+    def _coords(self, X):
+        coords = np.column_stack([_column(X, "Lattitude"), _column(X, "Longtitude")])
+        if hasattr(self, "centre_"):
+            # Rows without coordinates are looked up at the training centroid
+            coords = np.where(np.isnan(coords), self.centre_, coords)
+        return np.radians(coords)
+
+    def _query(self, tree, unit_price, coords, density_scale=1.0):
+        k = min(self.k, tree.data.shape[0])
+        out = np.empty((len(coords), 2), dtype=np.float32)
+        for start in range(0, len(coords), self.batch_size):
+            batch = coords[start:start + self.batch_size]
+            idx = tree.query(batch, k=k, return_distance=False)
+            with warnings.catch_warnings():
+                # Neighbourhoods where no sale has a land size
+                warnings.simplefilter("ignore", RuntimeWarning)
+                out[start:start + len(batch), 0] = np.nanmedian(unit_price[idx], axis=1)
+            counts = tree.query_radius(batch, r=self.radius_km / EARTH_RADIUS_KM, count_only=True)
+            out[start:start + len(batch), 1] = counts * density_scale
+        np.copyto(out[:, 0], np.float32(self.fallback_unit_price_), where=np.isnan(out[:, 0]))
+        return out
+
+    def _select(self, block):
+        columns = self.columns or GEO_FEATURES
+        return block[:, [GEO_FEATURES.index(c) for c in columns]]
+
+    # ---------- sklearn API ----------
+    def fit(self, X, y):
+        lat_lon = np.column_stack([_column(X, "Lattitude"), _column(X, "Longtitude")])
+        self.centre_ = np.nanmean(lat_lon, axis=0)
+        coords = self._coords(X)
+
+        land = _column(X, "Landsize")
+        price = np.asarray(y, dtype=np.float64)
+        self.unit_price_ = np.where(land > 0, price / np.where(land > 0, land, 1.0), np.nan)
+        self.fallback_unit_price_ = float(np.nan_to_num(np.nanmedian(self.unit_price_)))
+
+        self.tree_ = BallTree(coords, metric="haversine")
+        self.n_features_in_ = X.shape[1]
+        return self
+
+    def fit_transform(self, X, y=None, **fit_params):
+        """Fit on all rows, but give every training row out-of-fold neighbours."""
+        self.fit(X, y)
+        coords = np.asarray(self.tree_.data)
+        n = len(coords)
+        if n < 2 * self.n_folds:
+            return self._select(self._query(self.tree_, self.unit_price_, coords))
+
+        block = np.empty((n, 2), dtype=np.float32)
+        folds = KFold(n_splits=self.n_folds, shuffle=True, random_state=self.random_state)
+        for other_idx, fold_idx in folds.split(coords):
+            tree = BallTree(coords[other_idx], metric="haversine")
+            block[fold_idx] = self._query(
+                tree, self.unit_price_[other_idx], coords[fold_idx], density_scale=n / len(other_idx)
+            )
+        return self._select(block)
+
+    def transform(self, X):
+        return self._select(self._query(self.tree_, self.unit_price_, self._coords(X)))
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray(self.columns or GEO_FEATURES, dtype=object)
@@ -0,0 +1,166 @@
+"""
+Permutation feature importance on the cached cross-validation folds.
+
+Impurity importances (feature_importances_) favour continuous,
+high-cardinality columns such as Lattitude/Longtitude. Permutation importance
+instead measures how much the held-out R² drops when a feature is shuffled,
+using the fold pipelines validation.cross_validate has already fitted and
+cached, so nothing is retrained.
+
+Features are permuted after preprocessing, in groups: every one-hot column of
+Type moves together, and Lattitude/Longtitude are additionally shuffled
+jointly (same row permutation) so the location signal is also scored as one
+unit. Each (fold, group) pair is one task in a process pool; workers keep the
+fold they are working on in memory. Results are cached under
+output/cache/importance/, keyed by the fold models and the settings.
+"""
+import os
+
+import joblib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from paths import CACHE_DIR, OUTPUT_IMG_DIR, REPORT_DIR
+from profiling import timed
+
+IMPORTANCE_CACHE_DIR = CACHE_DIR / "importance"
+
+# Groups scored as one unit, in addition to every feature on its own
+LOCATION_GROUP = {"Lat/Long": ["Lattitude", "Longtitude"]}
+
+
+# =========================
+# Groups
+# =========================
+def encoded_groups(preprocessor, groups=None):
+    """
+    Map each feature to its columns in the preprocessed matrix, e.g.
+    Type -> [cat__Type_h, cat__Type_t, cat__Type_u], then add one entry per
+    named group (the union of its features' columns).
+    """
+    categorical = next(cols for name, _, cols in preprocessor.transformers_ if name == "cat")
+    columns = {}
+    for j, name in enumerate(preprocessor.get_feature_names_out()):
+        kind, _, feature = name.partition("__")
+        if kind == "cat":
+            # One-hot names are "<feature>_<category>"; ordinal names are just "<feature>"
+            feature = next(c for c in categorical if feature == c or feature.startswith(c + "_"))
+        columns.setdefault(feature, []).append(j)
+    for name, feats in (groups or {}).items():
+        if all(f in columns for f in feats):
+            columns[name] = [j for f in feats for j in columns[f]]
+    return columns
+
+
+# =========================
+# Worker side
+# =========================
+_FOLD_CACHE = {}
+
+
+def _fold_state(path, X_test, y_test):
+    """Fitted fold, its preprocessed test matrix and baseline scores (kept per worker)."""
+    if path not in _FOLD_CACHE:
+        _FOLD_CACHE.clear()  # one fold at a time per worker
+        pipeline = joblib.load(path)
+        X_enc = pipeline.named_steps["preprocessor"].transform(X_test)
+        if hasattr(X_enc, "toarray"):
+            X_enc = X_enc.toarray()
+        model = pipeline.named_steps["model"]
+        pred = model.predict(X_enc)
+        _FOLD_CACHE[path] = (model, X_enc, r2_score(y_test, pred), mean_absolute_error(y_test, pred))
+    return _FOLD_CACHE[path]
+
+
+def _score_group(path, X_test, y_test, columns, n_repeats, seed):
+    model, X_enc, base_r2, base_mae = _fold_state(str(path), X_test, y_test)
+    rng = np.random.default_rng(seed)
+    X_perm = X_enc.copy()
+    drops = []
+    for _ in range(n_repeats):
+        order = rng.permutation(len(X_enc))
+        # One permutation for the whole group keeps its columns consistent within a row
+        X_perm[:, columns] = X_enc[order][:, columns]
+        pred = model.predict(X_perm)
+        drops.append((base_r2 - r2_score(y_test, pred),
+                      mean_absolute_error(y_test, pred) - base_mae))
+        X_perm[:, columns] = X_enc[:, columns]
+    return drops
+
+
+# =========================
+# Driver
+# =========================
+@timed("permutation_importance")
+def permutation_importance(cv_result, X, y, groups=LOCATION_GROUP, n_repeats=5, seed=0,
+                           n_jobs=-1, cache_dir=IMPORTANCE_CACHE_DIR):
+    """
+    Grouped permutation importance over every fold of `cv_result`.
+
+    Returns one row per feature and per group: mean/std of the R² drop and of the MAE
+    increase across folds x repeats, sorted by R² drop.
+    """
+    key = joblib.hash(([p.name for p in cv_result.fold_paths], groups, n_repeats, seed))
+    cache_path = cache_dir / f"importance_{key}.joblib"
+    if cache_path.exists():
+        return joblib.load(cache_path)
+
+    first, _ = cv_result.load_fold(0)
+    columns = encoded_groups(first.named_steps["preprocessor"], groups)
+    del first
+
+    y = np.asarray(y)
+    tasks = []
+    for i, path in enumerate(cv_result.fold_paths):
+        test_idx = cv_result.test_idx(i)
+        X_test, y_test = X.iloc[test_idx], y[test_idx]
+        for g, (name, cols) in enumerate(columns.items()):
+            tasks.append((name, delayed(_score_group)(path, X_test, y_test, cols, n_repeats, [seed, i, g])))
+
+    # Fold-major order: consecutive tasks on a worker mostly reuse its cached fold
+    results = Parallel(n_jobs=n_jobs)(task for _, task in tasks)
+
+    rows = {}
+    for (name, _), drops in zip(tasks, results):
+        rows.setdefault(name, []).extend(drops)
+    table = pd.DataFrame([
+        {
+            "Feature": name,
+            "R2_Drop": np.mean([d[0] for d in drops]),
+            "R2_Drop_Std": np.std([d[0] for d in drops]),
+            "MAE_Increase": np.mean([d[1] for d in drops]),
+            "MAE_Increase_Std": np.std([d[1] for d in drops]),
+        }
+        for name, drops in rows.items()
+    ]).sort_values("R2_Drop", ascending=False, ignore_index=True)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+    joblib.dump(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return table
+
+
+@timed("render")
+def save_outputs(table, title="What Drives Melbourne House Prices? (Permutation Importance)"):
+    """Write the table to output/reports/ and the bar chart the dashboard shows."""
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    OUTPUT_IMG_DIR.mkdir(parents=True, exist_ok=True)
+    table_path = REPORT_DIR / "feature_importance.csv"
+    image_path = OUTPUT_IMG_DIR / "feature_importance.png"
+    table.to_csv(table_path, index=False)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    colours = plt.cm.viridis(np.linspace(0, 0.9, len(table)))
+    ax.barh(table["Feature"], table["R2_Drop"], xerr=table["R2_Drop_Std"], color=colours, capsize=3)
+    ax.invert_yaxis()
+    ax.set_title(title)
+    ax.set_xlabel("Drop in held-out R² when shuffled")
+    ax.set_ylabel("Features")
+    fig.tight_layout()
+    fig.savefig(image_path, dpi=300, bbox_inches="tight")
+    plt.close(fig)
+    return table_path, image_path
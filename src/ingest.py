@@ -0,0 +1,270 @@
+"""
+Incremental ingestion of new sales batches.
+
+New batches (CSV files in the melb_data.csv layout) are appended to a
+partitioned Parquet store under data/store/, laid out as
+sale_month=YYYY-MM/Regionname=.../batch-<id>-<n>.parquet. Files are never
+rewritten; a batch only adds files.
+
+Alongside the store, a small state file keeps:
+- the hashes of every Address+Date already stored, so re-sent or
+  overlapping sales are dropped
+- value counts for every numeric column the model imputes, so the medians
+  HousingFeatures uses are updated exactly without re-reading the history
+- the market cube of every stored sale (cube.py), merged with each batch
+- a log of the ingested batches
+
+With --trees N the saved forest is updated in place: the imputation medians
+are replaced by the running ones and N extra trees are grown on the new rows
+only (warm_start), instead of retraining on the whole history.
+
+Usage:
+    python src/ingest.py add data/melb_data.csv             # seed the store with the snapshot
+    python src/ingest.py add new_sales.csv --trees 10       # append + grow 10 trees on the new sales
+    python src/ingest.py show
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sklearn.ensemble import RandomForestRegressor
+
+from cube import MarketCube
+from features import HousingFeatures
+from model import CATEGORICAL_FEATURES, FEATURES_FULL
+from paths import DATA_DIR, MODEL_DIR
+
+STORE_DIR = DATA_DIR / "store"
+STATE_FILE = "_state.joblib"   # leading underscore: skipped by dataset discovery
+DEFAULT_MODEL = MODEL_DIR / "melbourne_housing_model.pkl"
+
+PARTITION_COLS = ["sale_month", "Regionname"]
+KEY_COLS = ["Address", "Date"]
+NUMERIC_COLS = [
+    "Rooms", "Price", "Distance", "Postcode", "Bedroom2", "Bathroom", "Car",
+    "Landsize", "BuildingArea", "YearBuilt", "Lattitude", "Longtitude", "Propertycount",
+]
+
+# Block layout of the widest numeric feature set; every model's layout is a subset
+MEDIAN_FEATURES = HousingFeatures([c for c in FEATURES_FULL if c not in CATEGORICAL_FEATURES])
+
+
+# =========================
+# Running medians
+# =========================
+def merge_counts(counts, values):
+    """Add the non-NaN `values` to a (sorted unique values, counts) pair."""
+    values = values[~np.isnan(values)]
+    old_values, old_counts = counts
+    uniq, inverse = np.unique(np.concatenate([old_values, values]), return_inverse=True)
+    weights = np.concatenate([old_counts, np.ones(len(values), dtype=np.int64)])
+    return uniq, np.bincount(inverse, weights=weights).astype(np.int64)
+
+
+def median_from_counts(counts):
+    """Median of the multiset described by `counts` (NaN if empty), as np.nanmedian."""
+    values, freq = counts
+    if freq.sum() == 0:
+        return np.nan
+    cum = np.cumsum(freq)
+    n = cum[-1]
+    # k-th smallest (0-based) is the first value whose cumulative count exceeds k
+    lo = values[np.searchsorted(cum, (n - 1) // 2 + 1)]
+    hi = values[np.searchsorted(cum, n // 2 + 1)]
+    return (float(lo) + float(hi)) / 2
+
+
+# =========================
+# Store
+# =========================
+class SalesStore:
+    """Append-only, partitioned Parquet store of sales plus its ingestion state."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = Path(root)
+        self.state_path = self.root / STATE_FILE
+        if self.state_path.exists():
+            self.state = joblib.load(self.state_path)
+        else:
+            _, layout = MEDIAN_FEATURES._block(pd.DataFrame())
+            empty = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+            self.state = {
+                "keys": np.empty(0, dtype=np.uint64),   # sorted Address+Date hashes
+                "counts": {col: empty for col in layout},
+                "batches": [],
+            }
+
+    # ---------- writes ----------
+    def _save_state(self):
+        tmp_path = self.state_path.with_suffix(f".tmp{os.getpid()}")
+        joblib.dump(self.state, tmp_path)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def normalise(df):
+        """Fixed column types, so every batch file shares one schema."""
+        df = df.copy()
+        df["Date"] = pd.to_datetime(df["Date"], dayfirst=True, errors="coerce")
+        df = df.dropna(subset=["Date"])
+        for col in NUMERIC_COLS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        for col in df.columns:
+            if col not in NUMERIC_COLS and col != "Date":
+                df[col] = df[col].astype("string")
+        df["Address"] = df["Address"].str.strip()
+        df["Regionname"] = df["Regionname"].fillna("Unknown") if "Regionname" in df.columns else "Unknown"
+        df["sale_month"] = df["Date"].dt.strftime("%Y-%m")
+        return df
+
+    @staticmethod
+    def keys_of(df):
+        return pd.util.hash_pandas_object(df[KEY_COLS], index=False).to_numpy(dtype=np.uint64)
+
+    def append(self, df, source=""):
+        """Store the rows of `df` not seen before; returns the new rows."""
+        df = self.normalise(df)
+        keys = self.keys_of(df)
+        fresh = ~pd.Series(keys).duplicated().to_numpy() & ~np.isin(keys, self.state["keys"])
+        new, new_keys = df[fresh].reset_index(drop=True), keys[fresh]
+
+        batch_id = f"{datetime.now():%Y%m%dT%H%M%S}-{len(self.state['batches']):04d}"
+        if len(new):
+            cube = self.cube()  # before the new files land, so an old store's history is counted once
+            ds.write_dataset(
+                pa.Table.from_pandas(new, preserve_index=False),
+                self.root,
+                format="parquet",
+                partitioning=PARTITION_COLS,
+                partitioning_flavor="hive",
+                basename_template=f"batch-{batch_id}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+
+            # Files first, state last: the state marks the batch as ingested
+            block, layout = MEDIAN_FEATURES._block(new)
+            for j, col in enumerate(layout):
+                self.state["counts"][col] = merge_counts(self.state["counts"][col], block[:, j])
+            self.state["keys"] = np.union1d(self.state["keys"], new_keys)
+            self.state["cube"] = cube.update(new)
+
+        self.state["batches"].append({
+            "id": batch_id, "source": str(source), "rows_in": len(df), "rows_added": len(new),
+            "refit_trees": 0, "created": datetime.now().isoformat(timespec="seconds"),
+        })
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._save_state()
+        return new
+
+    # ---------- reads ----------
+    def medians(self, layout):
+        """Running medians for a HousingFeatures layout (NaN -> 0, as in fit())."""
+        return np.nan_to_num(
+            np.array([median_from_counts(self.state["counts"][col]) for col in layout]), nan=0.0
+        ).astype(np.float32)
+
+    def cube(self):
+        """Market cube of every stored sale (built once from the files for stores older than the cube)."""
+        if "cube" not in self.state:
+            self.state["cube"] = MarketCube.build(self.load())
+        return self.state["cube"]
+
+    def load(self, months=None, regions=None):
+        """Stored sales, optionally restricted to some sale months / regions (partition pruning)."""
+        if not any(self.root.glob("sale_month=*")):
+            return pd.DataFrame()
+        dataset = ds.dataset(self.root, format="parquet", partitioning="hive")
+        expr = None
+        if months is not None:
+            expr = ds.field("sale_month").isin(list(months))
+        if regions is not None:
+            region_expr = ds.field("Regionname").isin(list(regions))
+            expr = region_expr if expr is None else expr & region_expr
+        return dataset.to_table(filter=expr).to_pandas()
+
+
+# =========================
+# Partial refit
+# =========================
+def grow_forest(pipeline, new, medians_from, n_trees):
+    """
+    Update a fitted forest Pipeline with `new` sales: refresh the imputation
+    medians from the store, then grow n_trees extra trees on the new rows only.
+    """
+    model = pipeline.named_steps["model"]
+    if not isinstance(model, RandomForestRegressor):
+        raise ValueError("Partial refit needs the Random Forest backend (warm_start adds trees)")
+
+    num = pipeline.named_steps["preprocessor"].named_transformers_["num"]
+    _, layout = num._block(new.iloc[:0])
+    num.medians_ = medians_from.medians(layout)
+
+    X = pipeline.named_steps["preprocessor"].transform(new.reindex(columns=pipeline.feature_names_in_))
+    # warm_start keeps the existing trees and only fits the new ones
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_trees)
+    model.fit(X, new["Price"].to_numpy())
+    model.set_params(warm_start=False)
+    return pipeline
+
+
+def add_batch(csv_path, store=None, model_path=DEFAULT_MODEL, n_trees=0):
+    store = store or SalesStore()
+    start = time.perf_counter()
+    new = store.append(pd.read_csv(csv_path), source=csv_path)
+    batch = store.state["batches"][-1]
+    print(f"✅ Batch {batch['id']}: {batch['rows_added']:,} new of {batch['rows_in']:,} rows "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    train = new.dropna(subset=["Price"])
+    if n_trees and len(train):
+        start = time.perf_counter()
+        pipeline = grow_forest(joblib.load(model_path), train, store, n_trees)
+        tmp_path = Path(model_path).with_suffix(f".tmp{os.getpid()}")
+        joblib.dump(pipeline, tmp_path)
+        os.replace(tmp_path, model_path)
+        batch["refit_trees"] = n_trees
+        store._save_state()
+        print(f"🌲 Grew {n_trees} trees on {len(train):,} sales -> "
+              f"{len(pipeline.named_steps['model'].estimators_)} trees ({time.perf_counter() - start:.1f}s)")
+    return new
+
+
+def show(store):
+    batches = store.state["batches"]
+    print("\n" + "=" * 40)
+    print(f"📦 SALES STORE ({store.root})")
+    print("=" * 40)
+    print(f"Stored sales: {len(store.state['keys']):,}")
+    if "cube" in store.state:
+        print(f"Market cube: {len(store.state['cube']):,} cells")
+    for b in batches:
+        print(f"{b['id']} | +{b['rows_added']:>6,} of {b['rows_in']:>6,} | trees +{b['refit_trees']:<3} | {b['source']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append sales batches to the partitioned store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_add = sub.add_parser("add", help="Ingest a CSV batch")
+    p_add.add_argument("csv", type=Path)
+    p_add.add_argument("--trees", type=int, default=0,
+                       help="Grow this many extra trees on the new sales (0 = store only)")
+    p_add.add_argument("--model", type=Path, default=DEFAULT_MODEL)
+    sub.add_parser("show", help="Print the ingestion log")
+    parser.add_argument("--store", type=Path, default=STORE_DIR)
+    args = parser.parse_args(argv)
+
+    store = SalesStore(args.store)
+    if args.command == "add":
+        add_batch(args.csv, store, args.model, args.trees)
+    show(store)
+
+
+if __name__ == "__main__":
+    main()
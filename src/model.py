@@ -0,0 +1,147 @@
+"""
+Feature lists and the model Pipeline shared by the validation, training and
+scoring code.
+
+Two model backends are available:
+- "forest": RandomForestRegressor on median-imputed, one-hot encoded inputs
+- "hgb":    HistGradientBoostingRegressor with native categorical and NaN
+            handling (no imputation, ordinal-coded categoricals)
+
+The default backend comes from the MODEL_BACKEND environment variable
+(e.g. `MODEL_BACKEND=hgb python src/6_rigorous_validation.py`).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+from features import HousingFeatures, source_columns
+from geo_features import GEO_FEATURES, GEO_SOURCE_COLS, NeighbourhoodFeatures
+
+# Full feature set (6_rigorous_validation.py)
+FEATURES_FULL = [
+    'Rooms', 'Type', 'Distance', 'Bedroom2', 'Bathroom', 'Car',
+    'Landsize', 'BuildingArea', 'Year', 'House_Age',
+    'Lattitude', 'Longtitude'
+]
+
+# Slim production set (7_final_optimization.py)
+FEATURES_SLIM = [
+    'Lattitude', 'Longtitude',
+    'Rooms',
+    'Distance',
+    'Landsize', 'BuildingArea',
+    'Type',
+    'Bathroom',
+    'House_Age'
+]
+
+# Slim set + nearby-sales features (geo_features.NeighbourhoodFeatures)
+FEATURES_GEO = FEATURES_SLIM + GEO_FEATURES
+
+FEATURE_SETS = {'full': FEATURES_FULL, 'slim': FEATURES_SLIM, 'geo': FEATURES_GEO}
+
+CATEGORICAL_FEATURES = ['Type', 'Regionname']
+
+BACKENDS = ('forest', 'hgb')
+DEFAULT_BACKEND = os.environ.get('MODEL_BACKEND', 'forest')
+
+
+def _split(features):
+    """(numeric, geo, categorical) features, in the order the preprocessor outputs them."""
+    numeric = [c for c in features if c not in CATEGORICAL_FEATURES and c not in GEO_FEATURES]
+    geo = [c for c in features if c in GEO_FEATURES]
+    categorical = [c for c in features if c in CATEGORICAL_FEATURES]
+    return numeric, geo, categorical
+
+
+def input_columns(features):
+    """Raw columns the pipeline for `features` expects as input."""
+    numeric, geo, categorical = _split(features)
+    geo_sources = GEO_SOURCE_COLS if geo else []
+    return list(dict.fromkeys(source_columns(numeric) + geo_sources + categorical))
+
+
+def select_inputs(df, features):
+    """Pipeline input frame; columns the caller does not have become NaN."""
+    return df.reindex(columns=input_columns(features))
+
+
+def make_regressor(backend=None, n_estimators=100, random_state=1, **model_params):
+    """
+    Bare regressor for the chosen backend. n_estimators only applies to the
+    forest; the booster's rounds are set with max_iter (default 300).
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'forest':
+        return RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, **model_params)
+    if backend == 'hgb':
+        model_params.setdefault('max_iter', 300)
+        return HistGradientBoostingRegressor(random_state=random_state, **model_params)
+    raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
+
+def build_preprocessor(features, backend=None):
+    """
+    forest: HousingFeatures (median-imputed) + One-Hot categoricals
+    hgb:    HousingFeatures (NaN kept) + ordinal-coded categoricals, which the
+            booster treats as native categories
+    Geo_* features (if requested) come from NeighbourhoodFeatures on either backend.
+    """
+    backend = backend or DEFAULT_BACKEND
+    numeric, geo, categorical = _split(features)
+    if backend == 'hgb':
+        num = HousingFeatures(numeric, impute=False)
+        cat = OrdinalEncoder(
+            handle_unknown='use_encoded_value', unknown_value=np.nan, encoded_missing_value=np.nan
+        )
+    else:
+        num = HousingFeatures(numeric)
+        cat = OneHotEncoder(handle_unknown='ignore')
+    transformers = [('num', num, source_columns(numeric))]
+    if geo:
+        # Fitted with the target: needs fit_transform(X, y), as Pipeline.fit does
+        transformers.append(('geo', NeighbourhoodFeatures(geo), GEO_SOURCE_COLS))
+    transformers.append(('cat', cat, categorical))
+    return ColumnTransformer(transformers=transformers)
+
+
+def fit_from_levels(preprocessor, features, levels, medians):
+    """
+    Fit a forest preprocessor without the training rows: the encoders see one
+    row per level ({categorical column: levels}), then the HousingFeatures
+    medians are set to `medians` (in its _block layout).
+    """
+    columns = input_columns(features)
+    n = max([len(v) for v in levels.values()] + [1])
+    proto = pd.DataFrame({col: np.full(n, np.nan, dtype=object) for col in columns})
+    for col, values in levels.items():
+        # Padding repeats the first level, which leaves the set of categories unchanged
+        proto[col] = list(values) + list(values[:1]) * (n - len(values))
+
+    preprocessor.fit(proto)
+    preprocessor.named_transformers_["num"].medians_ = medians
+    return preprocessor
+
+
+def build_pipeline(features, n_estimators=100, random_state=1, backend=None, **model_params):
+    """
+    Preprocessing and regressor in a single Pipeline, so imputation is learned
+    inside each CV fold and the saved model can score raw listings directly.
+    Extra keyword arguments (max_depth, min_samples_leaf, ...) go to the
+    regressor.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'hgb':
+        n_numeric = sum(c not in CATEGORICAL_FEATURES for c in features)
+        n_categorical = len(features) - n_numeric
+        # ColumnTransformer output is [numeric..., geo..., categorical...]
+        model_params.setdefault('categorical_features', [False] * n_numeric + [True] * n_categorical)
+    return Pipeline(steps=[
+        ('preprocessor', build_preprocessor(features, backend)),
+        ('model', make_regressor(backend, n_estimators, random_state, **model_params))
+    ])
@@ -0,0 +1,230 @@
+"""
+Dependency-graph runner for the stage scripts (1-7) and the dashboard artifacts.
+
+Each stage declares the stages it depends on and the files it writes. A
+stage's key is a hash of:
+- its script and every local module it imports (transitively)
+- the dataset
+- the MODEL_BACKEND setting
+- the keys of its upstream stages
+
+A stage is skipped when its key matches the last successful run and its
+outputs still exist. Otherwise it runs as a subprocess from the project root
+(stdout/stderr go to output/reports/logs/<stage>.log); the dataset is looked
+up from the root too, so the keys do not depend on where this is started. Stages whose dependencies are done run
+concurrently. With --profile each executed stage also leaves a cProfile dump.
+
+Usage:
+    python src/orchestrate.py                      # bring everything up to date
+    python src/orchestrate.py final_optimization   # one stage + what it needs
+    python src/orchestrate.py --dry-run            # show what would run
+    python src/orchestrate.py --force feature_importance
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from features import file_hash
+from paths import CACHE_DIR, MODEL_DIR, OUTPUT_IMG_DIR, REPORT_DIR, ROOT, find_data_csv
+from profiling import PROFILE_DIR
+
+SRC_DIR = Path(__file__).resolve().parent
+STATE_PATH = CACHE_DIR / "orchestrate.json"
+LOG_DIR = REPORT_DIR / "logs"
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str                                 # file in src/
+    deps: list = field(default_factory=list)    # upstream stage names
+    outputs: list = field(default_factory=list) # files the stage must leave behind
+    args: list = field(default_factory=list)
+
+
+STAGES = [
+    Stage("features", "features.py"),
+    Stage("baseline", "1_baseline_model.py"),
+    Stage("random_forest", "2_random_forest.py"),
+    Stage("feature_engineering", "3_feature_engineering.py", deps=["features"]),
+    Stage("validation_test", "5_validation_test.py"),
+    # Fits and caches the 5 CV folds that feature_importance reuses
+    Stage("rigorous_validation", "6_rigorous_validation.py", deps=["features"]),
+    Stage("feature_importance", "4_feature_importance.py", deps=["rigorous_validation"],
+          outputs=[OUTPUT_IMG_DIR / "feature_importance.png", REPORT_DIR / "feature_importance.csv"]),
+    Stage("final_optimization", "7_final_optimization.py", deps=["features"],
+          outputs=[MODEL_DIR / "melbourne_housing_model.pkl", MODEL_DIR / "artifacts" / "LATEST",
+                   OUTPUT_IMG_DIR / "prediction_scatter.png"]),
+    Stage("backtest", "backtest.py", deps=["features"],
+          outputs=[REPORT_DIR / "backtest.csv", OUTPUT_IMG_DIR / "backtest_drift.png"]),
+    Stage("dashboard_index", "dashboard_index.py"),
+]
+
+
+# =========================
+# Hashing
+# =========================
+def local_imports(script, seen=None):
+    """The script plus every module of src/ it imports, transitively."""
+    seen = set() if seen is None else seen
+    path = SRC_DIR / script
+    if path in seen:
+        return seen
+    seen.add(path)
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        for name in names:
+            if (SRC_DIR / f"{name.split('.')[0]}.py").exists():
+                local_imports(f"{name.split('.')[0]}.py", seen)
+    return seen
+
+
+def stage_key(stage, data_key, upstream_keys):
+    h = hashlib.blake2b(digest_size=16)
+    for path in sorted(local_imports(stage.script)):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    h.update(json.dumps({
+        "data": data_key,
+        "backend": os.environ.get("MODEL_BACKEND", ""),
+        "args": stage.args,
+        "upstream": upstream_keys,
+    }, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def load_state():
+    return json.loads(STATE_PATH.read_text()) if STATE_PATH.exists() else {}
+
+
+def save_state(state):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_PATH.with_suffix(f".tmp{os.getpid()}")
+    tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    os.replace(tmp_path, STATE_PATH)
+
+
+# =========================
+# Graph
+# =========================
+def select(stages, targets):
+    """`targets` and everything they depend on, in declaration order."""
+    by_name = {s.name: s for s in stages}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s) {unknown}; choose from {list(by_name)}")
+    needed, todo = set(), list(targets or by_name)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo += by_name[name].deps
+    return [s for s in stages if s.name in needed]
+
+
+def run_stage(stage, profile=False):
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = LOG_DIR / f"{stage.name}.log"
+    command = [sys.executable, str(SRC_DIR / stage.script), *stage.args]
+    if profile:
+        # Whole-stage cProfile dump (inspect with `python -m pstats` or snakeviz)
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        command[1:1] = ["-m", "cProfile", "-o", str(PROFILE_DIR / f"{stage.name}.prof")]
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            command,
+            cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+            env={**os.environ, "MPLBACKEND": "Agg", "PYTHONIOENCODING": "utf-8"},
+        )
+    return proc.returncode, time.perf_counter() - start, log_path
+
+
+def run(targets=(), force=(), dry_run=False, n_jobs=2, profile=False, stages=STAGES):
+    stages = select(stages, list(targets))
+    state = load_state()
+    # Resolved from ROOT, the stages' working directory, not from ours
+    data_key = file_hash(find_data_csv(cwd=ROOT))
+
+    keys, status = {}, {}
+    pending = {s.name: s for s in stages}
+    running = {}
+
+    def ready(stage):
+        return all(status.get(d) in ("ran", "cached", "would run") for d in stage.deps)
+
+    # Stage scripts already parallelise internally (n_jobs=-1), so keep this small
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(status.get(d) in ("failed", "blocked") for d in stage.deps):
+                    status[name] = "blocked"
+                    del pending[name]
+                    print(f"⛔ {name}: skipped (upstream failed)")
+                elif ready(stage):
+                    del pending[name]
+                    keys[name] = stage_key(stage, data_key, [keys[d] for d in stage.deps])
+                    up_to_date = (state.get(name) == keys[name]
+                                  and all(Path(p).exists() for p in stage.outputs))
+                    if up_to_date and name not in force:
+                        status[name] = "cached"
+                        print(f"✅ {name}: up to date")
+                    elif dry_run:
+                        status[name] = "would run"
+                        print(f"🔜 {name}: would run {stage.script}")
+                    else:
+                        print(f"⏳ {name}: queued {stage.script}")
+                        running[pool.submit(run_stage, stage, profile)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                code, seconds, log_path = future.result()
+                if code == 0:
+                    status[name] = "ran"
+                    state[name] = keys[name]
+                    save_state(state)
+                    print(f"✅ {name}: done in {seconds:.1f}s")
+                else:
+                    status[name] = "failed"
+                    state.pop(name, None)
+                    save_state(state)
+                    print(f"❌ {name}: exit code {code}, see {log_path}")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the stage scripts as a cached dependency graph.")
+    parser.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="*", default=[], help="Re-run these stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--jobs", type=int, default=2, help="Stages run at the same time")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a cProfile dump per executed stage to output/reports/profiles/")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    status = run(args.targets, set(args.force), args.dry_run, args.jobs, args.profile)
+    counts = {s: list(status.values()).count(s) for s in ("ran", "would run", "cached", "failed", "blocked")}
+    ran = f"{counts['would run']} would run" if args.dry_run else f"{counts['ran']} ran"
+    print(f"\n🏁 {ran}, {counts['cached']} up to date, {counts['failed']} failed, "
+          f"{counts['blocked']} blocked ({time.perf_counter() - start:.1f}s)")
+    sys.exit(1 if counts["failed"] or counts["blocked"] else 0)
+
+
+if __name__ == "__main__":
+    main()
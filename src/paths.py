@@ -0,0 +1,33 @@
+"""
+Project paths shared by the stage scripts, the dashboard and the tooling.
+"""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # project root
+DATA_DIR = ROOT / "data"
+OUTPUT_DIR = ROOT / "output"
+OUTPUT_IMG_DIR = OUTPUT_DIR / "images"
+MODEL_DIR = OUTPUT_DIR / "models"
+CACHE_DIR = OUTPUT_DIR / "cache"
+REPORT_DIR = OUTPUT_DIR / "reports"
+
+
+def find_data_csv(filename="melb_data.csv", cwd=None):
+    """
+    Locate the raw dataset. The current working directory (or `cwd`) is tried
+    first so the old "run from the folder holding melb_data.csv" habit keeps
+    working.
+    """
+    candidates = [
+        Path(cwd or Path.cwd()) / filename,
+        ROOT / filename,
+        DATA_DIR / filename,
+        DATA_DIR / "processed" / filename,
+        DATA_DIR / "raw" / filename,
+    ]
+    path = next((p for p in candidates if p.exists()), None)
+    if path is None:
+        raise FileNotFoundError(
+            f"Cannot find {filename}. Tried:\n- " + "\n- ".join(str(p) for p in candidates)
+        )
+    return path
@@ -0,0 +1,276 @@
+"""
+Batch scoring for melbourne_housing_model.pkl.
+
+Streams a listings file (CSV or Parquet) in fixed-size chunks, runs each chunk
+through the saved Pipeline and appends the predictions to the output file, so
+memory use does not grow with the input size.
+
+With --intervals the output also gets Price_P10/P50/P90: percentiles of the
+forest's per-tree predictions. They are collected as one (rows x trees)
+matrix of leaf values (forest.apply() plus a single gather), so there is no
+retraining and no Python loop over the trees.
+
+Usage:
+    python src/predict.py listings.csv predictions.parquet
+    python src/predict.py listings.csv predictions.csv --chunksize 100000 --workers 4 --keep Address
+    python src/predict.py listings.csv predictions.csv --intervals            # P10/P50/P90
+    python src/predict.py listings.csv predictions.csv --intervals 5 50 95
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sklearn.ensemble import RandomForestRegressor
+
+from paths import MODEL_DIR
+from profiling import timed
+
+DEFAULT_MODEL = MODEL_DIR / "melbourne_housing_model.pkl"
+PREDICTION_COL = "Predicted_Price"
+INTERVAL_QUANTILES = (10, 50, 90)
+
+
+# =========================
+# Model
+# =========================
+def load_model(path=DEFAULT_MODEL, intervals=False):
+    """Pickled Pipeline, or a model artifact directory (see artifact.py)."""
+    if Path(path).is_dir():
+        # artifact -> forest_engine -> predict, so import on use
+        from artifact import load_artifact
+        model = load_artifact(path)
+    else:
+        model = joblib.load(path)
+    return interval_model(model) if intervals else model
+
+
+def interval_model(model):
+    """Model with predict_quantiles(): a CompiledPipeline as-is, a forest Pipeline wrapped."""
+    return model if hasattr(model, "predict_quantiles") else ForestIntervals(model)
+
+
+def interval_columns(quantiles):
+    return [f"Price_P{q:g}" for q in quantiles]
+
+
+def percentiles(per_tree, quantiles):
+    """
+    Percentiles (0-100) along axis 1, linearly interpolated like np.percentile,
+    from one sort of the (rows x trees) matrix: float64[len(quantiles), n_rows].
+    """
+    ranked = np.sort(per_tree, axis=1)
+    pos = np.asarray(quantiles, dtype=np.float64) / 100 * (ranked.shape[1] - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, ranked.shape[1] - 1)
+    frac = pos - lo
+    return (ranked[:, lo] * (1 - frac) + ranked[:, hi] * frac).T
+
+
+class ForestIntervals:
+    """
+    Fitted forest Pipeline plus one flat table of every tree's node values.
+    Per-tree predictions for a batch are then a single forest.apply() call
+    (leaf id per row and tree, threaded over the trees) and one gather.
+    """
+
+    def __init__(self, pipeline):
+        model = pipeline.named_steps["model"]
+        if not isinstance(model, RandomForestRegressor):
+            raise ValueError("Prediction intervals need a Random Forest model (they come from the spread of its trees)")
+        self.pipeline = pipeline
+        trees = [est.tree_ for est in model.estimators_]
+        self.offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+        self.values = np.concatenate([t.value[:, 0, 0] for t in trees])
+        self.feature_names_in_ = pipeline.feature_names_in_
+
+    def predict(self, X):
+        return self.pipeline.predict(X)
+
+    def predict_trees(self, X):
+        """Per-tree predictions: float64[n_rows, n_trees]."""
+        Xt = self.pipeline.named_steps["preprocessor"].transform(X)
+        leaves = self.pipeline.named_steps["model"].apply(Xt)
+        return self.values[leaves + self.offsets]
+
+    def predict_quantiles(self, X, quantiles):
+        """Mean prediction and per-tree percentiles, from one pass over the trees."""
+        per_tree = self.predict_trees(X)
+        return per_tree.mean(axis=1), percentiles(per_tree, quantiles)
+
+
+def model_inputs(pipeline):
+    """Raw columns the fitted pipeline was trained on."""
+    return list(pipeline.feature_names_in_)
+
+
+def score_chunk(pipeline, chunk, keep=(), quantiles=()):
+    """Predict one chunk; returns the kept columns plus the prediction (and percentiles)."""
+    X = chunk.reindex(columns=model_inputs(pipeline))
+    out = chunk[list(keep)].copy()
+    if quantiles:
+        out[PREDICTION_COL], bounds = pipeline.predict_quantiles(X, list(quantiles))
+        for col, values in zip(interval_columns(quantiles), bounds):
+            out[col] = values
+    else:
+        out[PREDICTION_COL] = pipeline.predict(X)
+    return out
+
+
+# Worker-side state for the process pool: each worker loads the model once.
+_worker_model = None
+
+
+def _init_worker(model_path, intervals):
+    global _worker_model
+    _worker_model = load_model(model_path, intervals)
+
+
+def _score_in_worker(chunk, keep, quantiles):
+    return score_chunk(_worker_model, chunk, keep, quantiles)
+
+
+# =========================
+# Streaming I/O
+# =========================
+def iter_chunks(path, columns, chunksize, keep=()):
+    """Yield DataFrames of at most `chunksize` rows with the requested columns."""
+    path = Path(path)
+    wanted = set(columns) | set(keep)
+
+    if path.suffix == ".parquet":
+        pf = pq.ParquetFile(path)
+        present = [c for c in pf.schema_arrow.names if c in wanted]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=present):
+            chunk = batch.to_pandas()
+            if keep:
+                chunk[list(keep)] = chunk[list(keep)].astype("string")
+            yield chunk
+    else:
+        # Kept columns are read as strings so every chunk has the same schema
+        reader = pd.read_csv(
+            path,
+            usecols=lambda c: c in wanted,
+            dtype={c: "string" for c in keep},
+            chunksize=chunksize,
+        )
+        # A header-only file yields one empty chunk; skip it so nothing is scored
+        yield from (chunk for chunk in reader if len(chunk))
+
+
+class PredictionWriter:
+    """
+    Append-only writer for CSV or Parquet output. `columns` is the header
+    written when no chunk arrives (empty input).
+    """
+
+    def __init__(self, path, columns=(PREDICTION_COL,)):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._parquet = None
+        self._first = True
+
+    def write(self, df):
+        if self.path.suffix == ".parquet":
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._first:
+            # Empty input: still leave a valid file with the full header
+            empty = pd.DataFrame(columns=self.columns)
+            if self.path.suffix == ".parquet":
+                empty.to_parquet(self.path, index=False)
+            else:
+                empty.to_csv(self.path, index=False)
+
+
+# =========================
+# Driver
+# =========================
+@timed("predict_file")
+def predict_file(input_path, output_path, model_path=DEFAULT_MODEL,
+                 chunksize=50_000, workers=1, keep=(), quantiles=()):
+    """
+    Score `input_path` into `output_path`. With workers > 1, chunks are spread
+    over a process pool; at most 2 * workers chunks are in flight so memory
+    stays bounded, and output order matches input order. Non-empty
+    `quantiles` (0-100) add one percentile column each.
+    """
+    keep, quantiles = list(keep), list(quantiles)
+    pipeline = load_model(model_path, intervals=bool(quantiles))
+    chunks = iter_chunks(input_path, model_inputs(pipeline), chunksize, keep)
+    writer = PredictionWriter(output_path, keep + [PREDICTION_COL] + (interval_columns(quantiles) if quantiles else []))
+    n_rows = 0
+
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                result = score_chunk(pipeline, chunk, keep, quantiles)
+                writer.write(result)
+                n_rows += len(result)
+        else:
+            del pipeline  # workers load their own copy
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(model_path, bool(quantiles))
+            ) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(_score_in_worker, chunk, keep, quantiles))
+                    if len(pending) >= 2 * workers:
+                        result = pending.pop(0).result()
+                        writer.write(result)
+                        n_rows += len(result)
+                for future in pending:
+                    result = future.result()
+                    writer.write(result)
+                    n_rows += len(result)
+    finally:
+        writer.close()
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score listings with the saved housing model.")
+    parser.add_argument("input", help="Listings file (.csv or .parquet)")
+    parser.add_argument("output", help="Predictions file (.csv or .parquet)")
+    parser.add_argument("--model", default=str(DEFAULT_MODEL),
+                        help="Path to melbourne_housing_model.pkl or a model artifact directory")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Processes to spread chunks across")
+    parser.add_argument("--keep", nargs="*", default=[], help="Input columns to copy to the output (e.g. Address)")
+    parser.add_argument("--intervals", nargs="*", type=float, default=None, metavar="Q",
+                        help="Add per-tree percentile columns (default 10 50 90; forest models only)")
+    args = parser.parse_args(argv)
+
+    if not Path(args.model).exists():
+        print(f"❌ Model not found: {args.model} (run 7_final_optimization.py first)")
+        sys.exit(1)
+
+    n_rows = predict_file(
+        args.input, args.output,
+        model_path=args.model,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        keep=args.keep,
+        quantiles=() if args.intervals is None else (args.intervals or INTERVAL_QUANTILES),
+    )
+    print(f"✅ Scored {n_rows:,} listings -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Lightweight timing / memory instrumentation for the scripts and the dashboard.
+
+    from profiling import span, timed
+
+    with span("fit", rows=len(X)):
+        model.fit(X, y)
+
+    @timed("render")
+    def save_plot(...): ...
+
+The stage scripts wrap their fit / predict / plot steps in spans. Every span
+records wall and CPU time and the process RSS; nested spans are recorded as
+"outer/inner" paths. Writing them to a file is opt-in. Environment switches:
+
+- PROFILE_TRACE=1     append each finished span as one JSON line to
+                      output/reports/trace.jsonl (PROFILE_TRACE=path: to
+                      that file instead)
+- PROFILE=1           also print each finished span to stderr
+- PROFILE_MEMORY=1    trace Python allocations (tracemalloc) and record the
+                      peak per span (slows the code down noticeably)
+- PROFILE_CPROFILE=1  dump a cProfile file per top-level span to
+                      output/reports/profiles/
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+from paths import REPORT_DIR
+
+try:
+    import psutil
+except ImportError:  # optional: fall back to the peak RSS from getrusage
+    psutil = None
+
+_trace_env = os.environ.get("PROFILE_TRACE", "")
+TRACE_PATH = REPORT_DIR / "trace.jsonl" if _trace_env == "1" else (Path(_trace_env) if _trace_env else None)
+PROFILE_DIR = REPORT_DIR / "profiles"
+VERBOSE = os.environ.get("PROFILE") == "1"
+TRACE_MEMORY = os.environ.get("PROFILE_MEMORY") == "1"
+TRACE_CPROFILE = os.environ.get("PROFILE_CPROFILE") == "1"
+
+RUN_ID = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+SCRIPT = Path(sys.argv[0]).name if sys.argv and sys.argv[0] else "python"
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def rss_mb():
+    """Current resident set size (peak RSS if psutil is missing), in MB."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _write(record):
+    if TRACE_PATH is None:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        TRACE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # One write per line in append mode, so worker processes can share the file
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name, sink=None, memory=None, profile=None, **attrs):
+    """
+    Time the enclosed block. Extra keyword arguments are stored on the record;
+    the yielded record can also be updated inside the block. If `sink` is a
+    list, the finished record is appended to it.
+    """
+    stack = _local.__dict__.setdefault("stack", [])
+    memory = TRACE_MEMORY if memory is None else memory
+    # cProfile cannot nest: only the outermost profiled span gets a profiler
+    profile = (TRACE_CPROFILE if profile is None else profile) and not any(r.get("_prof") for r in stack)
+
+    record = {
+        "run": RUN_ID, "script": SCRIPT, "pid": os.getpid(),
+        "span": "/".join([r["name"] for r in stack] + [name]), "name": name,
+        "start": datetime.now().isoformat(timespec="milliseconds"), **attrs,
+    }
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack and "_mem_peak" in stack[-1]:
+            # reset_peak() below would lose what the parent reached so far
+            stack[-1]["_mem_peak"] = max(stack[-1]["_mem_peak"], peak)
+        record["_mem_base"] = current
+        record["_mem_peak"] = current
+        tracemalloc.reset_peak()
+    if profile:
+        record["_prof"] = cProfile.Profile()
+
+    rss_start = rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    stack.append(record)
+    if profile:
+        record["_prof"].enable()
+    try:
+        yield record
+    finally:
+        if profile:
+            record["_prof"].disable()
+        stack.pop()
+        record["wall_s"] = round(time.perf_counter() - wall_start, 6)
+        record["cpu_s"] = round(time.process_time() - cpu_start, 6)
+        rss_end = rss_mb()
+        record["rss_mb"] = round(rss_end, 1)
+        record["rss_delta_mb"] = round(rss_end - rss_start, 1)
+
+        if memory:
+            # reset_peak() in inner spans hides their peaks from us, so they report upwards
+            peak = max(record.pop("_mem_peak"), tracemalloc.get_traced_memory()[1])
+            record["peak_alloc_mb"] = round((peak - record.pop("_mem_base")) / 1e6, 2)
+            if stack and "_mem_peak" in stack[-1]:
+                stack[-1]["_mem_peak"] = max(stack[-1]["_mem_peak"], peak)
+        if profile:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            prof_path = PROFILE_DIR / f"{RUN_ID}_{record['span'].replace('/', '.')}.prof"
+            record.pop("_prof").dump_stats(prof_path)
+            record["profile"] = str(prof_path)
+
+        _write(record)
+        if sink is not None:
+            sink.append(record)
+        if VERBOSE:
+            mem = f", peak alloc {record['peak_alloc_mb']:.1f} MB" if "peak_alloc_mb" in record else ""
+            print(f"⏱️ {record['span']}: {record['wall_s']:.3f}s wall, {record['cpu_s']:.3f}s CPU, "
+                  f"RSS {record['rss_mb']:.0f} MB ({record['rss_delta_mb']:+.0f}){mem}", file=sys.stderr)
+
+
+def timed(name=None, **span_kwargs):
+    """Decorator form of span(); the span name defaults to the function name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, **span_kwargs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_trace(path=TRACE_PATH, run=None):
+    """Trace records (optionally of one run) as a list of dicts."""
+    if path is None or not Path(path).exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r for r in records if run is None or r["run"] == run]
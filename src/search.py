@@ -0,0 +1,250 @@
+"""
+Hyperparameter search for the production Random Forest.
+
+Successive halving over two resources, number of trees and fraction of the
+training rows: every candidate starts small, and after each rung only the best
+1/eta go on to a budget eta times larger. Forests are grown with warm_start,
+so promoting a candidate only fits the extra trees (on the larger sample)
+instead of refitting the whole forest.
+
+The preprocessor is fitted once per CV fold and shared by every candidate.
+Every (candidate, rung) result is written to a SQLite store; re-running the
+same study skips the evaluations already recorded. A candidate resumed
+without its forest in memory re-grows its earlier rungs first, so every
+score of a rung comes from identically warm-started forests. Results are
+keyed by the setup as well (feature set, folds, data hash) and by the rung's
+trees and row fraction, so a changed dataset or budget is evaluated afresh,
+never resumed.
+
+Usage:
+    python src/search.py --study slim-rf --candidates 27 --eta 3
+    python src/search.py --study slim-rf --show
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold
+
+from features import load_features
+from model import FEATURE_SETS, build_preprocessor, select_inputs
+from paths import CACHE_DIR
+from validation import data_hash
+
+DEFAULT_DB = CACHE_DIR / "search.sqlite"
+
+SEARCH_SPACE = {
+    "max_depth": [None, 12, 20, 30],
+    "max_features": [1.0, 0.5, 0.33, "sqrt"],
+    "min_samples_leaf": [1, 2, 4, 8],
+}
+
+
+# =========================
+# Trial store
+# =========================
+class TrialStore:
+    """SQLite table of (study, setup, config, rung, n_estimators, sample_frac) -> scores."""
+
+    KEY = "study = ? AND setup = ? AND config = ? AND rung = ? AND n_estimators = ? AND sample_frac = ?"
+
+    def __init__(self, path=DEFAULT_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(trials)")]
+        if columns and "setup" not in columns:
+            # Trials stored before the setup key: kept aside, never resumed from
+            self.conn.execute("ALTER TABLE trials RENAME TO trials_unkeyed")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trials (
+                study TEXT, setup TEXT, config TEXT, rung INTEGER,
+                n_estimators INTEGER, sample_frac REAL,
+                r2 REAL, mae REAL, seconds REAL, created TEXT,
+                PRIMARY KEY (study, setup, config, rung, n_estimators, sample_frac)
+            )""")
+
+    def get(self, study, setup, config, rung, n_estimators, sample_frac):
+        row = self.conn.execute(
+            f"SELECT r2, mae FROM trials WHERE {self.KEY}",
+            (study, setup, config, rung, n_estimators, sample_frac),
+        ).fetchone()
+        return None if row is None else {"r2": row[0], "mae": row[1]}
+
+    def put(self, study, setup, config, rung, n_estimators, sample_frac, r2, mae, seconds):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (study, setup, config, rung, n_estimators, sample_frac, r2, mae, seconds,
+             datetime.now().isoformat(timespec="seconds")),
+        )
+        self.conn.commit()
+
+    def leaderboard(self, study, limit=10):
+        return self.conn.execute("""
+            SELECT setup, config, rung, n_estimators, sample_frac, r2, mae, seconds
+            FROM trials WHERE study = ?
+            ORDER BY rung DESC, r2 DESC LIMIT ?""", (study, limit)).fetchall()
+
+
+# =========================
+# Search
+# =========================
+def config_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def setup_key(features, n_splits, X, y):
+    """Short hash of everything besides the config that a trial's score depends on."""
+    setup = {"features": list(features), "folds": n_splits, "data": data_hash(X, y)}
+    return hashlib.blake2b(json.dumps(setup).encode(), digest_size=6).hexdigest()
+
+
+def sample_candidates(n, seed=0):
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if n >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, n)
+
+
+def prepare_folds(X, y, features, n_splits, seed=1):
+    """Preprocess each fold once; also fix a row order so samples grow as nested prefixes."""
+    folds = []
+    rng = np.random.default_rng(seed)
+    for train_idx, val_idx in KFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X):
+        pre = build_preprocessor(features, backend='forest')
+        # fit_transform with y, as Pipeline.fit does (target-aware transformers see y)
+        X_train = pre.fit_transform(X.iloc[train_idx], y.iloc[train_idx])
+        order = rng.permutation(len(train_idx))
+        folds.append({
+            "X_train": X_train[order],
+            "y_train": y.iloc[train_idx].to_numpy()[order],
+            "X_val": pre.transform(X.iloc[val_idx]),
+            "y_val": y.iloc[val_idx].to_numpy(),
+        })
+    return folds
+
+
+def _grow_to(model, fold, n_estimators, sample_frac):
+    n_rows = max(2, int(sample_frac * len(fold["y_train"])))
+    model.set_params(n_estimators=n_estimators)
+    # warm_start keeps the existing trees and only fits the new ones
+    model.fit(fold["X_train"][:n_rows], fold["y_train"][:n_rows])
+
+
+def grow(models, params, folds, n_estimators, sample_frac, random_state=1, replay=()):
+    """
+    Grow (or start) one forest per fold up to n_estimators on the first
+    sample_frac rows. A new forest first re-grows the earlier rungs in
+    `replay` ((n_estimators, sample_frac) pairs, unscored): tree i always
+    gets the same seed, so a resumed study rebuilds exactly the forests an
+    uninterrupted run would hold.
+    """
+    if models is None:
+        models = [
+            RandomForestRegressor(warm_start=True, n_estimators=0, random_state=random_state, **params)
+            for _ in folds
+        ]
+        for model, fold in zip(models, folds):
+            for n_trees, frac in replay:
+                _grow_to(model, fold, n_trees, frac)
+    r2, mae = [], []
+    start = time.perf_counter()
+    for model, fold in zip(models, folds):
+        _grow_to(model, fold, n_estimators, sample_frac)
+        pred = model.predict(fold["X_val"])
+        r2.append(r2_score(fold["y_val"], pred))
+        mae.append(mean_absolute_error(fold["y_val"], pred))
+    return models, float(np.mean(r2)), float(np.mean(mae)), time.perf_counter() - start
+
+
+def successive_halving(study, features, candidates, eta=3, min_trees=10, max_trees=270,
+                       min_frac=1 / 9, n_splits=3, n_jobs=-1, store=None):
+    store = store or TrialStore()
+    df = load_features(impute=False)
+    X, y = select_inputs(df, features), df["Price"]
+    setup = setup_key(features, n_splits, X, y)
+    folds = None  # prepared lazily: a fully resumed study needs no data work
+
+    n_rungs = int(round(np.log(max_trees / min_trees) / np.log(eta))) + 1
+    schedule = [(int(min(max_trees, min_trees * eta ** rung)), float(min(1.0, min_frac * eta ** rung)))
+                for rung in range(n_rungs)]
+    alive = {config_key(p): p for p in candidates}
+    models = {}
+
+    for rung in range(n_rungs):
+        n_trees, frac = schedule[rung]
+        print(f"⏳ Rung {rung}: {len(alive)} candidates x {n_trees} trees on {frac:.0%} of rows")
+
+        todo = [k for k in alive if store.get(study, setup, k, rung, n_trees, frac) is None]
+        if todo:
+            folds = folds or prepare_folds(X, y, features, n_splits)
+            # Threads: tree building releases the GIL and the forests stay in this process
+            results = Parallel(n_jobs=n_jobs, prefer="threads")(
+                # Candidates without a forest in memory (resumed study) replay the earlier rungs
+                delayed(grow)(models.get(k), alive[k], folds, n_trees, frac, replay=schedule[:rung]) for k in todo
+            )
+            for k, (fitted, r2, mae, seconds) in zip(todo, results):
+                models[k] = fitted
+                store.put(study, setup, k, rung, n_trees, frac, r2, mae, seconds)
+
+        scores = {k: store.get(study, setup, k, rung, n_trees, frac)["r2"] for k in alive}
+        n_keep = max(1, len(alive) // eta)
+        if rung == n_rungs - 1:
+            n_keep = 1
+        ranked = sorted(alive, key=scores.get, reverse=True)
+        # Dropped candidates release their forests right away
+        for k in ranked[n_keep:]:
+            models.pop(k, None)
+        alive = {k: alive[k] for k in ranked[:n_keep]}
+
+    best = next(iter(alive))
+    return json.loads(best), store.get(study, setup, best, n_rungs - 1, n_trees, frac)
+
+
+def show(study, store):
+    rows = store.leaderboard(study)
+    print("\n" + "=" * 40)
+    print(f"🏁 SEARCH LEADERBOARD ({study})")
+    print("=" * 40)
+    for setup, config, rung, n_trees, frac, r2, mae, seconds in rows:
+        print(f"{setup} | rung {rung} | {n_trees:>4} trees | {frac:>4.0%} rows | R² {r2:.4f} | MAE ${mae:,.0f} | {seconds:5.1f}s | {config}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Successive-halving search for the Random Forest.")
+    parser.add_argument("--study", default="slim-rf", help="Name used to store / resume trials")
+    parser.add_argument("--features", choices=sorted(FEATURE_SETS), default="slim")
+    parser.add_argument("--candidates", type=int, default=27)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--min-trees", type=int, default=10)
+    parser.add_argument("--max-trees", type=int, default=270)
+    parser.add_argument("--min-frac", type=float, default=1 / 9)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=str(DEFAULT_DB))
+    parser.add_argument("--show", action="store_true", help="Print the stored leaderboard and exit")
+    args = parser.parse_args(argv)
+
+    store = TrialStore(Path(args.db))
+    if not args.show:
+        best, score = successive_halving(
+            args.study, FEATURE_SETS[args.features], sample_candidates(args.candidates, args.seed),
+            eta=args.eta, min_trees=args.min_trees, max_trees=args.max_trees,
+            min_frac=args.min_frac, n_splits=args.folds, n_jobs=args.jobs, store=store,
+        )
+        print(f"\n✅ Best: {best} -> R² {score['r2']:.4f}, MAE ${score['mae']:,.0f}")
+    show(args.study, store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Local HTTP prediction service for melbourne_housing_model.pkl.
+
+The pipeline is loaded once and kept warm. Concurrent requests are merged into
+micro-batches so each RandomForest predict call traverses the trees for many
+listings at once instead of paying the per-call overhead for every row.
+
+Endpoints:
+    POST /predict   one listing (JSON object) or many (JSON list, or {"listings": [...]})
+    POST /explain   same input; per-feature price contributions (with --explain, see explain.py)
+    GET  /stats     latency percentiles and throughput counters
+    GET  /health
+
+Usage:
+    python src/serve.py --port 8000
+    python src/serve.py --port 8000 --explain
+    curl -s localhost:8000/predict -d '{"Lattitude": -37.8, "Longtitude": 145.0, "Rooms": 3,
+        "Distance": 8.0, "Landsize": 500, "BuildingArea": 150, "Type": "h",
+        "Bathroom": 2, "House_Age": 30}'
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from model import CATEGORICAL_FEATURES, FEATURES_SLIM
+from explain import BASE_COL, TreeExplainer, contrib_columns
+from predict import DEFAULT_MODEL, PREDICTION_COL, load_model, model_inputs
+
+
+def listings_frame(records, columns):
+    X = pd.DataFrame(records, columns=columns)
+    for col in CATEGORICAL_FEATURES:
+        if col in X.columns:
+            # JSON may carry numbers/nulls; the encoder needs strings or NaN
+            X[col] = X[col].map(lambda v: v if pd.isna(v) else str(v)).astype(object)
+    return X
+
+
+# =========================
+# Micro-batching
+# =========================
+class MicroBatcher:
+    """
+    Collects listings from concurrent requests and predicts them together.
+
+    A batch is flushed when it reaches `max_batch` rows or when the oldest
+    request has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, pipeline, max_batch=256, max_wait_ms=5.0):
+        self.pipeline = pipeline
+        self.columns = model_inputs(pipeline)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_sizes = deque(maxlen=10_000)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, records):
+        """Queue a list of listing dicts; the Future resolves to a list of prices."""
+        future = Future()
+        self._queue.put((records, future))
+        return future
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            n_rows = len(items[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                items.append(item)
+                n_rows += len(item[0])
+            self._flush(items)
+
+    def _flush(self, items):
+        records = [r for recs, _ in items for r in recs]
+        try:
+            preds = self.pipeline.predict(listings_frame(records, self.columns))
+        except Exception as exc:  # one bad batch must not kill the worker thread
+            for _, future in items:
+                future.set_exception(exc)
+            return
+
+        self.batch_sizes.append(len(records))
+        start = 0
+        for recs, future in items:
+            future.set_result(preds[start:start + len(recs)].tolist())
+            start += len(recs)
+
+
+# =========================
+# Counters
+# =========================
+class LatencyStats:
+    """Thread-safe request latency window and throughput counters."""
+
+    def __init__(self, window=10_000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.started = time.time()
+        self.requests = 0
+        self.listings = 0
+        self.errors = 0
+
+    def record(self, seconds, n_listings):
+        with self._lock:
+            self._latencies.append(seconds)
+            self.requests += 1
+            self.listings += n_listings
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self, batch_sizes=()):
+        with self._lock:
+            lat = np.array(self._latencies) * 1000.0
+            uptime = time.time() - self.started
+            out = {
+                "requests": self.requests,
+                "listings": self.listings,
+                "errors": self.errors,
+                "uptime_s": round(uptime, 1),
+                "requests_per_s": round(self.requests / uptime, 2) if uptime else 0.0,
+                "listings_per_s": round(self.listings / uptime, 2) if uptime else 0.0,
+            }
+        if len(lat):
+            out["latency_ms"] = {
+                "p50": round(float(np.percentile(lat, 50)), 3),
+                "p99": round(float(np.percentile(lat, 99)), 3),
+                "max": round(float(lat.max()), 3),
+            }
+        if len(batch_sizes):
+            out["mean_batch_size"] = round(float(np.mean(batch_sizes)), 2)
+        return out
+
+
+# =========================
+# HTTP layer
+# =========================
+def parse_listings(payload):
+    """Accept an object, a list of objects or {"listings": [...]}."""
+    if isinstance(payload, dict) and "listings" in payload:
+        payload = payload["listings"]
+    single = isinstance(payload, dict)
+    records = [payload] if single else payload
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a listing object, a list of listings or {\"listings\": [...]}")
+    return records, single
+
+
+def explain_records(explainer, records):
+    """Prediction, base price and per-feature contributions for each listing."""
+    result = explainer.explain(listings_frame(records, model_inputs(explainer.compiled)))
+    return [
+        {
+            "prediction": row[PREDICTION_COL],
+            "base": row[BASE_COL],
+            "contributions": {name: row[col] for name, col in zip(explainer.names, contrib_columns(explainer.names))},
+        }
+        for row in result.to_dict("records")
+    ]
+
+
+def make_handler(batcher, stats, explainer=None):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "features": FEATURES_SLIM})
+            elif self.path == "/stats":
+                self._send_json(200, stats.snapshot(list(batcher.batch_sizes)))
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path not in ("/predict", "/explain"):
+                self._send_json(404, {"error": "not found"})
+                return
+            if self.path == "/explain" and explainer is None:
+                self._send_json(404, {"error": "explanations are off (start the server with --explain)"})
+                return
+
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                records, single = parse_listings(json.loads(self.rfile.read(length)))
+            except (ValueError, json.JSONDecodeError) as exc:
+                stats.record_error()
+                self._send_json(400, {"error": str(exc)})
+                return
+
+            try:
+                if self.path == "/explain":
+                    # Not micro-batched: the explainer already works on the whole request at once
+                    results = explain_records(explainer, records) if records else []
+                    body = {"explanation": results[0]} if single else {"explanations": results}
+                else:
+                    preds = batcher.submit(records).result() if records else []
+                    body = {"prediction": preds[0]} if single else {"predictions": preds}
+            except Exception as exc:
+                stats.record_error()
+                self._send_json(500, {"error": str(exc)})
+                return
+
+            stats.record(time.perf_counter() - start, len(records))
+            self._send_json(200, body)
+
+        def log_message(self, format, *args):
+            pass  # keep the console quiet under load; use /stats instead
+
+    return PredictionHandler
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # default of 5 resets connections under concurrent load
+
+
+def serve(host="127.0.0.1", port=8000, model_path=DEFAULT_MODEL, max_batch=256, max_wait_ms=5.0, explain=False):
+    pipeline = load_model(model_path)
+    batcher = MicroBatcher(pipeline, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    stats = LatencyStats()
+    # Warm-up call so the first real request doesn't pay for lazy initialisation
+    batcher.submit([{"Type": "h"}]).result()
+    # Leaf tables are built once up front (a second or two and ~150 MB for the production forest)
+    explainer = TreeExplainer.from_model(pipeline, model_path=model_path) if explain else None
+
+    server = PredictionServer((host, port), make_handler(batcher, stats, explainer))
+    print(f"✅ Serving {model_path} on http://{host}:{port} (max_batch={max_batch}, max_wait={max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve housing price predictions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=str(DEFAULT_MODEL))
+    parser.add_argument("--max-batch", type=int, default=256, help="Max listings per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Max time a request waits for a batch to fill")
+    parser.add_argument("--explain", action="store_true", help="Enable POST /explain (forest models only)")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.model, args.max_batch, args.max_wait_ms, args.explain)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Cross-validation on one shared copy of the encoded feature matrix.
+
+validation.cross_validate sends the raw input frame to every fold worker,
+which means one pickled copy per process. Each worker then runs the
+preprocessor over its rows (HousingFeatures block, one-hot matrix, their
+float64 hstack, the forest's float32 copy), so peak RAM grows with the
+number of workers.
+
+With cross_validate(..., shared=True) the parent encodes the frame once,
+in row chunks, into a float32 design in multiprocessing.shared_memory: the
+HousingFeatures block (not imputed) next to one-hot columns for every
+category, plus the target. Workers attach to it by name (zero-copy views)
+and each fold then:
+
+- takes its medians from its own training rows of the shared block, so
+  imputation is still learned inside the fold
+- writes its imputed training rows into a single float32 array, the only
+  copy of the data a worker makes. RandomForestRegressor uses it as-is, and
+  its tree-building threads (n_jobs) share it
+- predicts its test rows the same way and saves a regular fitted Pipeline
+  (preprocessor fitted from the fold's levels and medians, see
+  model.fit_from_levels)
+
+The folds are identical to those of the pickling path (same matrix, same
+seeds), so both paths share the fold cache in output/cache/cv/. Only the
+forest backend without geo features is supported: hgb codes categories
+per fold, and the nearby-sales features are fitted with the target.
+
+Run as a script, both paths run in fresh processes on the same folds. The
+peak memory of each process tree is sampled (PSS, so shared pages count
+once) and written to output/reports/shared_train.csv.
+
+Usage:
+    python src/shared_train.py --features full --jobs 5
+    python src/shared_train.py --scale 10 --trees 50 --folds 4
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.preprocessing import OneHotEncoder
+
+from features import HousingFeatures
+from model import fit_from_levels
+from paths import REPORT_DIR
+from profiling import span
+from validation import _dump_atomic, _meta_path, cached_meta
+
+try:
+    import psutil
+except ImportError:  # only the memory comparison needs it
+    psutil = None
+
+ENCODE_ROWS = 65_536    # rows encoded / imputed per step, bounds the temporaries
+RESULTS_PATH = REPORT_DIR / "shared_train.csv"
+
+
+# =========================
+# Shared design matrix
+# =========================
+def supports_shared(pipeline):
+    """True for forest pipelines: median-imputed HousingFeatures + one-hot, no geo features."""
+    transformers = pipeline.named_steps["preprocessor"].transformers
+    return (
+        [name for name, _, _ in transformers] == ["num", "cat"]
+        and transformers[0][1].impute
+        and isinstance(transformers[1][1], OneHotEncoder)
+    )
+
+
+def _attach(spec, key):
+    # Workers share the parent's resource tracker (multiprocessing and loky
+    # pass it on), so attaching registers nothing new and only the parent unlinks
+    name, shape, dtype = spec[key]
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+
+class SharedDesign:
+    """
+    Encoded inputs (float32) and target (float64) of a forest pipeline in
+    shared memory. Use as a context manager: the segments are unlinked on
+    exit. `spec` is the small picklable handle the workers attach with.
+    """
+
+    def __init__(self, pipeline, X, y):
+        if not supports_shared(pipeline):
+            raise ValueError("Shared training needs the forest backend without geo features")
+        (_, num, num_cols), (_, cat, cat_cols) = pipeline.named_steps["preprocessor"].transformers
+        _, layout = num._block(X.iloc[:0][num_cols])
+        encoder = clone(cat).fit(X[cat_cols])
+        n_onehot = sum(len(c) for c in encoder.categories_)
+        shape = (len(X), len(layout) + n_onehot)
+
+        self._segments = []
+        x_view = self._allocate("x", shape, np.float32)
+        y_view = self._allocate("y", (len(X),), np.float64)
+        with span("share_design", rows=shape[0], cols=shape[1], mb=round(x_view.nbytes / 1e6, 1)):
+            for start in range(0, len(X), ENCODE_ROWS):
+                rows = X.iloc[start:start + ENCODE_ROWS]
+                x_view[start:start + len(rows), :len(layout)] = num._block(rows[num_cols])[0]
+                x_view[start:start + len(rows), len(layout):] = encoder.transform(rows[cat_cols]).toarray()
+            y_view[:] = np.asarray(y, dtype=np.float64)
+
+        self.spec = {
+            **{key: (shm.name, shape, dtype) for key, shm, shape, dtype in self._segments},
+            "layout": layout,
+            "numeric": list(num.columns),
+            "categories": dict(zip(cat_cols, encoder.categories_)),
+        }
+
+    def _allocate(self, key, shape, dtype):
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        # Keep the segment, not the returned view: close() fails while a view of the buffer is alive
+        self._segments.append((key, shm, shape, np.dtype(dtype).str))
+        return np.ndarray(shape, dtype, buffer=shm.buf)
+
+    def close(self):
+        for _, shm, _, _ in self._segments:
+            shm.close()
+            shm.unlink()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =========================
+# Folds
+# =========================
+def _fold_encoding(spec, X, rows):
+    """Fitted HousingFeatures, one-hot columns to keep and levels for the training `rows`."""
+    layout = spec["layout"]
+    num = HousingFeatures(spec["numeric"])
+    # Same medians as HousingFeatures.fit on these rows, one column at a time
+    with warnings.catch_warnings():
+        # All-NaN columns (e.g. House_Age when only Date/YearBuilt are given)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        medians = np.array([np.nanmedian(X[rows, j]) for j in range(len(layout))])
+    num.medians_ = np.nan_to_num(medians, nan=0.0).astype(np.float32)
+
+    # One-hot columns of the levels seen in training; the rest are what handle_unknown="ignore" drops
+    keep, levels, offset = [], {}, len(layout)
+    for col, categories in spec["categories"].items():
+        seen = [i for i in range(len(categories)) if X[rows, offset + i].any()]
+        keep += [offset + i for i in seen]
+        levels[col] = list(categories[seen])
+        offset += len(categories)
+    return num, np.array(keep, dtype=np.intp), levels
+
+
+def _fold_matrix(X, rows, num, layout, keep):
+    """Imputed, encoded `rows` as one float32 array, built ENCODE_ROWS rows at a time."""
+    out = np.empty((len(rows), len(num.columns) + len(keep)), dtype=np.float32)
+    for start in range(0, len(rows), ENCODE_ROWS):
+        part = rows[start:start + ENCODE_ROWS]
+        out[start:start + len(part), :len(num.columns)] = num.transform_block(X[part, :len(layout)], layout)
+        out[start:start + len(part), len(num.columns):] = X[np.ix_(part, keep)]
+    return out
+
+
+def fit_fold_shared(pipeline, spec, train_idx, test_idx, path):
+    """validation._fit_fold on the shared design: same return value, same cache files."""
+    meta_path = _meta_path(path)
+    meta = cached_meta(path)
+    if meta is not None:
+        return meta["pred"], meta["fit_seconds"], True
+
+    x_shm, X = _attach(spec, "x")
+    y_shm, y = _attach(spec, "y")
+    try:
+        model = clone(pipeline)
+        num, keep, levels = _fold_encoding(spec, X, train_idx)
+        fit_from_levels(model.named_steps["preprocessor"], spec["numeric"] + list(levels), levels, num.medians_)
+
+        start = time.perf_counter()
+        X_train = _fold_matrix(X, train_idx, num, spec["layout"], keep)
+        with span("fit", rows=len(train_idx), shared=True):
+            model.named_steps["model"].fit(X_train, y[train_idx])
+        fit_seconds = time.perf_counter() - start
+        del X_train
+        with span("predict", rows=len(test_idx), shared=True):
+            pred = model.named_steps["model"].predict(_fold_matrix(X, test_idx, num, spec["layout"], keep))
+    finally:
+        del X, y
+        x_shm.close()
+        y_shm.close()
+
+    # Model first: the meta file is what marks the fold as complete
+    _dump_atomic(model, path)
+    _dump_atomic({"test_idx": test_idx, "pred": pred, "fit_seconds": fit_seconds}, meta_path)
+    return pred, fit_seconds, False
+
+
+# =========================
+# Memory comparison
+# =========================
+def tree_pss_mb(proc):
+    """Proportional set size of `proc` and its descendants (shared pages split between them), in MB."""
+    total = 0
+    for p in [proc] + proc.children(recursive=True):
+        try:
+            total += p.memory_full_info().pss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return total / 1e6
+
+
+def run_measured(cmd, interval):
+    """Run `cmd`; wall seconds and peak process-tree PSS while it runs."""
+    start = time.perf_counter()
+    child = subprocess.Popen(cmd)
+    proc, peak = psutil.Process(child.pid), 0.0
+    while child.poll() is None:
+        try:
+            peak = max(peak, tree_pss_mb(proc))
+        except psutil.NoSuchProcess:
+            break
+        time.sleep(interval)
+    if child.wait():
+        raise SystemExit(f"❌ {' '.join(map(str, cmd))} failed")
+    return time.perf_counter() - start, peak
+
+
+def run_cv(args, shared, oof_path):
+    """One cross-validation in this process (the child side of the comparison)."""
+    from sklearn.model_selection import KFold
+
+    from bench_scale import synthetic_csv
+    from features import load_features
+    from model import FEATURE_SETS, build_pipeline, select_inputs
+    from validation import cross_validate
+
+    df = load_features(synthetic_csv(args.scale), impute=False)
+    features = FEATURE_SETS[args.features]
+    X, y = select_inputs(df, features), df["Price"]
+    del df
+    pipeline = build_pipeline(features, n_estimators=args.trees, backend="forest")
+    cv = KFold(n_splits=args.folds, shuffle=True, random_state=1)
+    # Fresh cache: both paths really fit
+    cache_dir = Path(tempfile.mkdtemp(prefix="shared_cv_"))
+    try:
+        result = cross_validate(pipeline, X, y, cv=cv, n_jobs=args.jobs, cache_dir=cache_dir, shared=shared)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    np.save(oof_path, result.oof_pred)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory of shared-memory vs pickled cross-validation.")
+    parser.add_argument("--features", choices=["full", "slim"], default="full")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, help="Fold workers (default: one per fold)")
+    parser.add_argument("--scale", type=int, default=1, help="Synthetic copy of melb_data.csv (see bench_scale.py)")
+    parser.add_argument("--interval", type=float, default=0.05, help="Memory sampling interval (s)")
+    parser.add_argument("--run", choices=["pickled", "shared"], help=argparse.SUPPRESS)
+    parser.add_argument("--oof", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.jobs = args.jobs or args.folds
+
+    if args.run:
+        run_cv(args, args.run == "shared", args.oof)
+        return
+    if psutil is None:
+        raise SystemExit("❌ The memory comparison needs psutil (pip install psutil)")
+
+    from bench_scale import synthetic_csv
+    from features import load_features
+    # Build the feature cache up front so neither run pays for it
+    n_rows = len(load_features(synthetic_csv(args.scale), impute=False))
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="shared_train_"))
+    rows, oof = [], {}
+    try:
+        for path in ("pickled", "shared"):
+            print(f"⏳ {path} ({args.folds} folds, {args.jobs} workers, {n_rows:,} rows)...")
+            oof_path = tmp_dir / f"{path}.npy"
+            cmd = [sys.executable, __file__, "--run", path, "--oof", oof_path,
+                   "--features", args.features, "--trees", str(args.trees), "--folds", str(args.folds),
+                   "--jobs", str(args.jobs), "--scale", str(args.scale)]
+            seconds, peak = run_measured(cmd, args.interval)
+            oof[path] = np.load(oof_path)
+            rows.append({"path": path, "rows": n_rows, "workers": args.jobs, "seconds": seconds, "peak_mb": peak})
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    table = pd.DataFrame(rows)
+    print("\n" + "=" * 40)
+    print(f"🧠 SHARED-MEMORY CV ({args.features}, {args.trees} trees, x{args.scale})")
+    print("=" * 40)
+    print(table.to_string(index=False, formatters={"seconds": "{:.1f}".format, "peak_mb": "{:,.0f}".format}))
+    print("-" * 40)
+    print(f"Peak memory: {table['peak_mb'].iloc[1] / table['peak_mb'].iloc[0]:.2f}x of the pickled path")
+    same = np.array_equal(oof["pickled"], oof["shared"])
+    print(f"{'✅' if same else '❌'} Out-of-fold predictions {'identical' if same else 'differ'}")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    table.assign(features=args.features, trees=args.trees, scale=args.scale).to_csv(RESULTS_PATH, index=False)
+    print(f"✅ Saved {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Out-of-core training for sales tables that do not fit in memory.
+
+The source (a CSV, a Parquet file, or a Parquet directory such as the
+data/store/ written by ingest.py) is streamed in chunks of --chunk-rows rows;
+at most one training partition is held in memory at a time.
+
+1. Statistics + shuffle pass: exact value counts of every numeric column
+   HousingFeatures imputes (the same running-median code as ingest.py), the
+   categories seen in each categorical column, and every row is spilled to
+   one of a few hundred random shard files (Parquet, under output/cache/).
+2. Training pass: shards are grouped into partitions of up to --chunk-rows
+   rows; each partition is transformed with the preprocessor built from the
+   statistics and fitted with its own sub-forest, with trees allocated in
+   proportion to the partition's rows.
+
+The shuffle matters: sources are usually ordered (melb_data.csv by suburb,
+the store by month and region), and a sub-forest that only sees one slice of
+the city generalises badly. --no-shuffle trains on the chunks in source order
+and skips the spill, for sources already in random order.
+
+The sub-forests are merged into one RandomForestRegressor and saved as the
+same Pipeline (preprocessor + model) that 7_final_optimization.py writes, so
+predict.py, serve.py, forest_engine.py and ingest.py use it unchanged (pass
+it with --model). It is written to output/models/stream_model.pkl, not over
+the production model. With a single partition and --no-shuffle the result is
+identical to an in-memory fit; the default shuffle permutes the rows, so the
+bootstrap samples, and with them the trees, differ.
+
+Only the forest backend can be merged this way; the nearby-sales (geo)
+features need every sale in one BallTree and are not supported.
+
+Usage:
+    python src/stream_train.py data/store --chunk-rows 500000 --trees 200   # -> output/models/stream_model.pkl
+    python src/stream_train.py history.csv --features full --output output/models/history_model.pkl
+"""
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sklearn.base import clone
+
+from ingest import merge_counts, median_from_counts
+from model import CATEGORICAL_FEATURES, FEATURE_SETS, GEO_FEATURES, build_pipeline, fit_from_levels, input_columns
+from paths import CACHE_DIR, MODEL_DIR, find_data_csv
+from predict import iter_chunks
+from profiling import span
+
+# Never the production model: promoting a streamed model is a deliberate copy (or --output)
+DEFAULT_OUTPUT = MODEL_DIR / "stream_model.pkl"
+TARGET = "Price"
+
+# Shards are sized at about half a partition so partitions are unions of whole shards;
+# every shard has a ParquetWriter open during the spill, hence the cap
+SHARDS_PER_PARTITION = 2
+MAX_SHARDS = 512
+
+
+# =========================
+# Streaming source
+# =========================
+def iter_partitions(source, columns, chunk_rows):
+    """
+    Yield DataFrames of at most chunk_rows rows with `columns` (plus Price)
+    from a CSV / Parquet file or a hive-partitioned Parquet directory. Rows
+    without a price are dropped and text columns come back as object dtype
+    with NaN for missing values, whatever the source format.
+    """
+    source = Path(source)
+    wanted = list(dict.fromkeys(list(columns) + [TARGET]))
+
+    if source.is_dir():
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+        present = [c for c in wanted if c in dataset.schema.names]
+        batches = (b.to_pandas() for b in dataset.to_batches(columns=present, batch_size=chunk_rows))
+    else:
+        batches = iter_chunks(source, wanted, chunk_rows)
+
+    # Dataset batches stop at file boundaries; regroup them into full chunks
+    pending, n_pending = [], 0
+    for batch in batches:
+        pending.append(batch)
+        n_pending += len(batch)
+        while n_pending >= chunk_rows:
+            merged = pd.concat(pending, ignore_index=True)
+            yield _clean(merged.iloc[:chunk_rows])
+            pending, n_pending = [merged.iloc[chunk_rows:]], n_pending - chunk_rows
+    if n_pending:
+        yield _clean(pd.concat(pending, ignore_index=True))
+
+
+def _clean(chunk):
+    chunk = chunk[pd.to_numeric(chunk[TARGET], errors="coerce").notna()].reset_index(drop=True)
+    for col in chunk.columns:
+        if isinstance(chunk[col].dtype, (pd.StringDtype, pd.CategoricalDtype)):
+            chunk[col] = chunk[col].astype(object).where(chunk[col].notna(), np.nan)
+    return chunk
+
+
+def estimate_rows(source):
+    """Row count of a Parquet source, or an estimate from the first MB of a CSV."""
+    source = Path(source)
+    if source.is_dir() or source.suffix == ".parquet":
+        return ds.dataset(source, format="parquet").count_rows()
+    with open(source, "rb") as f:
+        sample = f.read(1 << 20)
+    if not sample:
+        return 0
+    return int(os.path.getsize(source) * max(sample.count(b"\n") - 1, 1) / len(sample))
+
+
+# =========================
+# Statistics + shuffle pass
+# =========================
+def _num_transformer(preprocessor):
+    return next(t for name, t, _ in preprocessor.transformers if name == "num")
+
+
+class StreamStats:
+    """Value counts for the medians and category sets, updated one chunk at a time."""
+
+    def __init__(self, features, preprocessor):
+        self.num = _num_transformer(preprocessor)
+        _, self.layout = self.num._block(pd.DataFrame())
+        empty = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+        self.counts = {col: empty for col in self.layout}
+        categorical = [c for c in features if c in CATEGORICAL_FEATURES]
+        self.categories = {col: set() for col in categorical}
+        self.missing = {col: False for col in categorical}
+        self.rows = []   # rows per training partition
+
+    def update(self, chunk):
+        block, _ = self.num._block(chunk)
+        for j, col in enumerate(self.layout):
+            self.counts[col] = merge_counts(self.counts[col], block[:, j])
+        for col in self.categories:
+            values = chunk[col] if col in chunk.columns else pd.Series(np.nan, index=chunk.index)
+            self.categories[col].update(values.dropna().unique())
+            self.missing[col] |= bool(values.isna().any())
+
+    def medians(self):
+        """Medians in HousingFeatures layout (NaN -> 0, as in fit())."""
+        return np.nan_to_num(
+            np.array([median_from_counts(self.counts[col]) for col in self.layout]), nan=0.0
+        ).astype(np.float32)
+
+
+def _spill_schema(columns):
+    fields = []
+    for col in columns:
+        if col == "Date":
+            fields.append(pa.field(col, pa.timestamp("ns")))
+        elif col in CATEGORICAL_FEATURES:
+            fields.append(pa.field(col, pa.string()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+
+def _spill_frame(chunk, columns):
+    """`chunk` with the fixed shard schema, whatever types the source chunk inferred."""
+    chunk = chunk.reindex(columns=columns)
+    for col in columns:
+        if col == "Date":
+            if not pd.api.types.is_datetime64_any_dtype(chunk[col]):
+                chunk[col] = pd.to_datetime(chunk[col], dayfirst=True, errors="coerce")
+        elif col in CATEGORICAL_FEATURES:
+            chunk[col] = chunk[col].astype(object).where(chunk[col].notna(), None)
+        else:
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").astype(np.float64)
+    return chunk
+
+
+def spill_shards(source, stats, columns, chunk_rows, spill_dir, n_shards, rng):
+    """Stream `source` once: update `stats` and send every row to a random shard file."""
+    columns = list(dict.fromkeys(list(columns) + [TARGET]))
+    schema = _spill_schema(columns)
+    writers, shard_rows = {}, np.zeros(n_shards, dtype=np.int64)
+    try:
+        for chunk in iter_partitions(source, columns, chunk_rows):
+            stats.update(chunk)
+            table = pa.Table.from_pandas(_spill_frame(chunk, columns), schema=schema, preserve_index=False)
+            shard = rng.integers(0, n_shards, len(chunk))
+            order = np.argsort(shard, kind="stable")
+            bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+            for s in np.flatnonzero(np.diff(bounds)):
+                if s not in writers:
+                    writers[s] = pq.ParquetWriter(spill_dir / f"shard-{s:05d}.parquet", schema)
+                writers[s].write_table(table.take(order[bounds[s]:bounds[s + 1]]))
+                shard_rows[s] += bounds[s + 1] - bounds[s]
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return shard_rows
+
+
+def group_shards(shard_rows, chunk_rows):
+    """Consecutive non-empty shards packed into partitions of at most chunk_rows rows."""
+    groups, current, size = [], [], 0
+    for s, n in enumerate(shard_rows):
+        if not n:
+            continue
+        if current and size + n > chunk_rows:
+            groups.append(current)
+            current, size = [], 0
+        current.append(s)
+        size += n
+    if current:
+        groups.append(current)
+    return groups
+
+
+def fit_preprocessor(preprocessor, features, stats):
+    """
+    Fit the preprocessor as if on the whole table: the encoders see one row
+    per category, then the medians are replaced by the exact streamed ones.
+    """
+    levels = {
+        col: sorted(values) + ([np.nan] if stats.missing[col] or not values else [])
+        for col, values in stats.categories.items()
+    }
+    return fit_from_levels(preprocessor, features, levels, stats.medians())
+
+
+# =========================
+# Training pass
+# =========================
+def allocate_trees(rows, n_trees):
+    """Trees per partition, proportional to its rows (largest remainder, at least one each)."""
+    rows = np.asarray(rows, dtype=np.float64)
+    share = rows / rows.sum() * n_trees
+    trees = np.floor(share).astype(int)
+    trees[np.argsort(trees - share)[:n_trees - trees.sum()]] += 1
+    return np.maximum(trees, 1)
+
+
+def merge_forests(forests):
+    """One RandomForestRegressor holding the trees of every sub-forest (predictions = mean over all trees)."""
+    merged = forests[0]
+    for forest in forests[1:]:
+        merged.estimators_ += forest.estimators_
+    merged.n_estimators = len(merged.estimators_)
+    return merged
+
+
+def _fit_partitions(partitions, rows, preprocessor, template, columns, n_trees, random_state):
+    trees = allocate_trees(rows, n_trees)
+    print(f"📊 {sum(rows):,} sales in {len(trees)} partitions -> {trees.sum()} trees")
+
+    forests = []
+    for i, chunk in enumerate(partitions):
+        if i >= len(trees) or len(chunk) != rows[i]:
+            raise RuntimeError("The source changed between the statistics and training passes")
+        start = time.perf_counter()
+        with span("partition", rows=len(chunk), trees=int(trees[i])):
+            X = preprocessor.transform(chunk.reindex(columns=columns))
+            forest = clone(template).set_params(n_estimators=int(trees[i]), random_state=random_state + i)
+            forest.fit(X, chunk[TARGET].to_numpy(dtype=np.float64))
+        forests.append(forest)
+        print(f"🌲 Partition {i + 1}/{len(trees)}: {len(chunk):,} rows, {trees[i]} trees "
+              f"({time.perf_counter() - start:.1f}s)")
+        del chunk, X
+    if len(forests) != len(trees):
+        raise RuntimeError("The source changed between the statistics and training passes")
+    return merge_forests(forests)
+
+
+def train(source, features, n_trees=100, chunk_rows=200_000, n_jobs=-1, random_state=1, shuffle=True):
+    """Stream `source` and return a fitted forest Pipeline over `features`."""
+    if any(c in GEO_FEATURES for c in features):
+        raise ValueError("Nearby-sales features need every sale in one BallTree; use the slim or full set")
+    pipeline = build_pipeline(features, n_estimators=n_trees, random_state=random_state,
+                              backend="forest", n_jobs=n_jobs)
+    preprocessor, template = pipeline.named_steps["preprocessor"], pipeline.named_steps["model"]
+    columns = input_columns(features)
+    stats = StreamStats(features, preprocessor)
+
+    if not shuffle:
+        with span("stats_pass", chunk_rows=chunk_rows):
+            for chunk in iter_partitions(source, columns, chunk_rows):
+                stats.rows.append(len(chunk))
+                stats.update(chunk)
+        if not stats.rows:
+            raise ValueError(f"No priced sales in {source}")
+        fit_preprocessor(preprocessor, features, stats)
+        model = _fit_partitions(iter_partitions(source, columns, chunk_rows), stats.rows,
+                                preprocessor, template, columns, n_trees, random_state)
+        return pipeline.set_params(model=model)
+
+    n_shards = min(MAX_SHARDS, max(1, math.ceil(SHARDS_PER_PARTITION * estimate_rows(source) / chunk_rows)))
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    spill_dir = Path(tempfile.mkdtemp(prefix="stream_train_", dir=CACHE_DIR))
+    try:
+        with span("stats_pass", chunk_rows=chunk_rows, shards=n_shards):
+            shard_rows = spill_shards(source, stats, columns, chunk_rows, spill_dir,
+                                      n_shards, np.random.default_rng(random_state))
+        groups = group_shards(shard_rows, chunk_rows)
+        if not groups:
+            raise ValueError(f"No priced sales in {source}")
+        stats.rows = [int(shard_rows[g].sum()) for g in groups]
+        if max(stats.rows) > chunk_rows:
+            print(f"⚠️ {MAX_SHARDS} shards cannot split {sum(stats.rows):,} rows into partitions of "
+                  f"{chunk_rows:,}; the largest has {max(stats.rows):,} (raise --chunk-rows)")
+        fit_preprocessor(preprocessor, features, stats)
+
+        partitions = (
+            _clean(pd.concat([pq.read_table(spill_dir / f"shard-{s:05d}.parquet").to_pandas() for s in g],
+                             ignore_index=True))
+            for g in groups
+        )
+        model = _fit_partitions(partitions, stats.rows, preprocessor, template, columns, n_trees, random_state)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return pipeline.set_params(model=model)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the forest Pipeline by streaming the sales table.")
+    parser.add_argument("source", type=Path, nargs="?", default=None,
+                        help="CSV, Parquet file or Parquet directory (default: melb_data.csv)")
+    parser.add_argument("--features", choices=["slim", "full"], default="slim")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--chunk-rows", type=int, default=200_000,
+                        help="Rows per training partition (one in memory at a time)")
+    parser.add_argument("--no-shuffle", action="store_true",
+                        help="Train on chunks in source order (only if the source is already shuffled)")
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT,
+                        help="Where to save the Pipeline (default output/models/stream_model.pkl)")
+    args = parser.parse_args(argv)
+
+    source = args.source or find_data_csv()
+    start = time.perf_counter()
+    with span("stream_train", source=str(source)):
+        pipeline = train(source, FEATURE_SETS[args.features], args.trees, args.chunk_rows, args.jobs,
+                         shuffle=not args.no_shuffle)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = args.output.with_suffix(f".tmp{os.getpid()}")
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, args.output)
+    print(f"✅ Model saved to {args.output} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Cross-validation harness shared by the validation and optimisation scripts.
+
+Each fold is fitted exactly once; R², MAE and the out-of-fold predictions all
+come from that single fit. Folds run in parallel (joblib) and each fitted fold
+is cached on disk, keyed by the data hash, the pipeline parameters and the fold
+indices, so re-running a script with nothing changed costs no fits at all.
+
+The cache is capped at CV_CACHE_MAX_MB (environment variable, default 2000):
+after every cross_validate() the least recently used folds are deleted until
+it fits, never those of the current run.
+"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from paths import CACHE_DIR
+from profiling import span
+
+CV_CACHE_DIR = CACHE_DIR / "cv"
+CV_CACHE_MAX_BYTES = int(float(os.environ.get("CV_CACHE_MAX_MB", 2000)) * 1e6)
+
+
+@dataclass
+class CVResult:
+    r2: np.ndarray               # per fold
+    mae: np.ndarray              # per fold
+    oof_pred: np.ndarray         # out-of-fold prediction for every row
+    fit_seconds: np.ndarray      # per fold (time of the original fit, even if cached)
+    fold_paths: list = field(default_factory=list)  # cached fold artifacts, in fold order
+    n_cached: int = 0
+
+    def load_fold(self, i):
+        """Fitted pipeline and test indices of fold i."""
+        return joblib.load(self.fold_paths[i]), self.test_idx(i)
+
+    def test_idx(self, i):
+        """Test indices of fold i (without loading the fitted pipeline)."""
+        return joblib.load(_meta_path(self.fold_paths[i]))["test_idx"]
+
+
+def data_hash(X, y):
+    """
+    Hash of the contents of (X, y): column names, dtypes and values. Equal
+    data gives equal keys whatever its memory layout (copies, views, frames
+    read back from the Feather cache).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([[str(c) for c in X.columns], [str(t) for t in X.dtypes]]).encode())
+    h.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    y = pd.Series(np.asarray(y))
+    h.update(str(y.dtype).encode())
+    h.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def fold_key(data_key, pipeline, train_idx, test_idx):
+    return joblib.hash((data_key, pipeline.get_params(deep=True), train_idx, test_idx))
+
+
+def _meta_path(path):
+    return path.with_suffix(".meta.joblib")
+
+
+def _dump_atomic(obj, path):
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def cached_meta(path):
+    """Predictions file of a complete cached fold (marked as just used), or None."""
+    meta_path = _meta_path(path)
+    if not (meta_path.exists() and path.exists()):
+        return None
+    for p in (path, meta_path):
+        os.utime(p)
+    return joblib.load(meta_path)
+
+
+def prune_cache(cache_dir, max_bytes=CV_CACHE_MAX_BYTES, keep=()):
+    """Delete the least recently used folds until cache_dir holds at most max_bytes; returns the count."""
+    keep = {p.name for p in keep}
+    folds = []
+    for path in cache_dir.glob("fold_*.joblib"):
+        if path.name.endswith(".meta.joblib"):
+            continue
+        files = [p for p in (path, _meta_path(path)) if p.exists()]
+        folds.append((max(p.stat().st_mtime for p in files), sum(p.stat().st_size for p in files), path, files))
+
+    total, removed = sum(size for _, size, _, _ in folds), 0
+    for _, size, path, files in sorted(folds, key=lambda f: f[0]):
+        if total <= max_bytes:
+            break
+        if path.name in keep:
+            continue
+        for p in files:
+            p.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _fit_fold(pipeline, X, y, train_idx, test_idx, path):
+    """
+    Fit (or load) one fold; only the small metrics travel back to the parent.
+
+    The fitted pipeline and the fold's predictions are stored separately so a
+    cache hit only reads the (small) predictions file.
+    """
+    meta_path = _meta_path(path)
+    meta = cached_meta(path)
+    if meta is not None:
+        return meta["pred"], meta["fit_seconds"], True
+
+    model = clone(pipeline)
+    start = time.perf_counter()
+    with span("fit", rows=len(train_idx)):
+        model.fit(X.iloc[train_idx], y.iloc[train_idx])
+    fit_seconds = time.perf_counter() - start
+    with span("predict", rows=len(test_idx)):
+        pred = model.predict(X.iloc[test_idx])
+
+    # Model first: the meta file is what marks the fold as complete
+    _dump_atomic(model, path)
+    _dump_atomic({"test_idx": test_idx, "pred": pred, "fit_seconds": fit_seconds}, meta_path)
+    return pred, fit_seconds, False
+
+
+def cross_validate(pipeline, X, y, cv, n_jobs=-1, cache_dir=CV_CACHE_DIR, shared=False):
+    """
+    Fit each fold of `cv` once and return per-fold R²/MAE plus out-of-fold
+    predictions. Equivalent to cross_val_score(r2) + cross_val_score(MAE) +
+    cross_val_predict on the same splits, at a third of the cost (or none
+    when the folds are cached).
+
+    shared=True encodes X once into shared memory for every fold worker
+    instead of pickling it to each (forest pipelines; see shared_train.py).
+    The fitted folds and the cache are the same either way.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    data_key = data_hash(X, y)
+    splits = list(cv.split(X, y))
+    paths = [cache_dir / f"fold_{fold_key(data_key, pipeline, tr, te)}.joblib" for tr, te in splits]
+
+    with span("cross_validate", folds=len(splits), shared=shared) as record:
+        if all(_meta_path(p).exists() and p.exists() for p in paths):
+            # Nothing to fit: read the predictions here, without workers or a shared design
+            results = [_fit_fold(pipeline, X, y, tr, te, path) for (tr, te), path in zip(splits, paths)]
+        elif shared:
+            # Imported here: shared_train builds on this module
+            from shared_train import SharedDesign, fit_fold_shared
+            with SharedDesign(pipeline, X, y) as design:
+                results = Parallel(n_jobs=n_jobs)(
+                    delayed(fit_fold_shared)(pipeline, design.spec, tr, te, path)
+                    for (tr, te), path in zip(splits, paths)
+                )
+        else:
+            results = Parallel(n_jobs=n_jobs)(
+                delayed(_fit_fold)(pipeline, X, y, tr, te, path)
+                for (tr, te), path in zip(splits, paths)
+            )
+        record["cached"] = sum(cached for _, _, cached in results)
+        record["pruned"] = prune_cache(cache_dir, keep=paths)
+
+    y_true = np.asarray(y)
+    oof_pred = np.full(len(y_true), np.nan)
+    r2, mae, fit_seconds = [], [], []
+    for (_, te), (pred, seconds, _) in zip(splits, results):
+        oof_pred[te] = pred
+        r2.append(r2_score(y_true[te], pred))
+        mae.append(mean_absolute_error(y_true[te], pred))
+        fit_seconds.append(seconds)
+
+    return CVResult(
+        r2=np.array(r2),
+        mae=np.array(mae),
+        oof_pred=oof_pred,
+        fit_seconds=np.array(fit_seconds),
+        fold_paths=paths,
+        n_cached=sum(cached for _, _, cached in results),
+    )